@@ -0,0 +1,86 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from vpcctl import kernel, utils
+from vpcctl.utils import run_command
+
+BRIDGE = "bench-br0"
+
+def configure_subprocess(index):
+    address = f"10.255.{index % 256}.1/24"
+    run_command(f"ip addr add {address} dev {BRIDGE}")
+    run_command(f"ip route add 10.254.{index % 256}.0/24 dev {BRIDGE}")
+    run_command(f"ip route del 10.254.{index % 256}.0/24")
+    run_command(f"ip addr del {address} dev {BRIDGE}")
+    run_command(f"ip link set {BRIDGE} up")
+
+def configure_batch(batch_factory, index):
+    address = f"10.255.{index % 256}.1/24"
+    with batch_factory() as link:
+        link.add_addr(address, BRIDGE)
+        link.add_route(f"10.254.{index % 256}.0/24", dev=BRIDGE)
+        link.del_route(f"10.254.{index % 256}.0/24")
+        link.del_addr(address, BRIDGE)
+        link.set_up(BRIDGE)
+
+def lifecycle_subprocess(index):
+    run_command(f"ip link add bench-lc{index} type bridge")
+    run_command(f"ip link del bench-lc{index}")
+
+def lifecycle_batch(batch_factory, index):
+    with batch_factory() as link:
+        link.add_bridge(f"bench-lc{index}")
+    with batch_factory() as link:
+        link.del_link(f"bench-lc{index}")
+
+def measure(name, func, rounds, operations_per_round):
+    start = time.perf_counter()
+    commands_before = utils.command_count
+    for index in range(rounds):
+        func(index)
+    elapsed = time.perf_counter() - start
+    operations = rounds * operations_per_round
+    subprocesses = utils.command_count - commands_before
+    print(f"{name:<24} {operations / elapsed:>10.0f} ops/s {elapsed:>9.3f} s {subprocesses:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare kernel backend throughput (requires root)")
+    parser.add_argument('--rounds', type=int, default=500, help='Address/route configuration rounds per backend')
+    parser.add_argument('--lifecycle-rounds', type=int, default=50, help='Link create/delete rounds per backend')
+    args = parser.parse_args()
+
+    utils.check_root()
+
+    backends = [("subprocess", None), ("ip-batch", kernel.IpBatch)]
+    if kernel.use_netlink():
+        backends.append(("netlink", kernel.NetlinkBatch))
+    else:
+        print("netlink backend unavailable on this host")
+
+    with kernel.batch() as link:
+        link.add_bridge(BRIDGE)
+        link.set_up(BRIDGE)
+
+    try:
+        print(f"{'Scenario':<24} {'Throughput':>16} {'Time':>11} {'Forks':>8}")
+        print("-" * 64)
+        for name, factory in backends:
+            if factory is None:
+                measure(f"configure/{name}", configure_subprocess, args.rounds, 5)
+            else:
+                measure(f"configure/{name}", lambda i, f=factory: configure_batch(f, i), args.rounds, 5)
+        for name, factory in backends:
+            if factory is None:
+                measure(f"lifecycle/{name}", lifecycle_subprocess, args.lifecycle_rounds, 2)
+            else:
+                measure(f"lifecycle/{name}", lambda i, f=factory: lifecycle_batch(f, i), args.lifecycle_rounds, 2)
+    finally:
+        with kernel.batch(check=False) as link:
+            link.del_link(BRIDGE)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import ipaddress
+import json
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from vpcctl import utils, state, vpc, subnet, peering, stats
+from vpcctl.netns import run_in_namespace
+
+VPCS = [("bench-bc1", "10.251.0.0/16"), ("bench-bc2", "10.252.0.0/16")]
+DISCARD_PORT = 9
+
+def build(mode, subnets):
+    for name, cidr in VPCS:
+        if not vpc.create_vpc(name, cidr):
+            raise RuntimeError(f"could not create {name}")
+        network = ipaddress.IPv4Network(cidr)
+        for index, block in enumerate(network.subnets(new_prefix=24)):
+            if index == subnets:
+                break
+            subnet.create_subnet(name, f"s{index}", str(block), "private")
+    if not peering.create_peering(VPCS[0][0], VPCS[1][0], mode=mode):
+        raise RuntimeError(f"could not create a {mode} peering")
+
+def teardown():
+    for name, _ in VPCS:
+        vpc.delete_vpc(name, cascade=True)
+
+def _broadcast_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    return sock
+
+def flood(source, packets, unknown):
+    network = ipaddress.IPv4Network(source['cidr'])
+    sock = run_in_namespace(source['namespace'], _broadcast_socket)
+    with sock:
+        for _ in range(packets):
+            sock.sendto(b"vpcctl-broadcast", (str(network.broadcast_address), DISCARD_PORT))
+        hosts = list(network.hosts())
+        for host in hosts[len(hosts) - unknown:]:
+            try:
+                sock.sendto(b"vpcctl-arp", (str(host), DISCARD_PORT))
+            except OSError:
+                pass
+
+def port_packets(ports):
+    total = 0
+    for port in ports:
+        counters = stats.read_interface_counters(port)
+        if counters:
+            total += counters['tx_packets']
+    return total
+
+def learned_fdb_entries(bridge):
+    result = utils.run_command(f"bridge fdb show br {bridge}", check=False)
+    return sum(1 for line in result.stdout.splitlines() if "permanent" not in line and "self" not in line)
+
+def measure(mode, subnets, packets, unknown, settle):
+    build(mode, subnets)
+    try:
+        time.sleep(settle)
+        sources = state.get_vpc(VPCS[0][0])['subnets']
+        peer = state.get_vpc(VPCS[1][0])
+        peer_ports = [s['veth_br'] for s in peer['subnets']]
+
+        before = port_packets(peer_ports)
+        for source in sources:
+            flood(source, packets, unknown)
+        time.sleep(settle)
+        after = port_packets(peer_ports)
+
+        sent = len(sources) * packets
+        return {
+            "mode": mode,
+            "broadcasts_sent": sent,
+            "unknown_destinations": len(sources) * unknown,
+            "packets_into_peer_vpc": after - before,
+            "peer_ports": len(peer_ports),
+            "peer_fdb_entries": learned_fdb_entries(peer['bridge'])
+        }
+    finally:
+        teardown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure broadcast traffic crossing a peering in routed and bridged mode (requires root)")
+    parser.add_argument('--subnets', type=int, default=4, help='Subnets per VPC')
+    parser.add_argument('--packets', type=int, default=100, help='Broadcast datagrams sent from each subnet')
+    parser.add_argument('--unknown', type=int, default=8, help='Unused addresses per subnet to trigger ARP requests for')
+    parser.add_argument('--settle', type=float, default=1.0, help='Seconds to wait before and after the flood')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    utils.check_root()
+    utils.logger.setLevel("WARNING")
+
+    results = []
+    with state.deferred_writes():
+        for mode in peering.PEERING_MODES:
+            results.append(measure(mode, args.subnets, args.packets, args.unknown, args.settle))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'Mode':<10} {'Sent':>7} {'ARP targets':>12} {'Into peer VPC':>14} {'Per port':>9} {'Peer FDB':>9}")
+    print("-" * 66)
+    for r in results:
+        per_port = r['packets_into_peer_vpc'] / r['peer_ports'] if r['peer_ports'] else 0
+        print(f"{r['mode']:<10} {r['broadcasts_sent']:>7} {r['unknown_destinations']:>12} "
+              f"{r['packets_into_peer_vpc']:>14} {per_port:>9.1f} {r['peer_fdb_entries']:>9}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from vpcctl import utils, state, kernel
+from vpcctl import vpc, subnet, routing, peering, firewall, egress
+
+BASELINE = Path(__file__).with_name("baseline.json")
+POLICY = Path(__file__).resolve().parent.parent / "policies" / "example-policy.json"
+DEFAULT_WORKDIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+VPC_SIZES = [1, 10, 100, 1000]
+SUBNET_SIZES = [1, 10, 100, 500]
+QUICK_VPC_SIZES = [1, 10, 100]
+QUICK_SUBNET_SIZES = [1, 10, 100]
+
+COUNTERS = ("subprocesses", "state_reads", "state_writes")
+BYTE_COUNTERS = ("bytes_read", "bytes_written")
+
+class FakeRunner:
+    def __init__(self):
+        self.commands = []
+        self.sysctls = {}
+        self.patched = []
+
+    def run_command(self, cmd, check=True, input=None):
+        utils.command_count += 1
+        self.commands.append(cmd)
+        returncode = 0
+        stdout = ""
+        if cmd == "ip route show default":
+            stdout = "default via 192.0.2.1 dev eth0 proto static\n"
+        elif " -C " in cmd:
+            returncode = 1
+        return subprocess.CompletedProcess(cmd, returncode, stdout, "")
+
+    def write_sysctl(self, key, value):
+        self.sysctls[key] = str(value)
+
+    def read_sysctl(self, key):
+        return self.sysctls.get(key, "0")
+
+    def install(self):
+        replacements = {
+            'run_command': self.run_command,
+            'write_sysctl': self.write_sysctl,
+            'read_sysctl': self.read_sysctl
+        }
+        originals = {name: getattr(utils, name) for name in replacements}
+        for module_name, module in list(sys.modules.items()):
+            if not module_name.startswith("vpcctl"):
+                continue
+            for name, fake in replacements.items():
+                if getattr(module, name, None) is originals[name]:
+                    self.patched.append((module, name, originals[name]))
+                    setattr(module, name, fake)
+
+        self.network_backend = utils.NETWORK_BACKEND
+        utils.NETWORK_BACKEND = "ip"
+        kernel._netlink_available = None
+
+    def uninstall(self):
+        for module, name, original in self.patched:
+            setattr(module, name, original)
+        self.patched = []
+        utils.NETWORK_BACKEND = self.network_backend
+        kernel._netlink_available = None
+
+class Environment:
+    def __init__(self, real=False, workdir=None):
+        self.real = real
+        self.workdir = workdir
+        self.runner = None if real else FakeRunner()
+        self.saved = {}
+
+    def __enter__(self):
+        self.directory = Path(tempfile.mkdtemp(prefix="vpcctl-bench-", dir=self.workdir))
+        for name in ('STATE_DIR', 'STATE_FILE', 'STATE_DB', 'LOCK_DIR'):
+            self.saved[name] = getattr(utils, name)
+        utils.STATE_DIR = self.directory
+        utils.STATE_FILE = self.directory / "vpcs.json"
+        utils.STATE_DB = self.directory / "vpcs.db"
+        utils.LOCK_DIR = self.directory / "locks"
+        state._store = None
+        if self.runner:
+            self.runner.install()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.real:
+            teardown_real()
+        if self.runner:
+            self.runner.uninstall()
+        for name, value in self.saved.items():
+            setattr(utils, name, value)
+        state._store = None
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return False
+
+def teardown_real():
+    with state.deferred_writes():
+        for v in list(state.load_state()['vpcs']):
+            for p in list(v.get('peerings', [])):
+                peering.delete_peering(p['vpc1'], p['vpc2'])
+        for v in list(state.load_state()['vpcs']):
+            for s in list(v.get('subnets', [])):
+                subnet.delete_subnet(v['name'], s['name'])
+            vpc.delete_vpc(v['name'])
+
+def snapshot():
+    return {
+        "subprocesses": utils.command_count,
+        "state_reads": state.io_stats['reads'],
+        "state_writes": state.io_stats['writes'],
+        "bytes_read": state.io_stats['bytes_read'],
+        "bytes_written": state.io_stats['bytes_written']
+    }
+
+class Recorder:
+    def __init__(self, warm=False):
+        self.warm = warm
+        self.samples = {}
+
+    def measure(self, name, func, *args):
+        if not self.warm:
+            state._store = None
+        before = snapshot()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args)
+        elapsed = time.perf_counter() - start
+        after = snapshot()
+
+        if result is False:
+            raise RuntimeError(f"{name}{args} failed during benchmark")
+
+        sample = {key: after[key] - before[key] for key in before}
+        sample['ms'] = elapsed * 1000
+        self.samples.setdefault(name, []).append(sample)
+        return result
+
+    def summary(self):
+        return {name: {key: sum(s[key] for s in samples) / len(samples) for key in samples[0]}
+                for name, samples in self.samples.items()}
+
+def indexed_cidr(index):
+    return f"10.{index // 256}.{index % 256}.0/24"
+
+def build_vpcs(count):
+    with state.deferred_writes():
+        for index in range(count):
+            name = f"b{index:03d}"
+            cidr = indexed_cidr(index)
+            vpc.create_vpc(name, cidr)
+            subnet.create_subnet(name, "s000", cidr.replace(".0/24", ".0/25"), "public")
+
+def vpc_scenario(size, samples, recorder):
+    build_vpcs(size)
+
+    for sample in range(samples):
+        name = f"x{sample:03d}"
+        cidr = f"172.16.{sample}.0/24"
+        subnet_cidr = f"172.16.{sample}.0/25"
+
+        recorder.measure("create-vpc", vpc.create_vpc, name, cidr)
+        recorder.measure("create-subnet", subnet.create_subnet, name, "s000", subnet_cidr, "public")
+        recorder.measure("setup-nat", routing.setup_nat, name, egress.cached_uplink())
+        recorder.measure("add-inter-subnet-routes", routing.add_inter_subnet_routes, name, "s000")
+        recorder.measure("create-peering", peering.create_peering, name, "b000")
+        recorder.measure("apply-policy", firewall.apply_policy, name, "s000", POLICY)
+        recorder.measure("clear-policy", firewall.clear_policy, name, "s000")
+        recorder.measure("list-vpcs", vpc.list_vpcs)
+        recorder.measure("delete-peering", peering.delete_peering, name, "b000")
+        recorder.measure("delete-subnet", subnet.delete_subnet, name, "s000")
+        recorder.measure("delete-vpc", vpc.delete_vpc, name)
+
+def subnet_scenario(size, samples, recorder):
+    with state.deferred_writes():
+        vpc.create_vpc("big", "10.0.0.0/8")
+        vpc.create_vpc("peer", "172.31.0.0/16")
+        subnet.create_subnet("peer", "s000", "172.31.0.0/24", "private")
+        for index in range(size):
+            subnet_type = "public" if index % 2 == 0 else "private"
+            subnet.create_subnet("big", f"s{index:03d}", indexed_cidr(index), subnet_type)
+
+    for sample in range(samples):
+        name = f"x{sample:03d}"
+        cidr = indexed_cidr(1000 + sample)
+
+        recorder.measure("create-subnet", subnet.create_subnet, "big", name, cidr, "private")
+        recorder.measure("setup-private-subnet-routing", routing.setup_private_subnet_routing, "big", name)
+        recorder.measure("apply-policy", firewall.apply_policy, "big", name, POLICY)
+        recorder.measure("clear-policy", firewall.clear_policy, "big", name)
+        recorder.measure("list-subnets", subnet.list_subnets, "big")
+        recorder.measure("create-peering", peering.create_peering, "big", "peer")
+        recorder.measure("delete-peering", peering.delete_peering, "big", "peer")
+        recorder.measure("delete-subnet", subnet.delete_subnet, "big", name)
+
+SCENARIOS = {
+    "vpcs": vpc_scenario,
+    "subnets": subnet_scenario
+}
+
+def run(args):
+    vpc_sizes = QUICK_VPC_SIZES if args.quick else VPC_SIZES
+    subnet_sizes = QUICK_SUBNET_SIZES if args.quick else SUBNET_SIZES
+    if args.real:
+        vpc_sizes = [size for size in vpc_sizes if size <= args.max_real]
+        subnet_sizes = [size for size in subnet_sizes if size <= args.max_real]
+    sizes = {"vpcs": vpc_sizes, "subnets": subnet_sizes}
+
+    results = {
+        "mode": "real" if args.real else "fake",
+        "state": "warm" if args.warm else "cold",
+        "scenarios": {}
+    }
+
+    for scenario, func in SCENARIOS.items():
+        curves = {}
+        for size in sizes[scenario]:
+            with Environment(real=args.real, workdir=args.workdir):
+                recorder = Recorder(warm=args.warm)
+                func(size, args.samples, recorder)
+                for op, metrics in recorder.summary().items():
+                    curves.setdefault(op, {})[str(size)] = {key: round(value, 3) for key, value in metrics.items()}
+            print(f"  {scenario}={size} done", file=sys.stderr)
+        results["scenarios"][scenario] = curves
+
+    return results
+
+def report(results):
+    for scenario, curves in results["scenarios"].items():
+        sizes = list(next(iter(curves.values())).keys())
+        print(f"\nScaling with number of {scenario} ({results['mode']} runner, {results['state']} state)")
+        header = f"{'Operation':<30}" + "".join(f"{size:>18}" for size in sizes)
+        print(header)
+        print("-" * len(header))
+        for op, points in curves.items():
+            cells = "".join(f"{points[size]['ms']:>8.2f}ms/{points[size]['subprocesses']:>4.0f}f/{points[size]['state_reads']:>2.0f}r"
+                            for size in sizes)
+            print(f"{op:<30}{cells}")
+    print("\nCells: wall time per operation / subprocesses / state reads")
+
+def compare(results, baseline, check_time=False):
+    failures = []
+    for scenario, curves in baseline["scenarios"].items():
+        for op, points in curves.items():
+            for size, expected in points.items():
+                actual = results["scenarios"].get(scenario, {}).get(op, {}).get(size)
+                if actual is None:
+                    continue
+                for key in COUNTERS:
+                    if actual[key] > expected[key] * 1.1 + 0.5:
+                        failures.append(f"{scenario}/{op}@{size}: {key} {actual[key]} > baseline {expected[key]}")
+                for key in BYTE_COUNTERS:
+                    if actual[key] > expected[key] * 1.25 + 256:
+                        failures.append(f"{scenario}/{op}@{size}: {key} {actual[key]:.0f} > baseline {expected[key]:.0f}")
+
+            if check_time:
+                sizes = [size for size in points if size in results["scenarios"][scenario].get(op, {})]
+                if len(sizes) < 2:
+                    continue
+                first, last = sizes[0], sizes[-1]
+                actual_points = results["scenarios"][scenario][op]
+                expected_growth = points[last]['ms'] / max(points[first]['ms'], 1e-3)
+                actual_growth = actual_points[last]['ms'] / max(actual_points[first]['ms'], 1e-3)
+                if actual_growth > expected_growth * 3:
+                    failures.append(f"{scenario}/{op}: time grows {actual_growth:.1f}x from {first} to {last}, "
+                                    f"baseline {expected_growth:.1f}x")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure vpcctl control-plane cost per operation")
+    parser.add_argument('--quick', action='store_true', help='Stop at 100 VPCs and 100 subnets')
+    parser.add_argument('--samples', type=int, default=3, help='Measured operations per data point')
+    parser.add_argument('--warm', action='store_true', help='Keep the state cache between operations (daemon mode)')
+    parser.add_argument('--real', action='store_true', help='Run against real namespaces and bridges (requires root)')
+    parser.add_argument('--max-real', type=int, default=10, help='Largest size to build in --real mode')
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR, help='Directory for the throwaway state (default: /dev/shm)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--check', nargs='?', const=str(BASELINE), help='Fail if counters regress against a baseline')
+    parser.add_argument('--check-time', action='store_true', help='Also fail when time grows much faster than the baseline')
+    parser.add_argument('--update-baseline', action='store_true', help=f'Overwrite {BASELINE.name} with this run')
+    args = parser.parse_args()
+
+    if args.real:
+        utils.check_root()
+
+    utils.logger.setLevel('WARNING')
+    results = run(args)
+    report(results)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.update_baseline:
+        BASELINE.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nBaseline written to {BASELINE}")
+
+    if args.check:
+        baseline = json.loads(Path(args.check).read_text())
+        failures = compare(results, baseline, args.check_time)
+        if failures:
+            print(f"\n{len(failures)} regression(s) against {args.check}:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.check}")
+
+if __name__ == '__main__':
+    main()
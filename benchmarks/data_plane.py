@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from vpcctl import utils, state, vpc, subnet, perf, profiles
+
+VPC_NAME = "bench-dp"
+VPC_CIDR = "10.250.0.0/16"
+
+def endpoints():
+    return [perf.resolve_endpoint(f"{VPC_NAME}/{name}") for name in ("src", "dst")]
+
+def build(profile):
+    if not vpc.create_vpc(VPC_NAME, VPC_CIDR, perf_profile=profile):
+        raise RuntimeError(f"could not create {VPC_NAME}")
+    subnet.create_subnet(VPC_NAME, "src", "10.250.1.0/24", "private")
+    subnet.create_subnet(VPC_NAME, "dst", "10.250.2.0/24", "private")
+
+def teardown():
+    vpc.delete_vpc(VPC_NAME, cascade=True)
+
+def run_profile(profile, duration, rounds, in_place):
+    results = []
+    for _ in range(rounds):
+        src, dst = endpoints()
+        results.append(perf.measure(src, dst, duration=duration))
+
+    best = max(results, key=lambda r: r['throughput']['gbit_per_second'])
+    return {
+        "profile": profile,
+        "mode": "in-place" if in_place else "created",
+        "gbit_per_second": best['throughput']['gbit_per_second'],
+        "latency_us": best['request_response']['latency_us'],
+        "cpu_seconds_per_gb": best['cpu']['seconds_per_gb']
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare data-plane perf profiles on an intra-VPC path (requires root)")
+    parser.add_argument('--duration', type=float, default=3.0, help='Seconds per throughput run')
+    parser.add_argument('--rounds', type=int, default=3, help='Runs per profile, the best one is reported')
+    parser.add_argument('--in-place', action='store_true', help='Switch profiles with set-perf-profile instead of recreating the VPC')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    utils.check_root()
+    utils.logger.setLevel("WARNING")
+
+    results = []
+    with state.deferred_writes():
+        try:
+            if args.in_place:
+                build(profiles.DEFAULT_PROFILE)
+            for profile in profiles.PROFILES:
+                if args.in_place:
+                    profiles.set_perf_profile(VPC_NAME, profile)
+                else:
+                    build(profile)
+                try:
+                    results.append(run_profile(profile, args.duration, args.rounds, args.in_place))
+                finally:
+                    if not args.in_place:
+                        teardown()
+        finally:
+            if args.in_place:
+                teardown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'Profile':<14} {'Gbit/s':>9} {'p50 us':>9} {'p99 us':>9} {'CPU s/GB':>10}")
+    print("-" * 55)
+    for r in results:
+        cpu = f"{r['cpu_seconds_per_gb']:.3f}" if r['cpu_seconds_per_gb'] else "n/a"
+        print(f"{r['profile']:<14} {r['gbit_per_second']:>9.2f} {r['latency_us']['p50']:>9.1f} "
+              f"{r['latency_us']['p99']:>9.1f} {cpu:>10}")
+
+if __name__ == '__main__':
+    main()
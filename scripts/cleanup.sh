@@ -17,31 +17,54 @@ if [ "$confirm" != "yes" ]; then
     exit 0
 fi
 
-echo -e "\n[1/6] Deleting network namespaces..."
+echo -e "\n[1/7] Deleting network namespaces..."
 for ns in $(ip netns list 2>/dev/null | awk '{print $1}'); do
     if [[ "$ns" == vpc* ]]; then
         ip netns del "$ns" 2>/dev/null && echo "  Deleted namespace: $ns" || true
     fi
 done
 
-echo -e "\n[2/6] Deleting bridges..."
-for bridge in $(ip link show type bridge 2>/dev/null | grep -oP 'br-\S+'); do
-    ip link del "$bridge" 2>/dev/null && echo "  Deleted bridge: $bridge" || true
+echo -e "\n[2/7] Deleting bridges..."
+for link in /sys/class/net/br-*; do
+    bridge=$(basename "$link")
+    if [ "$(cat "$link/ifalias" 2>/dev/null)" = "vpcctl" ]; then
+        ip link del "$bridge" 2>/dev/null && echo "  Deleted bridge: $bridge" || true
+    fi
+done
+
+echo -e "\n[3/7] Deleting veth pairs..."
+for link in /sys/class/net/vb-* /sys/class/net/vp-*; do
+    veth=$(basename "$link")
+    if [ "$(cat "$link/ifalias" 2>/dev/null)" = "vpcctl" ]; then
+        ip link del "$veth" 2>/dev/null && echo "  Deleted veth: $veth" || true
+    fi
 done
 
-echo -e "\n[3/6] Deleting veth pairs..."
-for veth in $(ip link show 2>/dev/null | grep -oP 'v[bn]-\S+'); do
-    ip link del "$veth" 2>/dev/null && echo "  Deleted veth: $veth" || true
+echo -e "\n[4/7] Removing vpcctl iptables chains..."
+for table in filter nat; do
+    iptables -w -t "$table" -S 2>/dev/null | grep -E '^-A (FORWARD|POSTROUTING) .*-j VPCCTL-' | while read -r rule; do
+        iptables -w -t "$table" ${rule/-A/-D} 2>/dev/null || true
+    done
+    for chain in $(iptables -w -t "$table" -S 2>/dev/null | awk '/^-N VPCCTL-/ {print $2}'); do
+        iptables -w -t "$table" -F "$chain" 2>/dev/null
+        iptables -w -t "$table" -X "$chain" 2>/dev/null && echo "  Deleted chain: $table/$chain" || true
+    done
+done
+iptables -w -D FORWARD -o br-+ -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT 2>/dev/null || true
+iptables -w -t raw -S PREROUTING 2>/dev/null | grep -E '^-A PREROUTING -i br-\S+ -j CT --zone-orig ' | while read -r rule; do
+    iptables -w -t raw ${rule/-A/-D} 2>/dev/null && echo "  Deleted conntrack zone rule: ${rule#-A PREROUTING }" || true
 done
 
-echo -e "\n[4/6] Flushing iptables NAT rules..."
-iptables -t nat -F 2>/dev/null && echo "  NAT rules flushed" || true
+echo -e "\n[5/7] Destroying vpcctl ipsets..."
+for set in $(ipset list -n 2>/dev/null | grep '^vpcctl-'); do
+    ipset destroy "$set" 2>/dev/null && echo "  Deleted ipset: $set" || true
+done
 
-echo -e "\n[5/6] Flushing iptables FORWARD rules..."
-iptables -F FORWARD 2>/dev/null && echo "  FORWARD rules flushed" || true
+echo -e "\n[6/7] Removing vpcctl nftables table..."
+nft delete table ip vpcctl 2>/dev/null && echo "  nftables table deleted" || true
 
-echo -e "\n[6/6] Clearing state file..."
-rm -f ~/.vpcctl/vpcs.json 2>/dev/null && echo "  State file deleted" || true
+echo -e "\n[7/7] Clearing state file..."
+rm -f ~/.vpcctl/vpcs.json ~/.vpcctl/vpcs.db* 2>/dev/null && echo "  State files deleted" || true
 
 echo -e "\n${GREEN}=========================================${NC}"
 echo -e "${GREEN}Cleanup completed successfully!${NC}"
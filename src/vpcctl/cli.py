@@ -1,64 +1,240 @@
 import argparse
+import os
 import sys
 from . import utils
-from . import vpc
-from . import subnet
-from . import peering
-from . import firewall
+from . import profiling
 
-def main():
-    utils.check_root()
+LOCAL_COMMANDS = {'migrate-state', 'exec', 'perf', 'watch-uplink'}
+PERF_PROFILES = ['default', 'throughput', 'low-latency']
+
+def exec_in_subnet(vpc_name, subnet_name, argv, instance_name=None):
+    from . import state
+    from .netns import exec_in_namespace
+    
+    subnet_obj = state.get_subnet(vpc_name, subnet_name)
+    if not subnet_obj:
+        utils.logger.error(f"Subnet '{subnet_name}' not found in VPC '{vpc_name}'")
+        return 1
+    
+    namespace = subnet_obj['namespace']
+    if instance_name:
+        instance = next((i for i in subnet_obj.get('instances', []) if i['name'] == instance_name), None)
+        if not instance:
+            utils.logger.error(f"Instance '{instance_name}' not found in subnet '{subnet_name}'")
+            return 1
+        namespace = instance['namespace']
     
-    if 'exec' in sys.argv:
-        exec_index = sys.argv.index('exec')
+    if argv and argv[0] == '--':
+        argv = argv[1:]
+    
+    if not argv:
+        utils.logger.error("No command specified for exec")
+        return 1
+    
+    sys.stdout.flush()
+    sys.stderr.flush()
+    
+    try:
+        exec_in_namespace(namespace, argv)
+    except FileNotFoundError:
+        utils.logger.error(f"Command not found: {argv[0]}")
+        return 127
+    except PermissionError as e:
+        utils.logger.error(f"Cannot execute {argv[0]}: {e}")
+        return 126
+
+def dispatch(args, parser):
+    from . import state, vpc, subnet, peering, hub, firewall, topology, orphans, stats, probe, perf, profiles
+    from . import egress, conntrack
+    
+    if args.command == 'create-vpc':
+        success = vpc.create_vpc(args.name, args.cidr, perf_profile=args.perf_profile)
+        return 0 if success else 1
+        
+    elif args.command == 'delete-vpc':
+        success = vpc.delete_vpc(args.name, cascade=args.cascade)
+        return 0 if success else 1
+        
+    elif args.command == 'list-vpcs':
+        vpc.list_vpcs()
+        return 0
+        
+    elif args.command == 'create-subnet':
+        success = subnet.create_subnet(args.vpc, args.name, args.cidr, args.type, perf_profile=args.perf_profile)
+        return 0 if success else 1
+        
+    elif args.command == 'set-perf-profile':
+        success = profiles.set_perf_profile(args.vpc, args.perf_profile, subnet_name=args.subnet)
+        return 0 if success else 1
+        
+    elif args.command == 'delete-subnet':
+        success = subnet.delete_subnet(args.vpc, args.name)
+        return 0 if success else 1
+        
+    elif args.command == 'list-subnets':
+        subnet.list_subnets(args.vpc)
+        return 0
+        
+    elif args.command == 'add-instance':
+        success = subnet.add_instance(args.vpc, args.subnet, args.name)
+        return 0 if success else 1
+        
+    elif args.command == 'remove-instance':
+        success = subnet.remove_instance(args.vpc, args.subnet, args.name)
+        return 0 if success else 1
         
-        parser = argparse.ArgumentParser()
-        parser.add_argument('--verbose', '-v', action='store_true')
-        parser.add_argument('command', nargs='?')
-        parser.add_argument('--vpc', required=True)
-        parser.add_argument('--subnet', required=True)
+    elif args.command == 'whois':
+        success = subnet.whois(args.address)
+        return 0 if success else 1
         
-        args, unknown = parser.parse_known_args(sys.argv[1:])
+    elif args.command == 'create-peering':
+        success = peering.create_peering(args.vpc1, args.vpc2, mode=args.mode)
+        return 0 if success else 1
         
-        command_parts = []
-        for i in range(exec_index + 1, len(sys.argv)):
-            arg = sys.argv[i]
-            if arg not in ['--vpc', '--subnet'] and not (i > 0 and sys.argv[i-1] in ['--vpc', '--subnet']):
-                command_parts.append(arg)
+    elif args.command == 'delete-peering':
+        success = peering.delete_peering(args.vpc1, args.vpc2)
+        return 0 if success else 1
         
-        subnet_obj = utils.get_subnet(args.vpc, args.subnet)
-        if not subnet_obj:
-            utils.logger.error(f"Subnet '{args.subnet}' not found in VPC '{args.vpc}'")
-            sys.exit(1)
+    elif args.command == 'create-transit-hub':
+        success = hub.create_hub(args.name, args.cidr)
+        return 0 if success else 1
         
-        namespace = subnet_obj['namespace']
-        cmd = ' '.join(command_parts)
+    elif args.command == 'delete-transit-hub':
+        success = hub.delete_hub(args.name, force=args.force)
+        return 0 if success else 1
         
-        if not cmd:
-            utils.logger.error("No command specified for exec")
-            sys.exit(1)
+    elif args.command == 'attach-to-hub':
+        success = hub.attach_vpc(args.hub, args.vpc)
+        return 0 if success else 1
         
-        result = utils.run_command(f"ip netns exec {namespace} {cmd}", check=False)
-        print(result.stdout, end='')
-        if result.stderr:
-            print(result.stderr, end='', file=sys.stderr)
-        sys.exit(result.returncode)
+    elif args.command == 'detach-from-hub':
+        success = hub.detach_vpc(args.hub, args.vpc)
+        return 0 if success else 1
+        
+    elif args.command == 'list-hubs':
+        hub.list_hubs()
+        return 0
+        
+    elif args.command == 'apply-policy':
+        success = firewall.apply_policy(args.vpc, args.subnet, args.file)
+        return 0 if success else 1
+        
+    elif args.command == 'clear-policy':
+        success = firewall.clear_policy(args.vpc, args.subnet)
+        return 0 if success else 1
+        
+    elif args.command == 'apply':
+        workers = args.workers or utils.DEFAULT_WORKERS
+        success = topology.apply(args.file, plan_only=args.plan, prune=args.prune, workers=workers)
+        return 0 if success else 1
+        
+    elif args.command == 'gc':
+        workers = args.workers or utils.DEFAULT_WORKERS
+        success = orphans.collect_garbage(dry_run=args.dry_run, workers=workers)
+        return 0 if success else 1
+        
+    elif args.command == 'stats':
+        workers = args.workers or utils.DEFAULT_WORKERS
+        success = stats.show_stats(output_format=args.format, output=args.output, watch=args.watch, workers=workers)
+        return 0 if success else 1
+        
+    elif args.command == 'probe':
+        success = probe.probe(vpc_names=args.vpc, probe_specs=args.probe, timeout=args.timeout)
+        return 0 if success else 1
+        
+    elif args.command == 'perf':
+        if args.listen:
+            success = perf.listen(port=args.port, bind=args.bind)
+        elif not args.source or not args.target:
+            utils.logger.error("perf requires --from and --to unless --listen is given")
+            success = False
+        else:
+            success = perf.perf(args.source, args.target, port=args.port, duration=args.duration, as_json=args.json)
+        return 0 if success else 1
+        
+    elif args.command == 'watch-uplink':
+        success = egress.watch(once=args.once)
+        return 0 if success else 1
+        
+    elif args.command == 'tune-conntrack':
+        zones = None if args.zones is None else args.zones == 'on'
+        success = conntrack.tune_conntrack(max_entries=args.max_entries, buckets=args.buckets, zones=zones)
+        return 0 if success else 1
+        
+    elif args.command == 'exec':
+        return exec_in_subnet(args.vpc, args.subnet, args.argv, args.instance)
+        
+    elif args.command == 'migrate-state':
+        success = state.migrate_to_sqlite()
+        return 0 if success else 1
+        
+    else:
+        parser.print_help()
+        return 1
+
+def remote_params(args):
+    params = {k: v for k, v in vars(args).items() if k not in ('command', 'verbose', 'local', 'profile')}
+    if params.get('file'):
+        params['file'] = os.path.abspath(params['file'])
+    if params.get('output'):
+        params['output'] = os.path.abspath(params['output'])
+    return params
+
+def run(args, parser):
+    if args.profile:
+        profiling.enable()
+        try:
+            return run_local(args, parser)
+        finally:
+            events = profiling.write_trace(args.profile)
+            profiling.print_summary(profiling.summary(), sys.stderr)
+            utils.logger.info(f"Wrote {events} trace events to {args.profile}")
     
+    streaming = args.command == 'stats' and args.watch is not None
+    if not args.local and args.command not in LOCAL_COMMANDS and not streaming:
+        from .client import run_remote, DaemonUnavailable
+        try:
+            return run_remote(args.command, remote_params(args))
+        except DaemonUnavailable as e:
+            utils.logger.debug(f"{e}; running in-process")
+    
+    return run_local(args, parser)
+
+def run_local(args, parser):
+    utils.check_root()
+    
+    from . import state
+    try:
+        with profiling.span(args.command, "operation"), state.deferred_writes():
+            return dispatch(args, parser)
+        
+    except KeyboardInterrupt:
+        utils.logger.info("\nOperation cancelled by user")
+        return 1
+    except Exception as e:
+        utils.logger.error(f"Unexpected error: {e}")
+        return 1
+
+def build_parser():
     parser = argparse.ArgumentParser(
         description='VPCctl - Linux VPC management using network primitives',
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
     
     parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose logging')
+    parser.add_argument('--local', action='store_true', help='Run in-process even when vpcctld is running')
+    parser.add_argument('--profile', metavar='FILE', help='Run in-process and write a Chrome trace of every span to FILE')
     
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
     
     vpc_create = subparsers.add_parser('create-vpc', help='Create a new VPC')
     vpc_create.add_argument('--name', required=True, help='VPC name')
     vpc_create.add_argument('--cidr', required=True, help='VPC CIDR block (e.g., 10.0.0.0/16)')
+    vpc_create.add_argument('--perf-profile', choices=PERF_PROFILES, default='default', help='Bridge and veth tuning profile (default: default)')
     
     vpc_delete = subparsers.add_parser('delete-vpc', help='Delete a VPC')
     vpc_delete.add_argument('--name', required=True, help='VPC name')
+    vpc_delete.add_argument('--cascade', action='store_true', help='Also delete its subnets and peerings')
     
     subparsers.add_parser('list-vpcs', help='List all VPCs')
     
@@ -67,6 +243,12 @@ def main():
     subnet_create.add_argument('--name', required=True, help='Subnet name')
     subnet_create.add_argument('--cidr', required=True, help='Subnet CIDR block')
     subnet_create.add_argument('--type', required=True, choices=['public', 'private'], help='Subnet type')
+    subnet_create.add_argument('--perf-profile', choices=PERF_PROFILES, help="Veth tuning profile (default: the VPC's profile)")
+    
+    perf_profile = subparsers.add_parser('set-perf-profile', help='Re-apply or change the perf profile of a VPC or subnet in place')
+    perf_profile.add_argument('--vpc', required=True, help='VPC name')
+    perf_profile.add_argument('--subnet', help='Only retune this subnet (default: the bridge and every subnet)')
+    perf_profile.add_argument('--perf-profile', required=True, choices=PERF_PROFILES, help='Profile to apply')
     
     subnet_delete = subparsers.add_parser('delete-subnet', help='Delete a subnet')
     subnet_delete.add_argument('--vpc', required=True, help='VPC name')
@@ -75,14 +257,46 @@ def main():
     subnet_list = subparsers.add_parser('list-subnets', help='List subnets in a VPC')
     subnet_list.add_argument('--vpc', required=True, help='VPC name')
     
+    instance_add = subparsers.add_parser('add-instance', help='Add an instance namespace to a subnet')
+    instance_add.add_argument('--vpc', required=True, help='VPC name')
+    instance_add.add_argument('--subnet', required=True, help='Subnet name')
+    instance_add.add_argument('--name', required=True, help='Instance name')
+    
+    instance_remove = subparsers.add_parser('remove-instance', help='Remove an instance from a subnet')
+    instance_remove.add_argument('--vpc', required=True, help='VPC name')
+    instance_remove.add_argument('--subnet', required=True, help='Subnet name')
+    instance_remove.add_argument('--name', required=True, help='Instance name')
+    
+    whois = subparsers.add_parser('whois', help='Show the VPC, subnet and namespace that own an IP')
+    whois.add_argument('address', help='IPv4 address to look up')
+    
     peering_create = subparsers.add_parser('create-peering', help='Create VPC peering')
     peering_create.add_argument('--vpc1', required=True, help='First VPC name')
     peering_create.add_argument('--vpc2', required=True, help='Second VPC name')
+    peering_create.add_argument('--mode', choices=['routed', 'bridged'], default='bridged', help='routed keeps separate broadcast domains, bridged joins the bridges at L2 (default: bridged)')
     
     peering_delete = subparsers.add_parser('delete-peering', help='Delete VPC peering')
     peering_delete.add_argument('--vpc1', required=True, help='First VPC name')
     peering_delete.add_argument('--vpc2', required=True, help='Second VPC name')
     
+    hub_create = subparsers.add_parser('create-transit-hub', help='Create a transit hub that routes between attached VPCs')
+    hub_create.add_argument('--name', required=True, help='Hub name')
+    hub_create.add_argument('--cidr', required=True, help='Aggregate CIDR covering every attached VPC (e.g., 10.0.0.0/8)')
+    
+    hub_delete = subparsers.add_parser('delete-transit-hub', help='Delete a transit hub')
+    hub_delete.add_argument('--name', required=True, help='Hub name')
+    hub_delete.add_argument('--force', action='store_true', help='Detach attached VPCs first')
+    
+    hub_attach = subparsers.add_parser('attach-to-hub', help='Attach a VPC to a transit hub')
+    hub_attach.add_argument('--hub', required=True, help='Hub name')
+    hub_attach.add_argument('--vpc', required=True, help='VPC name')
+    
+    hub_detach = subparsers.add_parser('detach-from-hub', help='Detach a VPC from a transit hub')
+    hub_detach.add_argument('--hub', required=True, help='Hub name')
+    hub_detach.add_argument('--vpc', required=True, help='VPC name')
+    
+    subparsers.add_parser('list-hubs', help='List transit hubs and their VPCs')
+    
     policy_apply = subparsers.add_parser('apply-policy', help='Apply firewall policy to subnet')
     policy_apply.add_argument('--vpc', required=True, help='VPC name')
     policy_apply.add_argument('--subnet', required=True, help='Subnet name')
@@ -92,6 +306,56 @@ def main():
     policy_clear.add_argument('--vpc', required=True, help='VPC name')
     policy_clear.add_argument('--subnet', required=True, help='Subnet name')
     
+    topology_apply = subparsers.add_parser('apply', help='Reconcile a declarative topology file')
+    topology_apply.add_argument('--file', '-f', required=True, help='Topology file path')
+    topology_apply.add_argument('--plan', action='store_true', help='Print the change set without applying it')
+    topology_apply.add_argument('--prune', action='store_true', help='Delete VPCs, subnets and peerings missing from the file')
+    topology_apply.add_argument('--workers', type=int, help='Maximum parallel operations (default: min(8, CPU count))')
+    
+    gc = subparsers.add_parser('gc', help='Remove orphaned bridges, veths, namespaces and firewall rules')
+    gc.add_argument('--dry-run', action='store_true', help='Report orphans without removing them')
+    gc.add_argument('--workers', type=int, help='Maximum parallel removals (default: min(8, CPU count))')
+    
+    probe = subparsers.add_parser('probe', help='Probe subnet-to-subnet reachability and compare it with the expected matrix')
+    probe.add_argument('--vpc', action='append', help='Only probe subnets of this VPC (repeatable)')
+    probe.add_argument('--probe', action='append', metavar='SPEC', help='icmp, tcp:PORT or udp:PORT (repeatable, default: icmp)')
+    probe.add_argument('--timeout', type=float, default=1.0, help='Seconds to wait for each probe (default: 1.0)')
+    
+    perf = subparsers.add_parser('perf', help='Measure throughput, latency and CPU cost between two subnets')
+    perf.add_argument('--from', dest='source', metavar='VPC/SUBNET', help='Source subnet or VPC/SUBNET/INSTANCE')
+    perf.add_argument('--to', dest='target', metavar='VPC/SUBNET', help='Destination subnet, instance or the IPv4 address of a remote sink')
+    perf.add_argument('--port', type=int, default=5201, help='Sink TCP port (default: 5201)')
+    perf.add_argument('--duration', type=float, default=5.0, help='Seconds to run the throughput test (default: 5)')
+    perf.add_argument('--json', action='store_true', help='Print the report as a single JSON object')
+    perf.add_argument('--listen', action='store_true', help='Run a sink in the root namespace, e.g. on a remote host to measure NATed paths')
+    perf.add_argument('--bind', default='0.0.0.0', help='Address the --listen sink binds to (default: 0.0.0.0)')
+    
+    stats = subparsers.add_parser('stats', help='Collect interface and firewall rule counters from every namespace')
+    stats.add_argument('--format', choices=['prometheus', 'ndjson'], default='prometheus', help='Output format (default: prometheus)')
+    stats.add_argument('--output', metavar='FILE', help='Atomically write the snapshot to FILE instead of stdout')
+    stats.add_argument('--watch', type=float, metavar='SECONDS', help='Re-collect every SECONDS and add per-second rates')
+    stats.add_argument('--workers', type=int, help='Maximum parallel namespace reads (default: min(8, CPU count))')
+    
+    watch_uplink = subparsers.add_parser('watch-uplink', help='Rewrite NAT rules when the default route or uplink address changes')
+    watch_uplink.add_argument('--once', action='store_true', help='Check the uplink once and exit instead of watching netlink events')
+    
+    ct = subparsers.add_parser('tune-conntrack', help='Size the conntrack table and toggle per-VPC zones (shows usage without options)')
+    ct.add_argument('--max-entries', type=int, help='Maximum tracked connections (nf_conntrack_max)')
+    ct.add_argument('--buckets', type=int, help='Conntrack hash table buckets')
+    ct.add_argument('--zones', choices=['on', 'off'], help='Give each VPC its own conntrack zone')
+    
+    subnet_exec = subparsers.add_parser('exec', help='Run a command inside a subnet namespace')
+    subnet_exec.add_argument('--vpc', required=True, help='VPC name')
+    subnet_exec.add_argument('--subnet', required=True, help='Subnet name')
+    subnet_exec.add_argument('--instance', help='Instance name (default: the subnet namespace)')
+    subnet_exec.add_argument('argv', nargs=argparse.REMAINDER, help='Command and arguments to run')
+    
+    subparsers.add_parser('migrate-state', help='Migrate vpcs.json to the SQLite state backend')
+    
+    return parser
+
+def main():
+    parser = build_parser()
     args = parser.parse_args()
     
     if args.verbose:
@@ -101,57 +365,7 @@ def main():
         parser.print_help()
         sys.exit(1)
     
-    try:
-        if args.command == 'create-vpc':
-            success = vpc.create_vpc(args.name, args.cidr)
-            sys.exit(0 if success else 1)
-            
-        elif args.command == 'delete-vpc':
-            success = vpc.delete_vpc(args.name)
-            sys.exit(0 if success else 1)
-            
-        elif args.command == 'list-vpcs':
-            vpc.list_vpcs()
-            sys.exit(0)
-            
-        elif args.command == 'create-subnet':
-            success = subnet.create_subnet(args.vpc, args.name, args.cidr, args.type)
-            sys.exit(0 if success else 1)
-            
-        elif args.command == 'delete-subnet':
-            success = subnet.delete_subnet(args.vpc, args.name)
-            sys.exit(0 if success else 1)
-            
-        elif args.command == 'list-subnets':
-            subnet.list_subnets(args.vpc)
-            sys.exit(0)
-            
-        elif args.command == 'create-peering':
-            success = peering.create_peering(args.vpc1, args.vpc2)
-            sys.exit(0 if success else 1)
-            
-        elif args.command == 'delete-peering':
-            success = peering.delete_peering(args.vpc1, args.vpc2)
-            sys.exit(0 if success else 1)
-            
-        elif args.command == 'apply-policy':
-            success = firewall.apply_policy(args.vpc, args.subnet, args.file)
-            sys.exit(0 if success else 1)
-            
-        elif args.command == 'clear-policy':
-            success = firewall.clear_policy(args.vpc, args.subnet)
-            sys.exit(0 if success else 1)
-            
-        else:
-            parser.print_help()
-            sys.exit(1)
-            
-    except KeyboardInterrupt:
-        utils.logger.info("\nOperation cancelled by user")
-        sys.exit(1)
-    except Exception as e:
-        utils.logger.error(f"Unexpected error: {e}")
-        sys.exit(1)
+    sys.exit(run(args, parser))
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
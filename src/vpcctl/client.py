@@ -0,0 +1,66 @@
+import json
+import socket
+import sys
+from . import utils
+from .utils import logger
+
+class DaemonUnavailable(Exception):
+    pass
+
+class RemoteError(Exception):
+    pass
+
+class RequestFailed(Exception):
+    pass
+
+_request_id = 0
+
+def call(method, params=None, socket_path=None):
+    global _request_id
+    _request_id += 1
+    path = socket_path or utils.SOCKET_PATH
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+    except (FileNotFoundError, ConnectionRefusedError, PermissionError) as e:
+        sock.close()
+        raise DaemonUnavailable(f"vpcctld is not reachable at {path}: {e}") from e
+
+    with sock:
+        sock.settimeout(utils.REQUEST_TIMEOUT)
+        request = {"jsonrpc": "2.0", "id": _request_id, "method": method, "params": params or {}}
+        try:
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile('rb') as f:
+                line = f.readline()
+        except socket.timeout as e:
+            raise RequestFailed(f"no reply from vpcctld within {utils.REQUEST_TIMEOUT:g}s") from e
+        except OSError as e:
+            raise RequestFailed(f"connection to vpcctld lost: {e}") from e
+
+    if not line:
+        raise RequestFailed("vpcctld closed the connection without replying")
+
+    response = json.loads(line)
+    if 'error' in response:
+        raise RemoteError(response['error']['message'])
+    return response['result']
+
+def run_remote(method, params):
+    try:
+        result = call(method, params)
+    except RemoteError as e:
+        logger.error(f"vpcctld rejected '{method}': {e}")
+        return 1
+    except RequestFailed as e:
+        logger.error(f"'{method}' may not have completed: {e}. Check the result before retrying")
+        return 1
+
+    for record in result.get('log', []):
+        logger.log(record['level'], record['message'])
+    if result.get('stdout'):
+        print(result['stdout'], end='')
+    if result.get('stderr'):
+        print(result['stderr'], end='', file=sys.stderr)
+    return result['code']
@@ -0,0 +1,90 @@
+from pathlib import Path
+from . import netfilter
+from .utils import (
+    logger,
+    read_sysctl,
+    write_sysctl
+)
+from .state import (
+    load_state,
+    update_state,
+    get_vpc,
+    vpc_lock
+)
+
+HASHSIZE = Path("/sys/module/nf_conntrack/parameters/hashsize")
+MAX_ZONE = 65535
+
+def zones_enabled():
+    return load_state().get('conntrack', {}).get('zones', False)
+
+def next_zone(vpcs):
+    used = {v['ct_zone'] for v in vpcs if 'ct_zone' in v}
+    return next(zone for zone in range(1, MAX_ZONE + 1) if zone not in used)
+
+def assign_zone(vpc_name):
+    with update_state() as state:
+        vpc = get_vpc(vpc_name)
+        vpc['ct_zone'] = next_zone(state['vpcs'])
+    netfilter.backend().set_ct_zone(vpc)
+
+def clear_zone(vpc_name):
+    vpc = get_vpc(vpc_name)
+    netfilter.backend().clear_ct_zone(vpc)
+    with update_state():
+        get_vpc(vpc_name).pop('ct_zone', None)
+
+def _read(key):
+    try:
+        return read_sysctl(key)
+    except OSError:
+        return "n/a"
+
+def show_conntrack():
+    settings = load_state().get('conntrack', {})
+    print(f"\n{'Entries:':<10} {_read('net/netfilter/nf_conntrack_count')} of "
+          f"{_read('net/netfilter/nf_conntrack_max')}")
+    print(f"{'Buckets:':<10} {_read('net/netfilter/nf_conntrack_buckets')}")
+    zoned = [v for v in load_state()['vpcs'] if 'ct_zone' in v]
+    print(f"{'Zones:':<10} {'on' if settings.get('zones') else 'off'} ({len(zoned)} VPC(s))")
+    for vpc in zoned:
+        print(f"  {vpc['name']:<20} zone {vpc['ct_zone']}")
+    print()
+
+def tune_conntrack(max_entries=None, buckets=None, zones=None):
+    if max_entries is None and buckets is None and zones is None:
+        show_conntrack()
+        return True
+
+    names = [v['name'] for v in load_state()['vpcs']]
+    with vpc_lock(*names):
+        try:
+            if buckets:
+                logger.debug(f"Writing {buckets} to {HASHSIZE}")
+                HASHSIZE.write_text(f"{buckets}\n")
+                logger.info(f"Conntrack hash table resized to {buckets} buckets")
+            if max_entries:
+                write_sysctl("net/netfilter/nf_conntrack_max", max_entries)
+                logger.info(f"Conntrack table limit set to {max_entries} entries")
+
+            if zones is not None:
+                for vpc in load_state()['vpcs']:
+                    if zones and 'ct_zone' not in vpc:
+                        assign_zone(vpc['name'])
+                    elif not zones and 'ct_zone' in vpc:
+                        clear_zone(vpc['name'])
+                logger.info(f"Per-VPC conntrack zones {'enabled' if zones else 'disabled'}")
+
+            with update_state() as state:
+                settings = state.setdefault('conntrack', {})
+                if max_entries:
+                    settings['max_entries'] = max_entries
+                if buckets:
+                    settings['buckets'] = buckets
+                if zones is not None:
+                    settings['zones'] = zones
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to tune conntrack: {e}")
+            return False
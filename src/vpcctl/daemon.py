@@ -0,0 +1,261 @@
+import argparse
+import contextvars
+import io
+import json
+import logging
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+from . import utils
+from . import state
+from . import kernel
+from . import profiling
+from .utils import logger
+
+METHODS = {
+    'create-vpc': ('name', 'cidr'),
+    'delete-vpc': ('name',),
+    'list-vpcs': (),
+    'create-subnet': ('vpc', 'name', 'cidr', 'type'),
+    'delete-subnet': ('vpc', 'name'),
+    'set-perf-profile': ('vpc', 'perf_profile'),
+    'list-subnets': ('vpc',),
+    'add-instance': ('vpc', 'subnet', 'name'),
+    'remove-instance': ('vpc', 'subnet', 'name'),
+    'whois': ('address',),
+    'create-peering': ('vpc1', 'vpc2'),
+    'delete-peering': ('vpc1', 'vpc2'),
+    'create-transit-hub': ('name', 'cidr'),
+    'delete-transit-hub': ('name',),
+    'attach-to-hub': ('hub', 'vpc'),
+    'detach-from-hub': ('hub', 'vpc'),
+    'list-hubs': (),
+    'apply-policy': ('vpc', 'subnet', 'file'),
+    'clear-policy': ('vpc', 'subnet'),
+    'apply': ('file',),
+    'gc': (),
+    'stats': (),
+    'tune-conntrack': (),
+    'probe': (),
+    'status': (),
+    'metrics': ()
+}
+
+OPTIONAL_PARAMS = {
+    'create-vpc': {'perf_profile': 'default'},
+    'create-subnet': {'perf_profile': None},
+    'set-perf-profile': {'subnet': None},
+    'delete-vpc': {'cascade': False},
+    'create-peering': {'mode': 'bridged'},
+    'delete-transit-hub': {'force': False},
+    'apply': {'plan': False, 'prune': False, 'workers': None},
+    'gc': {'dry_run': False, 'workers': None},
+    'probe': {'vpc': None, 'probe': None, 'timeout': 1.0},
+    'tune-conntrack': {'max_entries': None, 'buckets': None, 'zones': None},
+    'stats': {'format': 'prometheus', 'output': None, 'watch': None, 'workers': None}
+}
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+_capture = contextvars.ContextVar('vpcctld_capture', default=None)
+
+class Capture:
+    def __init__(self):
+        self.stdout = io.StringIO()
+        self.stderr = io.StringIO()
+        self.log = []
+
+class CapturedStream:
+    def __init__(self, name, fallback):
+        self.name = name
+        self.fallback = fallback
+
+    def write(self, data):
+        capture = _capture.get()
+        if capture is None:
+            return self.fallback.write(data)
+        return getattr(capture, self.name).write(data)
+
+    def flush(self):
+        if _capture.get() is None:
+            self.fallback.flush()
+
+    def __getattr__(self, attr):
+        return getattr(self.fallback, attr)
+
+class CaptureHandler(logging.Handler):
+    def emit(self, record):
+        capture = _capture.get()
+        if capture is not None:
+            capture.log.append({"level": record.levelno, "message": record.getMessage()})
+
+class Daemon:
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.started = time.time()
+        self.requests = 0
+        self.counter_lock = threading.Lock()
+        self.metrics = profiling.Aggregator()
+        profiling.add_hook(self.metrics)
+
+    def status(self):
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started, 3),
+            "requests": self.requests,
+            "vpcs": len(state.load_state()['vpcs']),
+            "netlink": kernel.use_netlink()
+        }
+
+    def execute(self, method, params):
+        from . import cli
+
+        if method == 'status':
+            return {"code": 0, "status": self.status()}
+        if method == 'metrics':
+            return {"code": 0, "metrics": self.metrics.snapshot()}
+
+        args = argparse.Namespace(command=method, **{**OPTIONAL_PARAMS.get(method, {}), **params})
+        capture = Capture()
+        token = _capture.set(capture)
+        try:
+            with profiling.span(method, "operation"), state.deferred_writes():
+                code = cli.dispatch(args, None)
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
+            code = 1
+        finally:
+            _capture.reset(token)
+
+        return {
+            "code": code,
+            "stdout": capture.stdout.getvalue(),
+            "stderr": capture.stderr.getvalue(),
+            "log": capture.log
+        }
+
+    def handle(self, line):
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            return error_response(None, PARSE_ERROR, f"Parse error: {e}")
+
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+            return error_response(None, INVALID_REQUEST, "Invalid request")
+
+        request_id = request.get('id')
+        method = request['method']
+        params = request.get('params') or {}
+
+        if method not in METHODS:
+            return error_response(request_id, METHOD_NOT_FOUND, f"Unknown method '{method}'")
+
+        if not isinstance(params, dict):
+            return error_response(request_id, INVALID_PARAMS, "Params must be an object")
+
+        allowed = set(METHODS[method]) | set(OPTIONAL_PARAMS.get(method, {}))
+        missing = [name for name in METHODS[method] if name not in params]
+        unknown = [name for name in params if name not in allowed]
+        if missing or unknown:
+            return error_response(request_id, INVALID_PARAMS,
+                                  f"Invalid params for '{method}': missing {missing}, unknown {unknown}")
+
+        with self.counter_lock:
+            self.requests += 1
+
+        try:
+            result = self.execute(method, params)
+        except Exception as e:
+            return error_response(request_id, INTERNAL_ERROR, str(e))
+
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+def error_response(request_id, code, message):
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.daemon.handle(line)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+def warm_up():
+    from . import cli, vpc, subnet, peering, hub, firewall, topology, orphans, stats, probe, profiles, egress, conntrack
+    state.load_state()
+    kernel.use_netlink()
+
+def serve(socket_path, watch_uplink=False):
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if socket_path.exists():
+        from .client import call, DaemonUnavailable
+        try:
+            call('status', socket_path=socket_path)
+            logger.error(f"vpcctld is already running on {socket_path}")
+            return False
+        except DaemonUnavailable:
+            socket_path.unlink()
+
+    warm_up()
+
+    sys.stdout = CapturedStream('stdout', sys.stdout)
+    sys.stderr = CapturedStream('stderr', sys.stderr)
+    logger.addHandler(CaptureHandler())
+
+    old_umask = os.umask(0o077)
+    try:
+        server = Server(str(socket_path), RequestHandler)
+    finally:
+        os.umask(old_umask)
+    server.daemon = Daemon(socket_path)
+
+    def shutdown(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    if watch_uplink:
+        from .egress import watch
+        threading.Thread(target=watch, name="uplink-watch", daemon=True).start()
+
+    logger.info(f"vpcctld listening on {socket_path} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        state.get_store().flush()
+        if socket_path.exists():
+            socket_path.unlink()
+        logger.info("vpcctld stopped")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='vpcctld - long-running vpcctl daemon')
+    parser.add_argument('--socket', default=str(utils.SOCKET_PATH), help='Unix socket path')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose logging')
+    parser.add_argument('--watch-uplink', action='store_true', help='Rewrite NAT rules when the default route or uplink address changes')
+    args = parser.parse_args()
+
+    if args.verbose:
+        logger.setLevel('DEBUG')
+
+    utils.check_root()
+
+    sys.exit(0 if serve(Path(args.socket), watch_uplink=args.watch_uplink) else 1)
+
+if __name__ == '__main__':
+    main()
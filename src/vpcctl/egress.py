@@ -0,0 +1,96 @@
+import select
+import time
+from . import kernel
+from . import netfilter
+from .utils import logger
+from .state import (
+    load_state,
+    update_state,
+    vpc_lock
+)
+
+DEBOUNCE_SECONDS = 0.5
+
+def read_uplink():
+    dev, _ = kernel.default_route()
+    if not dev:
+        return None
+    return {"interface": dev, "address": kernel.interface_address(dev)}
+
+def uplink_lock():
+    return vpc_lock("global:uplink")
+
+def cached_uplink():
+    cached = load_state().get('uplink')
+    if cached:
+        return cached
+
+    with uplink_lock():
+        cached = load_state().get('uplink')
+        if not cached:
+            cached = read_uplink()
+            if not cached:
+                logger.error("No default route found")
+                return None
+            with update_state() as state:
+                state['uplink'] = cached
+            logger.info(f"Cached uplink {cached['interface']} ({cached['address'] or 'no IPv4 address'})")
+    return cached
+
+def has_public_subnet(vpc, exclude=None):
+    return any(s.get('type') == 'public' and s['name'] != exclude for s in vpc.get('subnets', []))
+
+def refresh_uplink():
+    current = read_uplink()
+    cached = load_state().get('uplink')
+    if current == cached:
+        logger.debug(f"Uplink unchanged ({current})")
+        return False
+
+    names = [v['name'] for v in load_state()['vpcs'] if has_public_subnet(v)]
+    with vpc_lock(*names):
+        if current:
+            backend = netfilter.backend()
+            for vpc in load_state()['vpcs']:
+                if vpc['name'] in names:
+                    backend.setup_nat(vpc, current, previous=cached)
+
+        with uplink_lock():
+            with update_state() as state:
+                if current:
+                    state['uplink'] = current
+                else:
+                    state.pop('uplink', None)
+
+    if not current:
+        logger.error("Default route disappeared, NAT rules are left in place until it returns")
+        return True
+
+    previous = f"{cached['interface']} ({cached['address']})" if cached else "none"
+    logger.info(f"Uplink changed from {previous} to {current['interface']} ({current['address']}), "
+                f"rewrote NAT for {len(names)} VPC(s)")
+    return True
+
+def watch(once=False):
+    from . import netlink
+
+    refresh_uplink()
+    if once:
+        return True
+
+    sock = netlink.subscribe(netlink.RTMGRP_IPV4_ROUTE | netlink.RTMGRP_IPV4_IFADDR)
+    logger.info("Watching for default route and uplink address changes, press Ctrl-C to stop")
+    try:
+        with sock:
+            while True:
+                select.select([sock], [], [])
+                deadline = time.monotonic() + DEBOUNCE_SECONDS
+                while True:
+                    remaining = deadline - time.monotonic()
+                    readable, _, _ = select.select([sock], [], [], max(0, remaining))
+                    if not readable:
+                        break
+                    sock.recv(netlink.RECV_BUFFER)
+                refresh_uplink()
+    except KeyboardInterrupt:
+        return True
@@ -1,9 +1,24 @@
+import hashlib
 import json
+import time
 from pathlib import Path
+from . import utils
+from .policy import (
+    validate_policy,
+    compile_policy,
+    build_restore_payload,
+    build_update_payload,
+    build_ipset_payload
+)
+from .subnet import subnet_namespaces
 from .utils import (
     logger,
-    run_command,
-    get_subnet
+    run_command
+)
+from .state import (
+    update_state,
+    get_subnet,
+    vpc_lock
 )
 
 def parse_policy(policy_file):
@@ -17,23 +32,9 @@ def parse_policy(policy_file):
         with open(policy_path, 'r') as f:
             policy = json.load(f)
         
-        if 'subnet' not in policy:
-            logger.error("Policy must contain 'subnet' field")
-            return None
-        
-        if 'ingress' not in policy:
-            logger.error("Policy must contain 'ingress' field")
+        if not validate_policy(policy):
             return None
         
-        for rule in policy['ingress']:
-            if 'port' not in rule or 'protocol' not in rule or 'action' not in rule:
-                logger.error("Each ingress rule must have 'port', 'protocol', and 'action' fields")
-                return None
-            
-            if rule['action'] not in ['allow', 'deny']:
-                logger.error(f"Invalid action '{rule['action']}'. Must be 'allow' or 'deny'")
-                return None
-        
         logger.info(f"Policy parsed successfully from {policy_file}")
         return policy
         
@@ -44,45 +45,90 @@ def parse_policy(policy_file):
         logger.error(f"Failed to parse policy: {e}")
         return None
 
+def policy_hash(policy):
+    canonical = json.dumps(policy, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def destroy_sets(namespace, names):
+    payload = "".join(f"destroy {name}\n" for name in names)
+    run_command(f"ip netns exec {namespace} ipset restore", check=False, input=payload)
+    logger.info(f"Destroyed {len(names)} unused ipset(s) in {namespace}")
+
+def install_policy(namespace, subnet):
+    if subnet.get('policy_sets'):
+        run_command(f"ip netns exec {namespace} ipset restore", input=build_ipset_payload(subnet['policy_sets']))
+    run_command(f"ip netns exec {namespace} iptables-restore -w --noflush",
+                input=build_restore_payload(subnet['policy_rules']))
+    logger.info(f"Installed the policy of the subnet in {namespace}")
+
 def apply_policy(vpc_name, subnet_name, policy_file):
     policy = parse_policy(policy_file)
     if not policy:
         return False
     
+    return apply_policy_document(vpc_name, subnet_name, policy)
+
+def apply_policy_document(vpc_name, subnet_name, policy):
+    with vpc_lock(vpc_name):
+        return _apply_policy_document(vpc_name, subnet_name, policy)
+
+def _apply_policy_document(vpc_name, subnet_name, policy):
     subnet = get_subnet(vpc_name, subnet_name)
     if not subnet:
         logger.error(f"Subnet '{subnet_name}' not found in VPC '{vpc_name}'")
         return False
     
-    namespace = subnet['namespace']
+    new_hash = policy_hash(policy)
+    if subnet.get('policy_hash') == new_hash:
+        logger.info(f"Policy already applied to subnet '{subnet_name}' in VPC '{vpc_name}', nothing to do")
+        return True
+    
+    start = time.perf_counter()
+    commands_before = utils.command_count
     
     try:
-        run_command(f"ip netns exec {namespace} iptables -F INPUT")
-        logger.info(f"Flushed existing INPUT rules in {namespace}")
-        
-        run_command(f"ip netns exec {namespace} iptables -A INPUT -m state --state ESTABLISHED,RELATED -j ACCEPT")
-        logger.info("Added rule to allow established/related connections")
+        compiled = compile_policy(policy)
+        full_payload = build_restore_payload(compiled['rules'])
+        ipset_payload = build_ipset_payload(compiled['sets']) if compiled['sets'] else None
+        stale_sets = [name for name in subnet.get('policy_sets', []) if name not in compiled['sets']]
+        logger.info(f"Compiled {compiled['before']} policy rule(s) into {compiled['after']} "
+                    f"using {len(compiled['sets'])} ipset(s)")
         
-        run_command(f"ip netns exec {namespace} iptables -A INPUT -i lo -j ACCEPT")
-        logger.info("Added rule to allow loopback traffic")
+        installed = subnet.get('policy_rules')
+        if installed is not None:
+            update_payload, changes = build_update_payload(installed, compiled['rules'])
         
-        for rule in policy['ingress']:
-            port = rule['port']
-            protocol = rule['protocol']
-            action = rule['action']
+        for namespace in subnet_namespaces(subnet):
+            if ipset_payload:
+                run_command(f"ip netns exec {namespace} ipset restore", input=ipset_payload)
             
-            if action == 'allow':
-                iptables_action = 'ACCEPT'
+            if installed is None:
+                run_command(f"ip netns exec {namespace} iptables-restore -w --noflush", input=full_payload)
+                logger.info(f"Installed {', '.join(compiled['rules'])} in {namespace}")
+            elif update_payload:
+                result = run_command(f"ip netns exec {namespace} iptables-restore -w --noflush",
+                                     check=False, input=update_payload)
+                if result.returncode == 0:
+                    logger.info(f"Updated policy chains in {namespace} with {changes} rule change(s)")
+                else:
+                    logger.info(f"Installed rules in {namespace} drifted from state, rebuilding policy chains")
+                    run_command(f"ip netns exec {namespace} iptables-restore -w --noflush", input=full_payload)
             else:
-                iptables_action = 'DROP'
+                logger.info(f"Compiled rules for {namespace} are unchanged")
             
-            run_command(f"ip netns exec {namespace} iptables -A INPUT -p {protocol} --dport {port} -j {iptables_action}")
-            logger.info(f"Added rule: {action} {protocol}/{port} in {namespace}")
+            if stale_sets:
+                destroy_sets(namespace, stale_sets)
         
-        run_command(f"ip netns exec {namespace} iptables -A INPUT -j DROP")
-        logger.info(f"Added default DROP rule in {namespace}")
+        with update_state():
+            current = get_subnet(vpc_name, subnet_name)
+            current['policy_hash'] = new_hash
+            current['policy_rules'] = compiled['rules']
+            current['policy_sets'] = {name: list(peers) for name, peers in compiled['sets'].items()}
         
-        logger.info(f"Policy applied successfully to subnet '{subnet_name}' in VPC '{vpc_name}'")
+        elapsed = time.perf_counter() - start
+        commands = utils.command_count - commands_before
+        logger.info(f"Policy applied successfully to subnet '{subnet_name}' in VPC '{vpc_name}' "
+                    f"({commands} subprocess(es), {elapsed * 1000:.1f} ms)")
         return True
         
     except Exception as e:
@@ -90,26 +136,36 @@ def apply_policy(vpc_name, subnet_name, policy_file):
         return False
 
 def clear_policy(vpc_name, subnet_name):
+    with vpc_lock(vpc_name):
+        return _clear_policy(vpc_name, subnet_name)
+
+def _clear_policy(vpc_name, subnet_name):
     subnet = get_subnet(vpc_name, subnet_name)
     if not subnet:
         logger.error(f"Subnet '{subnet_name}' not found in VPC '{vpc_name}'")
         return False
     
-    namespace = subnet['namespace']
+    start = time.perf_counter()
+    commands_before = utils.command_count
     
     try:
-        run_command(f"ip netns exec {namespace} iptables -F")
-        logger.info(f"Flushed all iptables rules in {namespace}")
-        
-        run_command(f"ip netns exec {namespace} iptables -X")
-        logger.info(f"Deleted all custom chains in {namespace}")
+        payload = "*filter\n:INPUT ACCEPT [0:0]\n:FORWARD ACCEPT [0:0]\n:OUTPUT ACCEPT [0:0]\nCOMMIT\n"
+        for namespace in subnet_namespaces(subnet):
+            run_command(f"ip netns exec {namespace} iptables-restore -w", input=payload)
+            logger.info(f"Flushed all rules and custom chains in {namespace}, default policies set to ACCEPT")
+            if subnet.get('policy_sets'):
+                destroy_sets(namespace, list(subnet['policy_sets']))
         
-        run_command(f"ip netns exec {namespace} iptables -P INPUT ACCEPT")
-        run_command(f"ip netns exec {namespace} iptables -P FORWARD ACCEPT")
-        run_command(f"ip netns exec {namespace} iptables -P OUTPUT ACCEPT")
-        logger.info(f"Set default policies to ACCEPT in {namespace}")
+        with update_state():
+            current = get_subnet(vpc_name, subnet_name)
+            current.pop('policy_hash', None)
+            current.pop('policy_rules', None)
+            current.pop('policy_sets', None)
         
-        logger.info(f"Policy cleared successfully from subnet '{subnet_name}' in VPC '{vpc_name}'")
+        elapsed = time.perf_counter() - start
+        commands = utils.command_count - commands_before
+        logger.info(f"Policy cleared successfully from subnet '{subnet_name}' in VPC '{vpc_name}' "
+                    f"({commands} subprocess(es), {elapsed * 1000:.1f} ms)")
         return True
         
     except Exception as e:
@@ -0,0 +1,180 @@
+import hashlib
+import ipaddress
+from . import kernel
+from . import netfilter
+from .subnet import subnet_namespaces
+from .utils import (
+    logger,
+    validate_cidr
+)
+from .state import (
+    load_state,
+    update_state,
+    get_vpc,
+    get_hub,
+    vpc_lock
+)
+
+SET_PREFIX = "vpcctl-hub-"
+HUBS_LOCK = "global:hubs"
+
+def hub_lock(hub_name, *vpc_names):
+    return vpc_lock(f"hub:{hub_name}", *vpc_names)
+
+def hub_members(hub_name):
+    return [v['name'] for v in load_state()['vpcs'] if v.get('hub') == hub_name]
+
+def set_name(hub_name):
+    return f"{SET_PREFIX}{hashlib.sha1(hub_name.encode()).hexdigest()[:12]}"
+
+def create_hub(name, cidr):
+    try:
+        network = ipaddress.IPv4Network(cidr) if validate_cidr(cidr) else None
+    except ValueError:
+        network = None
+    if network is None:
+        logger.error(f"Invalid CIDR format: {cidr}")
+        return False
+
+    with hub_lock(name, HUBS_LOCK):
+        if get_hub(name):
+            logger.error(f"Transit hub '{name}' already exists")
+            return False
+
+        for hub in load_state().get('hubs', []):
+            if network.overlaps(ipaddress.IPv4Network(hub['cidr'])):
+                logger.error(f"CIDR {cidr} overlaps transit hub '{hub['name']}' ({hub['cidr']})")
+                return False
+
+        with update_state() as state:
+            state.setdefault('hubs', []).append({"name": name, "cidr": cidr, "set": set_name(name)})
+
+    logger.info(f"Transit hub '{name}' created for {cidr}")
+    return True
+
+def delete_hub(name, force=False):
+    members = hub_members(name)
+    while True:
+        with hub_lock(name, HUBS_LOCK, *members):
+            current = hub_members(name)
+            if set(current) == set(members):
+                return _delete_hub(name, members, force)
+        members = current
+
+def _delete_hub(name, members, force):
+    hub = get_hub(name)
+    if not hub:
+        logger.error(f"Transit hub '{name}' not found")
+        return False
+
+    if members and not force:
+        logger.error(f"Cannot delete transit hub '{name}': VPCs {', '.join(members)} are still attached")
+        return False
+
+    for vpc_name in members:
+        if not _detach_vpc(name, vpc_name):
+            return False
+
+    try:
+        netfilter.backend().delete_hub(hub)
+        with update_state() as state:
+            state['hubs'] = [h for h in state.get('hubs', []) if h['name'] != name]
+    except Exception as e:
+        logger.error(f"Failed to delete transit hub: {e}")
+        return False
+
+    logger.info(f"Transit hub '{name}' deleted")
+    return True
+
+def _set_hub_routes(vpc, cidr, add):
+    for subnet in vpc.get('subnets', []):
+        for namespace in subnet_namespaces(subnet):
+            with kernel.batch(namespace, check=False) as link:
+                if add:
+                    link.add_route(cidr, via=subnet['gateway'], replace=True)
+                else:
+                    link.del_route(cidr)
+    logger.info(f"{'Added' if add else 'Removed'} route to {cidr} in the namespaces of VPC '{vpc['name']}'")
+
+def attach_vpc(hub_name, vpc_name):
+    with hub_lock(hub_name, vpc_name):
+        return _attach_vpc(hub_name, vpc_name)
+
+def _attach_vpc(hub_name, vpc_name):
+    hub = get_hub(hub_name)
+    if not hub:
+        logger.error(f"Transit hub '{hub_name}' not found")
+        return False
+
+    vpc = get_vpc(vpc_name)
+    if not vpc:
+        logger.error(f"VPC '{vpc_name}' not found")
+        return False
+
+    if vpc.get('hub'):
+        logger.error(f"VPC '{vpc_name}' is already attached to transit hub '{vpc['hub']}'")
+        return False
+
+    if not ipaddress.IPv4Network(vpc['cidr']).subnet_of(ipaddress.IPv4Network(hub['cidr'])):
+        logger.error(f"VPC CIDR {vpc['cidr']} is not inside transit hub CIDR {hub['cidr']}")
+        return False
+
+    try:
+        netfilter.backend().attach_hub(vpc, hub)
+        _set_hub_routes(vpc, hub['cidr'], add=True)
+
+        with update_state():
+            get_vpc(vpc_name)['hub'] = hub_name
+
+        logger.info(f"VPC '{vpc_name}' attached to transit hub '{hub_name}'")
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to attach VPC to transit hub: {e}")
+        return False
+
+def detach_vpc(hub_name, vpc_name):
+    with hub_lock(hub_name, vpc_name):
+        return _detach_vpc(hub_name, vpc_name)
+
+def _detach_vpc(hub_name, vpc_name):
+    hub = get_hub(hub_name)
+    vpc = get_vpc(vpc_name)
+    if not hub or not vpc or vpc.get('hub') != hub_name:
+        logger.error(f"VPC '{vpc_name}' is not attached to transit hub '{hub_name}'")
+        return False
+
+    try:
+        _set_hub_routes(vpc, hub['cidr'], add=False)
+        release_vpc(vpc)
+        logger.info(f"VPC '{vpc_name}' detached from transit hub '{hub_name}'")
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to detach VPC from transit hub: {e}")
+        return False
+
+def release_vpc(vpc):
+    hub = get_hub(vpc['hub']) if vpc.get('hub') else None
+    if not hub:
+        return
+
+    netfilter.backend().detach_hub(vpc, hub)
+    with update_state():
+        current = get_vpc(vpc['name'])
+        if current:
+            current.pop('hub', None)
+
+def list_hubs():
+    hubs = load_state().get('hubs', [])
+
+    if not hubs:
+        logger.info("No transit hubs found")
+        return
+
+    print(f"\n{'Hub Name':<20} {'CIDR':<18} {'VPCs':<6} {'Members'}")
+    print("-" * 70)
+    for hub in hubs:
+        members = hub_members(hub['name'])
+        print(f"{hub['name']:<20} {hub['cidr']:<18} {len(members):<6} {', '.join(members)}")
+    print()
@@ -0,0 +1,50 @@
+import bisect
+import ipaddress
+
+def host_range(network):
+    if network.prefixlen >= network.max_prefixlen - 1:
+        return 0, network.num_addresses - 1
+    return 1, network.num_addresses - 2
+
+def offset_of(network, ip):
+    return int(ipaddress.ip_address(ip)) - int(network.network_address)
+
+def new_pool(cidr):
+    first, _ = host_range(ipaddress.ip_network(cidr, strict=False))
+    return {"next": first, "free": []}
+
+def subnet_pool(subnet):
+    if 'ipam' not in subnet:
+        network = ipaddress.ip_network(subnet['cidr'], strict=False)
+        used = [subnet['gateway'], subnet['ip']] + [i['ip'] for i in subnet.get('instances', [])]
+        subnet['ipam'] = {"next": max(offset_of(network, ip) for ip in used) + 1, "free": []}
+    return subnet['ipam']
+
+def allocate(pool, cidr):
+    network = ipaddress.ip_network(cidr, strict=False)
+    if pool['free']:
+        return str(network.network_address + pool['free'].pop())
+
+    _, last = host_range(network)
+    offset = pool['next']
+    if offset > last:
+        raise ValueError(f"No free addresses left in {cidr}")
+    pool['next'] = offset + 1
+    return str(network.network_address + offset)
+
+def release(pool, cidr, ip):
+    network = ipaddress.ip_network(cidr, strict=False)
+    offset = offset_of(network, ip)
+    first, _ = host_range(network)
+    if not first <= offset < pool['next']:
+        raise ValueError(f"{ip} was not allocated from {cidr}")
+
+    free = pool['free']
+    index = bisect.bisect_left(free, offset)
+    if index < len(free) and free[index] == offset:
+        raise ValueError(f"{ip} is already free in {cidr}")
+
+    if offset == pool['next'] - 1:
+        pool['next'] = offset
+    else:
+        free.insert(index, offset)
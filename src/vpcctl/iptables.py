@@ -0,0 +1,298 @@
+import hashlib
+import ipaddress
+from .utils import (
+    logger,
+    run_command
+)
+from .policy import build_ipset_payload
+from .state import (
+    load_state,
+    update_state,
+    get_vpc
+)
+
+CHAIN_PREFIX = "VPCCTL-"
+MAX_CHAIN_NAME = 28
+BRIDGE_WILDCARD = "br-+"
+CONNTRACK_RULE = f"FORWARD -o {BRIDGE_WILDCARD} -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT"
+VPC_SET = "vpcctl-vpcs"
+ISOLATION_RULE = f"-m set --match-set {VPC_SET} dst -j DROP"
+
+def chain_name(vpc_name):
+    chain = f"{CHAIN_PREFIX}{vpc_name}"
+    if len(chain) > MAX_CHAIN_NAME:
+        digest = hashlib.sha1(vpc_name.encode()).hexdigest()
+        chain = f"{CHAIN_PREFIX}{digest[:MAX_CHAIN_NAME - len(CHAIN_PREFIX)]}"
+    return chain
+
+def vpc_cidr(vpc):
+    return str(ipaddress.IPv4Network(vpc['cidr'], strict=False))
+
+def canonical_rule(rule):
+    tokens = rule.split()
+    for index, token in enumerate(tokens[:-1]):
+        if token in ('-s', '-d'):
+            tokens[index + 1] = str(ipaddress.IPv4Network(tokens[index + 1], strict=False))
+    return " ".join(tokens)
+
+def jump_rules(vpc):
+    chain = chain_name(vpc['name'])
+    return [
+        ("filter", f"FORWARD -i {vpc['bridge']} -j {chain}"),
+        ("nat", f"POSTROUTING -s {vpc_cidr(vpc)} -j {chain}")
+    ]
+
+def ensure_rule(table, rule):
+    if run_command(f"iptables -w -t {table} -C {rule}", check=False).returncode != 0:
+        run_command(f"iptables -w -t {table} -I {rule}")
+        logger.info(f"Inserted iptables rule: -t {table} {rule}")
+
+def build_chain_payload(vpc, ledger):
+    chain = chain_name(vpc['name'])
+    lines = ["*filter", f":{chain} - [0:0]"]
+    lines += [f"-A {chain} {rule}" for rule in ledger['filter']]
+    lines += [f"-A {chain} {ISOLATION_RULE}", "COMMIT"]
+    lines += ["*nat", f":{chain} - [0:0]"]
+    lines += [f"-A {chain} {rule}" for rule in ledger['nat']]
+    lines += ["COMMIT"]
+    return "\n".join(lines) + "\n"
+
+def sync_chain(vpc_name, ensure_jumps=False):
+    vpc = get_vpc(vpc_name)
+    if not vpc:
+        return
+    ledger = vpc['iptables']
+    ensure_jumps = ensure_jumps or not ledger.get('jumps')
+    payload = build_chain_payload(vpc, ledger)
+
+    if ensure_jumps:
+        ensure_vpc_set([vpc])
+    result = run_command("iptables-restore -w --noflush", check=False, input=payload)
+    if result.returncode != 0:
+        logger.debug(f"Restoring {chain_name(vpc_name)} failed, re-creating the {VPC_SET} set and retrying")
+        ensure_vpc_set(load_state()['vpcs'])
+        run_command("iptables-restore -w --noflush", input=payload)
+
+    if ensure_jumps:
+        ensure_rule("filter", CONNTRACK_RULE)
+        for table, rule in jump_rules(vpc):
+            ensure_rule(table, rule)
+        with update_state():
+            get_vpc(vpc_name)['iptables']['jumps'] = True
+
+    logger.info(f"Synced chain {chain_name(vpc_name)} ({len(ledger['filter'])} filter, {len(ledger['nat'])} nat rules)")
+
+def ensure_vpc_set(vpcs):
+    run_command("ipset restore", input=build_ipset_payload({VPC_SET: [vpc_cidr(v) for v in vpcs]}))
+
+def update_ledger(vpc_name, add=(), remove=(), force=False):
+    changed = False
+    with update_state():
+        vpc = get_vpc(vpc_name)
+        if not vpc:
+            return False
+        ledger = vpc.setdefault('iptables', {"chain": chain_name(vpc_name), "filter": [], "nat": []})
+
+        for table, rule in remove:
+            if rule in ledger[table]:
+                ledger[table].remove(rule)
+                changed = True
+
+        for table, rule in add:
+            if rule not in ledger[table]:
+                ledger[table].append(rule)
+                changed = True
+
+    if changed or force or not ledger.get('jumps'):
+        sync_chain(vpc_name, ensure_jumps=force)
+    return changed
+
+def register_vpc(vpc):
+    bridge = vpc['bridge']
+    update_ledger(vpc['name'], add=[("filter", f"-o {bridge} -j ACCEPT")], force=True)
+
+def unregister_vpc(vpc):
+    chain = chain_name(vpc['name'])
+    lines = []
+    for table, rule in jump_rules(vpc):
+        lines += [f"*{table}", f"-D {rule}", f"-F {chain}", f"-X {chain}", "COMMIT"]
+
+    result = run_command("iptables-restore -w --noflush", check=False, input="\n".join(lines) + "\n")
+    if result.returncode != 0:
+        logger.debug(f"Atomic teardown of {chain} failed, removing rules one by one")
+        for table, rule in jump_rules(vpc):
+            run_command(f"iptables -w -t {table} -D {rule}", check=False)
+            run_command(f"iptables -w -t {table} -F {chain}", check=False)
+            run_command(f"iptables -w -t {table} -X {chain}", check=False)
+    run_command(f"ipset del {VPC_SET} {vpc_cidr(vpc)} -exist", check=False)
+    if vpc.get('ct_zone'):
+        clear_ct_zone(vpc)
+
+    logger.info(f"Removed chain {chain} and its jumps")
+
+def zone_rule(vpc):
+    return f"PREROUTING -i {vpc['bridge']} -j CT --zone-orig {vpc['ct_zone']}"
+
+def set_ct_zone(vpc):
+    ensure_rule("raw", zone_rule(vpc))
+
+def clear_ct_zone(vpc):
+    run_command(f"iptables -w -t raw -D {zone_rule(vpc)}", check=False)
+    logger.info(f"Removed conntrack zone {vpc['ct_zone']} from {vpc['bridge']}")
+
+def allow_intra_vpc(vpc):
+    bridge = vpc['bridge']
+    update_ledger(vpc['name'], add=[("filter", f"-o {bridge} -j ACCEPT")])
+
+def nat_rule(vpc, uplink):
+    if uplink['address']:
+        return f"-s {vpc_cidr(vpc)} -o {uplink['interface']} -j SNAT --to-source {uplink['address']}"
+    return f"-s {vpc_cidr(vpc)} -o {uplink['interface']} -j MASQUERADE"
+
+def _is_nat_rule(rule):
+    return rule.endswith(" -j MASQUERADE") or " -j SNAT " in rule
+
+def _stale_nat(ledger, keep=None):
+    stale = [rule for rule in ledger['nat'] if _is_nat_rule(rule) and rule != keep]
+    interfaces = {rule.split(" -o ")[1].split()[0] for rule in stale}
+    if keep:
+        interfaces.discard(keep.split(" -o ")[1].split()[0])
+    return [("nat", rule) for rule in stale] + [("filter", f"-o {dev} -j ACCEPT") for dev in sorted(interfaces)]
+
+def setup_nat(vpc, uplink, previous=None):
+    current = get_vpc(vpc['name'])
+    rule = nat_rule(vpc, uplink)
+    remove = _stale_nat(current['iptables'], keep=rule) if current and 'iptables' in current else []
+    update_ledger(vpc['name'], add=[
+        ("filter", f"-o {uplink['interface']} -j ACCEPT"),
+        ("nat", rule)
+    ], remove=remove)
+    logger.info(f"NAT for {vpc['cidr']} on {uplink['interface']} recorded in {chain_name(vpc['name'])}")
+
+def remove_nat(vpc, uplink=None):
+    current = get_vpc(vpc['name'])
+    if not current or 'iptables' not in current:
+        return
+    update_ledger(vpc['name'], remove=_stale_nat(current['iptables']))
+
+def allow_peering(vpc1, vpc2):
+    update_ledger(vpc1['name'], add=[("filter", f"-o {vpc2['bridge']} -j ACCEPT")])
+    update_ledger(vpc2['name'], add=[("filter", f"-o {vpc1['bridge']} -j ACCEPT")])
+    logger.info(f"Allowed forwarding between {vpc1['bridge']} and {vpc2['bridge']}")
+
+def revoke_peering(vpc1, vpc2):
+    update_ledger(vpc1['name'], remove=[("filter", f"-o {vpc2['bridge']} -j ACCEPT")])
+    update_ledger(vpc2['name'], remove=[("filter", f"-o {vpc1['bridge']} -j ACCEPT")])
+    logger.info(f"Revoked forwarding between {vpc1['bridge']} and {vpc2['bridge']}")
+
+def hub_rule(hub):
+    return ("filter", f"-m set --match-set {hub['set']} dst -j ACCEPT")
+
+def attach_hub(vpc, hub):
+    run_command("ipset restore", input=build_ipset_payload({hub['set']: [vpc_cidr(vpc)]}))
+    update_ledger(vpc['name'], add=[hub_rule(hub)])
+    logger.info(f"Added {vpc['cidr']} to hub set {hub['set']}")
+
+def detach_hub(vpc, hub):
+    update_ledger(vpc['name'], remove=[hub_rule(hub)])
+    run_command(f"ipset del {hub['set']} {vpc_cidr(vpc)} -exist", check=False)
+    logger.info(f"Removed {vpc['cidr']} from hub set {hub['set']}")
+
+def delete_hub(hub):
+    run_command(f"ipset destroy {hub['set']}", check=False)
+
+def find_orphans(vpcs):
+    result = run_command("iptables-save", check=False)
+    if result.returncode != 0:
+        logger.debug(f"iptables-save failed: {result.stderr}")
+        return _orphan_hub_sets()
+
+    return _orphan_rules(vpcs, result.stdout.splitlines()) + _orphan_hub_sets()
+
+def _orphan_rules(vpcs, saved):
+    known = {chain_name(v['name']) for v in vpcs}
+    zones = {zone_rule(v) for v in vpcs if v.get('ct_zone')}
+    chains = {}
+    rules = {}
+    table = None
+
+    for line in saved:
+        if line.startswith('*'):
+            table = line[1:]
+        elif line.startswith(f":{CHAIN_PREFIX}"):
+            chain = line[1:].split()[0]
+            if chain not in known:
+                chains.setdefault(table, []).append(chain)
+        elif line.startswith("-A ") and f" -j {CHAIN_PREFIX}" in line:
+            target = line.split(" -j ")[-1].split()[0]
+            if target not in known:
+                rules.setdefault(table, []).append(line[3:])
+        elif table == "raw" and line.startswith("-A PREROUTING ") and " -j CT --zone-orig " in line:
+            if line[3:] not in zones:
+                rules.setdefault(table, []).append(line[3:])
+
+    if not chains and not rules:
+        return []
+
+    lines = []
+    for table in sorted(set(chains) | set(rules)):
+        lines.append(f"*{table}")
+        lines += [f"-D {rule}" for rule in rules.get(table, [])]
+        lines += [f"-F {chain}" for chain in chains.get(table, [])]
+        lines += [f"-X {chain}" for chain in chains.get(table, [])]
+        lines.append("COMMIT")
+    payload = "\n".join(lines) + "\n"
+
+    names = sorted({chain for table_chains in chains.values() for chain in table_chains})
+    zone_count = len(rules.get("raw", []))
+    description = ", ".join(filter(None, [
+        f"iptables chains {', '.join(names)}" if names else "",
+        f"{zone_count} conntrack zone rule(s)" if zone_count else ""
+    ]))
+    return [(description, run_command, ("iptables-restore -w --noflush",), {"check": False, "input": payload})]
+
+def find_drift(vpcs):
+    result = run_command("iptables-save", check=False)
+    if result.returncode != 0:
+        logger.debug(f"iptables-save failed: {result.stderr}")
+        return []
+
+    live = set()
+    chains = {}
+    table = None
+    for line in result.stdout.splitlines():
+        if line.startswith('*'):
+            table = line[1:]
+        elif line.startswith("-A "):
+            live.add((table, line[3:]))
+            chain, _, rule = line[3:].partition(" ")
+            chains.setdefault((table, chain), []).append(rule)
+
+    tasks = []
+    for vpc in vpcs:
+        ledger = vpc.get('iptables')
+        if not ledger:
+            continue
+        chain = chain_name(vpc['name'])
+        filter_rules = [canonical_rule(rule) for rule in ledger['filter'] + [ISOLATION_RULE]]
+        nat_rules = [canonical_rule(rule) for rule in ledger['nat']]
+        if (chains.get(("filter", chain), []) != filter_rules
+                or chains.get(("nat", chain), []) != nat_rules
+                or not live.issuperset(jump_rules(vpc))):
+            tasks.append((f"iptables chain {chain}", sync_chain,
+                          (vpc['name'],), {"ensure_jumps": True}))
+        if vpc.get('ct_zone') and ("raw", zone_rule(vpc)) not in live:
+            tasks.append((f"conntrack zone rule on {vpc['bridge']}", set_ct_zone, (vpc,), {}))
+    return tasks
+
+def _orphan_hub_sets():
+    from .hub import SET_PREFIX
+
+    result = run_command("ipset list -n", check=False)
+    if result.returncode != 0:
+        logger.debug(f"ipset list failed: {result.stderr}")
+        return []
+
+    known = {h['set'] for h in load_state().get('hubs', [])}
+    stale = [name for name in result.stdout.split() if name.startswith(SET_PREFIX) and name not in known]
+    return [(f"ipset {name}", run_command, (f"ipset destroy {name}",), {"check": False}) for name in stale]
@@ -0,0 +1,217 @@
+from . import utils
+from . import profiling
+from .utils import logger, run_command, run_ip_batch
+
+LINK_ALIAS = "vpcctl"
+
+_netlink_available = None
+
+def use_netlink():
+    global _netlink_available
+    if utils.NETWORK_BACKEND == "ip":
+        return False
+
+    if _netlink_available is None:
+        try:
+            from . import netlink
+            netlink.get_socket()
+            _netlink_available = True
+        except (ImportError, OSError) as e:
+            logger.debug(f"Netlink backend unavailable, falling back to ip: {e}")
+            _netlink_available = False
+
+    return _netlink_available
+
+def _link_options(mtu=None, txqueuelen=None, queues=None):
+    options = ""
+    if mtu:
+        options += f" mtu {mtu}"
+    if txqueuelen:
+        options += f" txqueuelen {txqueuelen}"
+    if queues:
+        options += f" numtxqueues {queues} numrxqueues {queues}"
+    return options
+
+class IpBatch:
+    def __init__(self, namespace=None, check=True):
+        self.namespace = namespace
+        self.check = check
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def commit(self):
+        if not self.commands:
+            return
+        commands, self.commands = self.commands, []
+        if self.check:
+            run_ip_batch(commands, self.namespace)
+        else:
+            netns_option = f"-n {self.namespace} " if self.namespace else ""
+            run_command(f"ip {netns_option}-force -batch -", check=False, input="\n".join(commands) + "\n")
+
+    def add_netns(self, name):
+        self.commands.append(f"netns add {name}")
+
+    def del_netns(self, name):
+        self.commands.append(f"netns del {name}")
+
+    def add_bridge(self, name):
+        self.commands.append(f"link add {name} type bridge")
+        self.commands.append(f"link set {name} alias {LINK_ALIAS}")
+
+    def add_veth(self, name, peer, peer_namespace=None, mtu=None, txqueuelen=None, queues=None):
+        netns_option = f" netns {peer_namespace}" if peer_namespace else ""
+        options = _link_options(mtu, txqueuelen, queues)
+        self.commands.append(f"link add {name}{options} type veth peer name {peer}{options}{netns_option}")
+        for link in (name,) if peer_namespace else (name, peer):
+            self.commands.append(f"link set {link} alias {LINK_ALIAS}")
+
+    def del_link(self, name):
+        self.commands.append(f"link del {name}")
+
+    def set_up(self, name):
+        self.commands.append(f"link set {name} up")
+
+    def set_master(self, name, master):
+        self.commands.append(f"link set {name} master {master}")
+
+    def set_options(self, name, mtu=None, txqueuelen=None):
+        options = _link_options(mtu, txqueuelen)
+        if options:
+            self.commands.append(f"link set {name}{options}")
+
+    def set_netns(self, name, namespace):
+        self.commands.append(f"link set {name} netns {namespace}")
+
+    def add_addr(self, cidr, dev):
+        self.commands.append(f"addr add {cidr} dev {dev}")
+
+    def del_addr(self, cidr, dev):
+        self.commands.append(f"addr del {cidr} dev {dev}")
+
+    def add_route(self, dst, via=None, dev=None, replace=False):
+        command = f"route {'replace' if replace else 'add'} {dst}"
+        if via:
+            command += f" via {via}"
+        if dev:
+            command += f" dev {dev}"
+        self.commands.append(command)
+
+    def del_route(self, dst):
+        self.commands.append(f"route del {dst}")
+
+class NetlinkBatch:
+    def __init__(self, namespace=None, check=True):
+        self.namespace = namespace
+        self.check = check
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def commit(self):
+        pass
+
+    def _run(self, description, func, *args, **kwargs):
+        logger.debug(f"Netlink{f' [{self.namespace}]' if self.namespace else ''}: {description}")
+        try:
+            with profiling.span(f"netlink {' '.join(description.split()[:2])}", "netlink", op=description):
+                func(*args, **kwargs)
+        except OSError as e:
+            if self.check:
+                raise RuntimeError(f"Netlink operation failed: {description}: {e.strerror}") from e
+            logger.debug(f"Ignoring netlink error for {description}: {e.strerror}")
+
+    def _socket(self):
+        from . import netlink
+        return netlink.get_socket(self.namespace)
+
+    def add_netns(self, name):
+        from . import netlink
+        self._run(f"netns add {name}", netlink.create_netns, name)
+
+    def del_netns(self, name):
+        from . import netlink
+        self._run(f"netns del {name}", netlink.delete_netns, name)
+
+    def add_bridge(self, name):
+        self._run(f"link add {name} type bridge", self._socket().add_link, name, "bridge")
+        self._run(f"link set {name} alias {LINK_ALIAS}", self._socket().set_link, name, alias=LINK_ALIAS)
+
+    def add_veth(self, name, peer, peer_namespace=None, mtu=None, txqueuelen=None, queues=None):
+        self._run(f"link add {name}{_link_options(mtu, txqueuelen, queues)} type veth peer name {peer}",
+                  self._socket().add_link, name, "veth", peer=peer, peer_namespace=peer_namespace,
+                  mtu=mtu, txqueuelen=txqueuelen, queues=queues)
+        for link in (name,) if peer_namespace else (name, peer):
+            self._run(f"link set {link} alias {LINK_ALIAS}", self._socket().set_link, link, alias=LINK_ALIAS)
+
+    def del_link(self, name):
+        self._run(f"link del {name}", self._socket().del_link, name)
+
+    def set_up(self, name):
+        self._run(f"link set {name} up", self._socket().set_link, name, up=True)
+
+    def set_master(self, name, master):
+        self._run(f"link set {name} master {master}", self._socket().set_link, name, master=master)
+
+    def set_options(self, name, mtu=None, txqueuelen=None):
+        options = _link_options(mtu, txqueuelen)
+        if options:
+            self._run(f"link set {name}{options}", self._socket().set_link, name, mtu=mtu, txqueuelen=txqueuelen)
+
+    def set_netns(self, name, namespace):
+        self._run(f"link set {name} netns {namespace}", self._socket().set_link, name, namespace=namespace)
+
+    def add_addr(self, cidr, dev):
+        self._run(f"addr add {cidr} dev {dev}", self._socket().add_addr, cidr, dev)
+
+    def del_addr(self, cidr, dev):
+        self._run(f"addr del {cidr} dev {dev}", self._socket().del_addr, cidr, dev)
+
+    def add_route(self, dst, via=None, dev=None, replace=False):
+        self._run(f"route add {dst} via {via}", self._socket().add_route, dst, via=via, dev=dev, replace=replace)
+
+    def del_route(self, dst):
+        self._run(f"route del {dst}", self._socket().del_route, dst)
+
+def batch(namespace=None, check=True):
+    if use_netlink():
+        return NetlinkBatch(namespace, check)
+    return IpBatch(namespace, check)
+
+def default_route():
+    if use_netlink():
+        from . import netlink
+        try:
+            return netlink.get_socket().default_route()
+        except OSError as e:
+            logger.debug(f"Netlink default route lookup failed, falling back to ip: {e}")
+
+    result = run_command("ip route show default", check=True)
+    parts = result.stdout.split()
+    dev = parts[parts.index('dev') + 1] if 'dev' in parts[:-1] else None
+    gateway = parts[parts.index('via') + 1] if 'via' in parts[:-1] else None
+    return dev, gateway
+
+def interface_address(dev):
+    if use_netlink():
+        from . import netlink
+        try:
+            return netlink.get_socket().interface_address(dev)
+        except OSError as e:
+            logger.debug(f"Netlink address lookup failed, falling back to ip: {e}")
+
+    result = run_command(f"ip -4 -o addr show dev {dev}", check=False)
+    parts = result.stdout.split()
+    if 'inet' not in parts[:-1]:
+        return None
+    return parts[parts.index('inet') + 1].split('/')[0]
@@ -0,0 +1,8 @@
+from . import utils
+
+def backend():
+    if utils.FIREWALL_BACKEND == "nftables":
+        from . import nftables
+        return nftables
+    from . import iptables
+    return iptables
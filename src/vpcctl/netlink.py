@@ -0,0 +1,343 @@
+import ctypes
+import ipaddress
+import os
+import socket
+import struct
+import threading
+from .netns import NETNS_RUN_DIR, run_in_namespace
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_REPLACE = 0x100
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+
+IFF_UP = 0x1
+
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_MASTER = 10
+IFLA_TXQLEN = 13
+IFLA_IFALIAS = 20
+IFLA_LINKINFO = 18
+IFLA_NET_NS_FD = 28
+IFLA_NUM_TX_QUEUES = 31
+IFLA_NUM_RX_QUEUES = 32
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+VETH_INFO_PEER = 1
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_TABLE = 15
+
+RT_TABLE_MAIN = 254
+RTPROT_BOOT = 3
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_LINK = 253
+RT_SCOPE_NOWHERE = 255
+RTN_UNICAST = 1
+
+MS_BIND = 4096
+MS_REC = 16384
+MS_SHARED = 1 << 20
+MNT_DETACH = 2
+
+NLMSG_HEADER = struct.Struct("=IHHII")
+NLATTR = struct.Struct("=HH")
+IFINFOMSG = struct.Struct("=BxHiII")
+IFADDRMSG = struct.Struct("=BBBBI")
+RTMSG = struct.Struct("=BBBBBBBBI")
+
+RECV_BUFFER = 1 << 16
+
+_sockets = {}
+_sockets_lock = threading.Lock()
+_netns_dir_shared = False
+
+def _align(length):
+    return (length + 3) & ~3
+
+def attr(attr_type, payload):
+    if isinstance(payload, str):
+        payload = payload.encode() + b"\0"
+    length = NLATTR.size + len(payload)
+    return NLATTR.pack(length, attr_type) + payload + b"\0" * (_align(length) - length)
+
+def parse_attrs(data):
+    attrs = {}
+    offset = 0
+    while offset + NLATTR.size <= len(data):
+        length, attr_type = NLATTR.unpack_from(data, offset)
+        if length < NLATTR.size:
+            break
+        attrs[attr_type & 0x3fff] = data[offset + NLATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+def _link_attrs(mtu=None, txqueuelen=None, queues=None):
+    attrs = b""
+    if mtu:
+        attrs += attr(IFLA_MTU, struct.pack("=I", mtu))
+    if txqueuelen:
+        attrs += attr(IFLA_TXQLEN, struct.pack("=I", txqueuelen))
+    if queues:
+        attrs += attr(IFLA_NUM_TX_QUEUES, struct.pack("=I", queues))
+        attrs += attr(IFLA_NUM_RX_QUEUES, struct.pack("=I", queues))
+    return attrs
+
+def _open_socket(groups=0):
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.bind((0, groups))
+    return sock
+
+def subscribe(groups):
+    return _open_socket(groups)
+
+class NetlinkSocket:
+    def __init__(self, namespace=None):
+        self.namespace = namespace
+        if namespace is None:
+            self.sock = _open_socket()
+        else:
+            self.sock = run_in_namespace(namespace, _open_socket)
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.sock.close()
+
+    def request(self, msg_type, flags, payload, dump=False):
+        with self.lock:
+            self.seq += 1
+            seq = self.seq
+            flags |= NLM_F_REQUEST | (NLM_F_DUMP if dump else NLM_F_ACK)
+            header = NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload), msg_type, flags, seq, 0)
+            self.sock.send(header + payload)
+
+            messages = []
+            while True:
+                data = self.sock.recv(RECV_BUFFER)
+                offset = 0
+                while offset + NLMSG_HEADER.size <= len(data):
+                    length, reply_type, _, reply_seq, _ = NLMSG_HEADER.unpack_from(data, offset)
+                    body = data[offset + NLMSG_HEADER.size:offset + length]
+                    offset += _align(length)
+
+                    if reply_seq != seq:
+                        continue
+                    if reply_type == NLMSG_ERROR:
+                        error = struct.unpack_from("=i", body)[0]
+                        if error:
+                            raise OSError(-error, os.strerror(-error))
+                        return messages
+                    if reply_type == NLMSG_DONE:
+                        return messages
+                    messages.append((reply_type, body))
+
+    def link_index(self, name):
+        payload = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) + attr(IFLA_IFNAME, name)
+        messages = self.request(RTM_GETLINK, 0, payload)
+        return IFINFOMSG.unpack_from(messages[0][1])[2]
+
+    def link_name(self, index):
+        messages = self.request(RTM_GETLINK, 0, IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, 0, 0))
+        attrs = parse_attrs(messages[0][1][IFINFOMSG.size:])
+        return attrs[IFLA_IFNAME].rstrip(b"\0").decode()
+
+    def add_link(self, name, kind, peer=None, peer_namespace=None, mtu=None, txqueuelen=None, queues=None):
+        info = attr(IFLA_INFO_KIND, kind)
+        options = _link_attrs(mtu, txqueuelen, queues)
+        netns_fd = None
+
+        try:
+            if peer:
+                peer_msg = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) + attr(IFLA_IFNAME, peer) + options
+                if peer_namespace:
+                    netns_fd = os.open(NETNS_RUN_DIR / peer_namespace, os.O_RDONLY)
+                    peer_msg += attr(IFLA_NET_NS_FD, struct.pack("=I", netns_fd))
+                info += attr(IFLA_INFO_DATA, attr(VETH_INFO_PEER, peer_msg))
+
+            payload = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+            payload += attr(IFLA_IFNAME, name) + options + attr(IFLA_LINKINFO, info)
+            self.request(RTM_NEWLINK, NLM_F_CREATE | NLM_F_EXCL, payload)
+        finally:
+            if netns_fd is not None:
+                os.close(netns_fd)
+
+    def set_link(self, name, up=None, master=None, namespace=None, mtu=None, txqueuelen=None, alias=None):
+        flags = change = 0
+        if up is not None:
+            change = IFF_UP
+            flags = IFF_UP if up else 0
+
+        payload = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, flags, change) + attr(IFLA_IFNAME, name)
+        if master:
+            payload += attr(IFLA_MASTER, struct.pack("=I", self.link_index(master)))
+        payload += _link_attrs(mtu, txqueuelen)
+        if alias:
+            payload += attr(IFLA_IFALIAS, alias)
+
+        netns_fd = None
+        try:
+            if namespace:
+                netns_fd = os.open(NETNS_RUN_DIR / namespace, os.O_RDONLY)
+                payload += attr(IFLA_NET_NS_FD, struct.pack("=I", netns_fd))
+            self.request(RTM_NEWLINK, 0, payload)
+        finally:
+            if netns_fd is not None:
+                os.close(netns_fd)
+
+    def del_link(self, name):
+        payload = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) + attr(IFLA_IFNAME, name)
+        self.request(RTM_DELLINK, 0, payload)
+
+    def _addr_payload(self, cidr, dev):
+        interface = ipaddress.ip_interface(cidr)
+        address = interface.ip.packed
+        payload = IFADDRMSG.pack(socket.AF_INET, interface.network.prefixlen, 0,
+                                 RT_SCOPE_UNIVERSE, self.link_index(dev))
+        return payload + attr(IFA_LOCAL, address) + attr(IFA_ADDRESS, address)
+
+    def add_addr(self, cidr, dev):
+        self.request(RTM_NEWADDR, NLM_F_CREATE | NLM_F_EXCL, self._addr_payload(cidr, dev))
+
+    def del_addr(self, cidr, dev):
+        self.request(RTM_DELADDR, 0, self._addr_payload(cidr, dev))
+
+    def add_route(self, dst, via=None, dev=None, replace=False):
+        network = ipaddress.ip_network("0.0.0.0/0" if dst == "default" else dst, strict=False)
+        scope = RT_SCOPE_UNIVERSE if via else RT_SCOPE_LINK
+        payload = RTMSG.pack(socket.AF_INET, network.prefixlen, 0, 0, RT_TABLE_MAIN,
+                             RTPROT_BOOT, scope, RTN_UNICAST, 0)
+        if network.prefixlen:
+            payload += attr(RTA_DST, network.network_address.packed)
+        if via:
+            payload += attr(RTA_GATEWAY, ipaddress.ip_address(via).packed)
+        if dev:
+            payload += attr(RTA_OIF, struct.pack("=I", self.link_index(dev)))
+
+        flags = NLM_F_CREATE | (NLM_F_REPLACE if replace else NLM_F_EXCL)
+        self.request(RTM_NEWROUTE, flags, payload)
+
+    def del_route(self, dst):
+        network = ipaddress.ip_network("0.0.0.0/0" if dst == "default" else dst, strict=False)
+        payload = RTMSG.pack(socket.AF_INET, network.prefixlen, 0, 0, RT_TABLE_MAIN,
+                             0, RT_SCOPE_NOWHERE, 0, 0)
+        if network.prefixlen:
+            payload += attr(RTA_DST, network.network_address.packed)
+        self.request(RTM_DELROUTE, 0, payload)
+
+    def default_route(self):
+        payload = RTMSG.pack(socket.AF_INET, 0, 0, 0, 0, 0, 0, 0, 0)
+        for _, body in self.request(RTM_GETROUTE, 0, payload, dump=True):
+            _, dst_len, _, _, table, _, _, route_type, _ = RTMSG.unpack_from(body)
+            attrs = parse_attrs(body[RTMSG.size:])
+            if RTA_TABLE in attrs:
+                table = struct.unpack("=I", attrs[RTA_TABLE])[0]
+            if dst_len or table != RT_TABLE_MAIN or route_type != RTN_UNICAST or RTA_OIF not in attrs:
+                continue
+
+            dev = self.link_name(struct.unpack("=I", attrs[RTA_OIF])[0])
+            gateway = None
+            if RTA_GATEWAY in attrs:
+                gateway = str(ipaddress.ip_address(attrs[RTA_GATEWAY]))
+            return dev, gateway
+        return None, None
+
+    def interface_address(self, dev):
+        index = self.link_index(dev)
+        payload = IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0)
+        for _, body in self.request(RTM_GETADDR, 0, payload, dump=True):
+            _, _, _, _, addr_index = IFADDRMSG.unpack_from(body)
+            attrs = parse_attrs(body[IFADDRMSG.size:])
+            if addr_index == index and IFA_LOCAL in attrs:
+                return str(ipaddress.ip_address(attrs[IFA_LOCAL]))
+        return None
+
+def get_socket(namespace=None):
+    with _sockets_lock:
+        sock = _sockets.get(namespace)
+        if sock is None:
+            sock = NetlinkSocket(namespace)
+            _sockets[namespace] = sock
+        return sock
+
+def close_socket(namespace):
+    with _sockets_lock:
+        sock = _sockets.pop(namespace, None)
+    if sock:
+        sock.close()
+
+def _libc_call(name, *args):
+    libc = ctypes.CDLL(None, use_errno=True)
+    if getattr(libc, name)(*args) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+def _ensure_netns_dir():
+    global _netns_dir_shared
+    if _netns_dir_shared:
+        return
+
+    NETNS_RUN_DIR.mkdir(parents=True, exist_ok=True)
+    run_dir = str(NETNS_RUN_DIR).encode()
+    try:
+        _libc_call("mount", b"", run_dir, b"none", ctypes.c_ulong(MS_SHARED | MS_REC), None)
+    except OSError:
+        _libc_call("mount", run_dir, run_dir, b"none", ctypes.c_ulong(MS_BIND | MS_REC), None)
+        _libc_call("mount", b"", run_dir, b"none", ctypes.c_ulong(MS_SHARED | MS_REC), None)
+    _netns_dir_shared = True
+
+def create_netns(name):
+    _ensure_netns_dir()
+    path = NETNS_RUN_DIR / name
+    os.close(os.open(path, os.O_RDONLY | os.O_CREAT | os.O_EXCL, 0))
+
+    outcome = {}
+
+    def target():
+        try:
+            os.unshare(os.CLONE_NEWNET)
+            _libc_call("mount", b"/proc/thread-self/ns/net", str(path).encode(), b"none",
+                       ctypes.c_ulong(MS_BIND), None)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, name=f"netns-add-{name}")
+    thread.start()
+    thread.join()
+
+    if 'error' in outcome:
+        path.unlink(missing_ok=True)
+        raise outcome['error']
+
+def delete_netns(name):
+    close_socket(name)
+    path = NETNS_RUN_DIR / name
+    _libc_call("umount2", str(path).encode(), MNT_DETACH)
+    path.unlink()
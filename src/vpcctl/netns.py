@@ -0,0 +1,42 @@
+import contextvars
+import os
+import threading
+from pathlib import Path
+
+NETNS_RUN_DIR = Path("/run/netns")
+
+def enter_namespace(namespace):
+    fd = os.open(NETNS_RUN_DIR / namespace, os.O_RDONLY)
+    try:
+        os.setns(fd, os.CLONE_NEWNET)
+    finally:
+        os.close(fd)
+
+def run_in_namespace(namespace, func, *args, **kwargs):
+    outcome = {}
+
+    def target():
+        try:
+            enter_namespace(namespace)
+            outcome['value'] = func(*args, **kwargs)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(target,), name=f"netns-{namespace}")
+    thread.start()
+    thread.join()
+
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['value']
+
+def run_in_subnet(vpc_name, subnet_name, func, *args, **kwargs):
+    from .state import get_subnet
+    subnet = get_subnet(vpc_name, subnet_name)
+    if not subnet:
+        raise LookupError(f"Subnet '{subnet_name}' not found in VPC '{vpc_name}'")
+    return run_in_namespace(subnet['namespace'], func, *args, **kwargs)
+
+def exec_in_namespace(namespace, argv):
+    enter_namespace(namespace)
+    os.execvp(argv[0], argv)
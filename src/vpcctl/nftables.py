@@ -0,0 +1,208 @@
+import ipaddress
+import json
+from .utils import (
+    logger,
+    run_command
+)
+from .state import load_state
+
+TABLE = "ip vpcctl"
+
+SKELETON = f"""add table {TABLE}
+add set {TABLE} bridges {{ type ifname; }}
+add set {TABLE} uplinks {{ type ifname; }}
+add set {TABLE} nat_sources {{ type ipv4_addr; flags interval; }}
+add set {TABLE} hub_routes {{ type ifname . ipv4_addr; flags interval; }}
+add set {TABLE} hub_members {{ type ipv4_addr; flags interval; }}
+add map {TABLE} forward_pairs {{ type ifname . ifname : verdict; }}
+add map {TABLE} ct_zones {{ typeof iifname : ct zone; }}
+add chain {TABLE} prerouting {{ type filter hook prerouting priority raw; policy accept; }}
+add chain {TABLE} forward {{ type filter hook forward priority filter; policy accept; }}
+add chain {TABLE} postrouting {{ type nat hook postrouting priority srcnat; policy accept; }}
+flush chain {TABLE} prerouting
+flush chain {TABLE} forward
+flush chain {TABLE} postrouting
+add rule {TABLE} prerouting ct original zone set iifname map @ct_zones
+add rule {TABLE} forward ct state established,related accept
+add rule {TABLE} forward iifname . oifname vmap @forward_pairs
+add rule {TABLE} forward iifname . ip daddr @hub_routes ip daddr @hub_members accept
+add rule {TABLE} forward iifname @bridges oifname @bridges drop
+"""
+
+MASQUERADE_RULE = f"add rule {TABLE} postrouting ip saddr @nat_sources oifname @uplinks masquerade"
+
+def _quote(name):
+    return f'"{name}"'
+
+def nat_rules():
+    uplink = load_state().get('uplink')
+    rules = []
+    if uplink and uplink.get('address'):
+        rules.append(f"add rule {TABLE} postrouting ip saddr @nat_sources oifname {_quote(uplink['interface'])} "
+                     f"snat to {uplink['address']}")
+    return rules + [MASQUERADE_RULE]
+
+def run_nft(commands, check=True):
+    payload = SKELETON + "".join(f"{command}\n" for command in nat_rules() + list(commands))
+    return run_command("nft -f -", check=check, input=payload)
+
+def delete_elements(elements):
+    commands = []
+    for target, element in elements:
+        key = element.split(' : ')[0]
+        commands.append(f"add element {TABLE} {target} {{ {element} }}")
+        commands.append(f"delete element {TABLE} {target} {{ {key} }}")
+    return run_nft(commands, check=False)
+
+def register_vpc(vpc):
+    bridge = _quote(vpc['bridge'])
+    run_nft([
+        f"add element {TABLE} bridges {{ {bridge} }}",
+        f"add element {TABLE} forward_pairs {{ {bridge} . {bridge} : accept }}"
+    ])
+    logger.info(f"Added {vpc['bridge']} to the nftables isolation sets")
+
+def unregister_vpc(vpc):
+    bridge = _quote(vpc['bridge'])
+    elements = [("nat_sources", vpc['cidr'])] if any(s.get('type') == 'public' for s in vpc.get('subnets', [])) else []
+    if vpc.get('ct_zone'):
+        elements.append(("ct_zones", f"{bridge} : {vpc['ct_zone']}"))
+    elements += [("forward_pairs", f"{bridge} . {bridge} : accept"), ("bridges", bridge)]
+    delete_elements(elements)
+    logger.info(f"Removed {vpc['bridge']} from the nftables isolation sets")
+
+def allow_intra_vpc(vpc):
+    register_vpc(vpc)
+
+def setup_nat(vpc, uplink, previous=None):
+    commands = []
+    if previous and previous['interface'] != uplink['interface']:
+        old = _quote(previous['interface'])
+        commands += [f"add element {TABLE} uplinks {{ {old} }}", f"delete element {TABLE} uplinks {{ {old} }}"]
+    run_nft(commands + [
+        f"add element {TABLE} uplinks {{ {_quote(uplink['interface'])} }}",
+        f"add element {TABLE} nat_sources {{ {vpc['cidr']} }}"
+    ])
+    logger.info(f"Added {vpc['cidr']} to the nftables NAT source set on {uplink['interface']}")
+
+def remove_nat(vpc, uplink=None):
+    delete_elements([("nat_sources", vpc['cidr'])])
+    logger.info(f"Removed {vpc['cidr']} from the nftables NAT source set")
+
+def set_ct_zone(vpc):
+    run_nft([f"add element {TABLE} ct_zones {{ {_quote(vpc['bridge'])} : {vpc['ct_zone']} }}"])
+    logger.info(f"Assigned conntrack zone {vpc['ct_zone']} to {vpc['bridge']}")
+
+def clear_ct_zone(vpc):
+    delete_elements([("ct_zones", f"{_quote(vpc['bridge'])} : {vpc['ct_zone']}")])
+    logger.info(f"Removed conntrack zone {vpc['ct_zone']} from {vpc['bridge']}")
+
+def allow_peering(vpc1, vpc2):
+    bridge1 = _quote(vpc1['bridge'])
+    bridge2 = _quote(vpc2['bridge'])
+    run_nft([
+        f"add element {TABLE} forward_pairs {{ {bridge1} . {bridge2} : accept, {bridge2} . {bridge1} : accept }}"
+    ])
+    logger.info(f"Allowed forwarding between {vpc1['bridge']} and {vpc2['bridge']}")
+
+def revoke_peering(vpc1, vpc2):
+    bridge1 = _quote(vpc1['bridge'])
+    bridge2 = _quote(vpc2['bridge'])
+    delete_elements([
+        ("forward_pairs", f"{bridge1} . {bridge2} : accept"),
+        ("forward_pairs", f"{bridge2} . {bridge1} : accept")
+    ])
+    logger.info(f"Revoked forwarding between {vpc1['bridge']} and {vpc2['bridge']}")
+
+def attach_hub(vpc, hub):
+    run_nft([
+        f"add element {TABLE} hub_routes {{ {_quote(vpc['bridge'])} . {hub['cidr']} }}",
+        f"add element {TABLE} hub_members {{ {vpc['cidr']} }}"
+    ])
+    logger.info(f"Added {vpc['cidr']} to the nftables hub sets of '{hub['name']}'")
+
+def detach_hub(vpc, hub):
+    delete_elements([
+        ("hub_routes", f"{_quote(vpc['bridge'])} . {hub['cidr']}"),
+        ("hub_members", vpc['cidr'])
+    ])
+    logger.info(f"Removed {vpc['cidr']} from the nftables hub sets of '{hub['name']}'")
+
+def delete_hub(hub):
+    result = run_command(f"nft -j list table {TABLE}", check=False)
+    if result.returncode != 0 or not result.stdout.strip():
+        return
+
+    network = ipaddress.IPv4Network(hub['cidr'])
+    elements = []
+    for item in json.loads(result.stdout).get('nftables', []):
+        if 'set' not in item:
+            continue
+        values = [_element_value(e) for e in item['set'].get('elem', [])]
+        if item['set']['name'] == 'hub_routes':
+            elements += [("hub_routes", f"{_quote(bridge)} . {cidr}") for bridge, cidr in values if cidr == hub['cidr']]
+        elif item['set']['name'] == 'hub_members':
+            elements += [("hub_members", cidr) for cidr in values
+                         if ipaddress.IPv4Network(cidr).subnet_of(network)]
+
+    if elements:
+        delete_elements(elements)
+    logger.info(f"Flushed {len(elements)} leftover element(s) of hub '{hub['name']}' from the nftables hub sets")
+
+def _element_value(element):
+    if isinstance(element, dict) and 'prefix' in element:
+        return f"{element['prefix']['addr']}/{element['prefix']['len']}"
+    if isinstance(element, dict) and 'elem' in element:
+        return _element_value(element['elem']['val'])
+    if isinstance(element, dict) and 'concat' in element:
+        return tuple(_element_value(part) for part in element['concat'])
+    return element
+
+def find_drift(vpcs):
+    return []
+
+def find_orphans(vpcs):
+    result = run_command(f"nft -j list table {TABLE}", check=False)
+    if result.returncode != 0:
+        return []
+
+    sets = {}
+    pairs = []
+    zones = []
+    for item in json.loads(result.stdout).get('nftables', []):
+        if 'set' in item:
+            sets[item['set']['name']] = [_element_value(e) for e in item['set'].get('elem', [])]
+        elif 'map' in item and item['map']['name'] == 'forward_pairs':
+            pairs = [key['concat'] for key, _ in item['map'].get('elem', [])]
+        elif 'map' in item and item['map']['name'] == 'ct_zones':
+            zones = [tuple(elem) for elem in item['map'].get('elem', [])]
+
+    bridges = {v['bridge'] for v in vpcs}
+    sources = {v['cidr'] for v in vpcs if any(s.get('type') == 'public' for s in v.get('subnets', []))}
+    hub_bridges = {v['bridge'] for v in vpcs if v.get('hub')}
+    hub_members = {v['cidr'] for v in vpcs if v.get('hub')}
+    zoned = {(v['bridge'], v['ct_zone']) for v in vpcs if v.get('ct_zone')}
+
+    elements = []
+    for pair in pairs:
+        if not bridges.issuperset(pair):
+            elements.append(("forward_pairs", f"{_quote(pair[0])} . {_quote(pair[1])} : accept"))
+    for bridge in sets.get('bridges', []):
+        if bridge not in bridges:
+            elements.append(("bridges", _quote(bridge)))
+    for cidr in sets.get('nat_sources', []):
+        if cidr not in sources:
+            elements.append(("nat_sources", cidr))
+    for bridge, cidr in sets.get('hub_routes', []):
+        if bridge not in hub_bridges:
+            elements.append(("hub_routes", f"{_quote(bridge)} . {cidr}"))
+    for cidr in sets.get('hub_members', []):
+        if cidr not in hub_members:
+            elements.append(("hub_members", cidr))
+    for bridge, zone in zones:
+        if (bridge, zone) not in zoned:
+            elements.append(("ct_zones", f"{_quote(bridge)} : {zone}"))
+
+    if not elements:
+        return []
+    return [(f"nftables elements {', '.join(e for _, e in elements)}", delete_elements, (elements,), {})]
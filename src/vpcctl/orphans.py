@@ -0,0 +1,240 @@
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from . import hub
+from . import ipam
+from . import kernel
+from . import netfilter
+from .subnet import subnet_namespaces
+from .netns import NETNS_RUN_DIR, run_in_namespace
+from .egress import has_public_subnet
+from .utils import (
+    DEFAULT_WORKERS,
+    logger,
+    map_in_context
+)
+from .state import (
+    load_state,
+    update_state,
+    vpc_lock,
+    deferred_writes
+)
+
+SYS_CLASS_NET = Path("/sys/class/net")
+OWNED_LINK_PREFIXES = ("br-", "vb-", "vp-")
+OWNED_NAMESPACE_LINK_PREFIX = "vn-"
+
+def list_links():
+    return {entry.name for entry in SYS_CLASS_NET.iterdir()}
+
+def is_owned_link(name):
+    try:
+        return (SYS_CLASS_NET / name / "ifalias").read_text().strip() == kernel.LINK_ALIAS
+    except OSError:
+        return False
+
+def list_namespaces():
+    if not NETNS_RUN_DIR.exists():
+        return set()
+    return {entry.name for entry in NETNS_RUN_DIR.iterdir()}
+
+def _namespace_links(namespace):
+    return [name for _, name in socket.if_nameindex()]
+
+def is_owned_namespace(namespace):
+    try:
+        links = run_in_namespace(namespace, _namespace_links, namespace)
+    except OSError:
+        return False
+    return any(name.startswith(OWNED_NAMESPACE_LINK_PREFIX) for name in links)
+
+def delete_link(name):
+    with kernel.batch(check=False) as link:
+        link.del_link(name)
+
+def delete_namespace(namespace):
+    with kernel.batch(check=False) as link:
+        link.del_netns(namespace)
+
+def release_subnet(vpc, subnet):
+    gateway = subnet.get('gateway')
+    with kernel.batch(check=False) as link:
+        link.del_link(subnet['veth_br'])
+        for instance in subnet.get('instances', []):
+            link.del_netns(instance['namespace'])
+            link.del_link(instance['veth_br'])
+        if gateway:
+            link.del_addr(f"{gateway}/{subnet['cidr'].split('/')[1]}", vpc['bridge'])
+    if subnet.get('type') == 'public' and not has_public_subnet(vpc, exclude=subnet['name']):
+        netfilter.backend().remove_nat(vpc)
+
+def release_vpc(vpc, peers):
+    backend = netfilter.backend()
+    with kernel.batch(check=False) as link:
+        for subnet in vpc.get('subnets', []):
+            for namespace in subnet_namespaces(subnet):
+                link.del_netns(namespace)
+        for p in vpc.get('peerings', []):
+            if 'veth1' in p:
+                link.del_link(p['veth1'])
+    for peer in peers:
+        backend.revoke_peering(vpc, peer)
+    hub.release_vpc(vpc)
+    backend.unregister_vpc(vpc)
+
+def find_garbage(vpcs, links, namespaces, workers=DEFAULT_WORKERS):
+    known_links = set()
+    known_namespaces = set()
+    for vpc in vpcs:
+        known_links.add(vpc['bridge'])
+        for subnet in vpc.get('subnets', []):
+            known_links.add(subnet['veth_br'])
+            known_namespaces.add(subnet['namespace'])
+            for instance in subnet.get('instances', []):
+                known_links.add(instance['veth_br'])
+                known_namespaces.add(instance['namespace'])
+        for p in vpc.get('peerings', []):
+            if 'veth1' in p:
+                known_links.update([p['veth1'], p['veth2']])
+
+    tasks = []
+    for name in sorted(links - known_links):
+        if name.startswith(OWNED_LINK_PREFIXES) and is_owned_link(name):
+            tasks.append((f"link {name}", delete_link, (name,), {}))
+
+    candidates = sorted(namespaces - known_namespaces)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        owned = list(map_in_context(pool, is_owned_namespace, candidates))
+    for namespace, is_owned in zip(candidates, owned):
+        if is_owned:
+            tasks.append((f"namespace {namespace}", delete_namespace, (namespace,), {}))
+
+    tasks += netfilter.backend().find_orphans(vpcs)
+    return tasks
+
+def find_stale(vpcs, links, namespaces):
+    stale = []
+    for vpc in vpcs:
+        if vpc['bridge'] not in links:
+            stale.append(('vpc', vpc['name'], None))
+            continue
+        for subnet in vpc.get('subnets', []):
+            if subnet['namespace'] not in namespaces:
+                stale.append(('subnet', vpc['name'], subnet['name']))
+                continue
+            for instance in subnet.get('instances', []):
+                if instance['namespace'] not in namespaces:
+                    stale.append(('instance', vpc['name'], f"{subnet['name']}/{instance['name']}"))
+        for p in vpc.get('peerings', []):
+            if p['vpc1'] == vpc['name'] and 'veth1' in p and (p['veth1'] not in links or p['veth2'] not in links):
+                stale.append(('peering', p['vpc1'], p['vpc2']))
+    return stale
+
+def stale_teardown(vpcs, stale):
+    by_name = {vpc['name']: vpc for vpc in vpcs}
+    stale_vpcs = {first for kind, first, _ in stale if kind == 'vpc'}
+    backend = netfilter.backend()
+    tasks = []
+
+    for kind, first, second in stale:
+        vpc = by_name[first]
+        if kind == 'vpc':
+            peers = [by_name[name] for p in vpc.get('peerings', [])
+                     for name in (p['vpc1'], p['vpc2'])
+                     if name != first and name in by_name and name not in stale_vpcs]
+            tasks.append((f"leftovers of VPC {first}", release_vpc, (vpc, peers), {}))
+        elif kind == 'subnet':
+            subnet = next(s for s in vpc['subnets'] if s['name'] == second)
+            tasks.append((f"leftovers of subnet {first}/{second}", release_subnet, (vpc, subnet), {}))
+        elif kind == 'instance':
+            subnet_name, instance_name = second.split('/')
+            subnet = next(s for s in vpc['subnets'] if s['name'] == subnet_name)
+            instance = next(i for i in subnet['instances'] if i['name'] == instance_name)
+            tasks.append((f"link {instance['veth_br']}", delete_link, (instance['veth_br'],), {}))
+        elif kind == 'peering' and second in by_name:
+            tasks.append((f"firewall rules for peering {first}<->{second}", backend.revoke_peering,
+                          (vpc, by_name[second]), {}))
+    return tasks
+
+def forget_stale(state, stale):
+    stale_vpcs = {first for kind, first, _ in stale if kind == 'vpc'}
+    stale_subnets = {(first, second) for kind, first, second in stale if kind == 'subnet'}
+    stale_instances = {(first, second) for kind, first, second in stale if kind == 'instance'}
+    stale_peerings = {frozenset([first, second]) for kind, first, second in stale if kind == 'peering'}
+
+    state['vpcs'] = [v for v in state['vpcs'] if v['name'] not in stale_vpcs]
+    for vpc in state['vpcs']:
+        vpc['subnets'] = [s for s in vpc.get('subnets', []) if (vpc['name'], s['name']) not in stale_subnets]
+        for subnet in vpc['subnets']:
+            for instance in list(subnet.get('instances', [])):
+                if (vpc['name'], f"{subnet['name']}/{instance['name']}") in stale_instances:
+                    subnet['instances'].remove(instance)
+                    ipam.release(ipam.subnet_pool(subnet), subnet['cidr'], instance['ip'])
+        vpc['peerings'] = [p for p in vpc.get('peerings', [])
+                           if frozenset([p['vpc1'], p['vpc2']]) not in stale_peerings
+                           and p['vpc1'] not in stale_vpcs and p['vpc2'] not in stale_vpcs]
+
+def _run_task(task, action=("Removed", "remove")):
+    description, func, args, kwargs = task
+    try:
+        func(*args, **kwargs)
+        logger.info(f"{action[0]} {description}")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to {action[1]} {description}: {e}")
+        return False
+
+def _repair_task(task):
+    return _run_task(task, action=("Repaired", "repair"))
+
+def collect_garbage(dry_run=False, workers=DEFAULT_WORKERS):
+    start = time.perf_counter()
+    names = [vpc['name'] for vpc in load_state()['vpcs']]
+
+    with vpc_lock(*names), deferred_writes():
+        vpcs = load_state()['vpcs']
+        links = list_links()
+        namespaces = list_namespaces()
+
+        garbage = find_garbage(vpcs, links, namespaces, workers)
+        stale = find_stale(vpcs, links, namespaces)
+        stale_vpcs = {first for kind, first, _ in stale if kind == 'vpc'}
+        drift = netfilter.backend().find_drift([v for v in vpcs if v['name'] not in stale_vpcs])
+
+        if not garbage and not stale and not drift:
+            logger.info(f"Nothing to collect ({(time.perf_counter() - start) * 1000:.1f} ms)")
+            return True
+
+        print(f"\nOrphaned kernel objects: {len(garbage)}")
+        for description, _, _, _ in garbage:
+            print(f"  - {description}")
+        print(f"State entries missing from the kernel: {len(stale)}")
+        for kind, first, second in stale:
+            print(f"  - {kind} {first}{'/' + second if kind in ('subnet', 'instance') else ''}"
+                  f"{'<->' + second if kind == 'peering' else ''}")
+        print(f"Kernel rules drifted from state: {len(drift)}")
+        for description, _, _, _ in drift:
+            print(f"  - {description}")
+        print()
+
+        if dry_run:
+            return True
+
+        tasks = garbage + stale_teardown(vpcs, stale)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(map_in_context(pool, _run_task, tasks))
+            results += list(map_in_context(pool, _repair_task, drift))
+
+        if stale:
+            with update_state() as state:
+                forget_stale(state, stale)
+
+    elapsed = time.perf_counter() - start
+    failed = results.count(False)
+    if failed:
+        logger.error(f"Garbage collection finished with {failed} failure(s) after {elapsed:.2f}s")
+        return False
+    logger.info(f"Collected {len(garbage)} orphan(s) and {len(stale)} stale state entr{'y' if len(stale) == 1 else 'ies'}, "
+                f"repaired {len(drift)} drifted rule set(s) in {elapsed:.2f}s")
+    return True
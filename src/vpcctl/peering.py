@@ -1,12 +1,29 @@
-from .utils import (
-    logger,
-    run_command,
-    load_state,
-    save_state,
-    get_vpc
+from . import kernel
+from . import netfilter
+from . import profiles
+from .subnet import subnet_namespaces
+from .utils import logger, hashed_link
+from .state import (
+    update_state,
+    get_vpc,
+    vpc_lock
 )
 
-def create_peering(vpc1_name, vpc2_name):
+PEERING_MODES = ("routed", "bridged")
+DEFAULT_PEERING_MODE = "bridged"
+
+def peering_links(vpc1_name, vpc2_name):
+    return hashed_link("vp-", f"{vpc1_name}/{vpc2_name}"), hashed_link("vp-", f"{vpc2_name}/{vpc1_name}")
+
+def create_peering(vpc1_name, vpc2_name, mode=DEFAULT_PEERING_MODE):
+    with vpc_lock(vpc1_name, vpc2_name):
+        return _create_peering(vpc1_name, vpc2_name, mode)
+
+def _create_peering(vpc1_name, vpc2_name, mode=DEFAULT_PEERING_MODE):
+    if mode not in PEERING_MODES:
+        logger.error(f"Unknown peering mode '{mode}'. Must be one of: {', '.join(PEERING_MODES)}")
+        return False
+    
     vpc1 = get_vpc(vpc1_name)
     vpc2 = get_vpc(vpc2_name)
     
@@ -23,63 +40,68 @@ def create_peering(vpc1_name, vpc2_name):
     cidr1 = vpc1['cidr']
     cidr2 = vpc2['cidr']
     
-    veth1 = f"vp-{vpc1_name[:4]}-{vpc2_name[:4]}"
-    veth2 = f"vp-{vpc2_name[:4]}-{vpc1_name[:4]}"
+    if any({p['vpc1'], p['vpc2']} == {vpc1_name, vpc2_name} for p in vpc1.get('peerings', [])):
+        logger.error(f"VPCs '{vpc1_name}' and '{vpc2_name}' are already peered")
+        return False
+    
+    veth1, veth2 = peering_links(vpc1_name, vpc2_name)
     
     try:
-        run_command(f"ip link add {veth1} type veth peer name {veth2}")
-        logger.info(f"Created veth pair {veth1} <-> {veth2}")
-        
-        run_command(f"ip link set {veth1} master {bridge1}")
-        run_command(f"ip link set {veth2} master {bridge2}")
-        logger.info(f"Attached veth pair to bridges")
-        
-        run_command(f"ip link set {veth1} up")
-        run_command(f"ip link set {veth2} up")
-        logger.info(f"Brought up veth pair")
+        if mode == "bridged":
+            with kernel.batch() as link:
+                link.add_veth(veth1, veth2, mtu=profiles.peering_mtu(vpc1, vpc2))
+                link.set_master(veth1, bridge1)
+                link.set_master(veth2, bridge2)
+                link.set_up(veth1)
+                link.set_up(veth2)
+            logger.info(f"Created veth pair {veth1} <-> {veth2}")
+            logger.info(f"Attached veth pair to bridges and brought it up")
         
         for subnet1 in vpc1.get('subnets', []):
-            ns1 = subnet1['namespace']
             gw1 = subnet1['gateway']
-            run_command(f"ip netns exec {ns1} ip route add {cidr2} via {gw1}", check=False)
-            logger.info(f"Added route to {cidr2} in {ns1}")
+            for ns1 in subnet_namespaces(subnet1):
+                with kernel.batch(ns1, check=False) as link:
+                    link.add_route(cidr2, via=gw1)
+                logger.info(f"Added route to {cidr2} in {ns1}")
         
         for subnet2 in vpc2.get('subnets', []):
-            ns2 = subnet2['namespace']
             gw2 = subnet2['gateway']
-            run_command(f"ip netns exec {ns2} ip route add {cidr1} via {gw2}", check=False)
-            logger.info(f"Added route to {cidr1} in {ns2}")
+            for ns2 in subnet_namespaces(subnet2):
+                with kernel.batch(ns2, check=False) as link:
+                    link.add_route(cidr1, via=gw2)
+                logger.info(f"Added route to {cidr1} in {ns2}")
         
-        run_command(f"iptables -D FORWARD -i {bridge1} -o {bridge2} -j DROP", check=False)
-        run_command(f"iptables -D FORWARD -i {bridge2} -o {bridge1} -j DROP", check=False)
-        run_command(f"iptables -I FORWARD -i {bridge1} -o {bridge2} -j ACCEPT", check=False)
-        run_command(f"iptables -I FORWARD -i {bridge2} -o {bridge1} -j ACCEPT", check=False)
-        logger.info(f"Removed isolation rules between {bridge1} and {bridge2}")
+        netfilter.backend().allow_peering(vpc1, vpc2)
         
         peering_data = {
             "vpc1": vpc1_name,
-            "vpc2": vpc2_name,
-            "veth1": veth1,
-            "veth2": veth2
+            "vpc2": vpc2_name
         }
+        if mode == "bridged":
+            peering_data.update({"veth1": veth1, "veth2": veth2})
         
-        state = load_state()
-        for v in state['vpcs']:
-            if v['name'] == vpc1_name:
-                v.setdefault('peerings', []).append(peering_data)
-            elif v['name'] == vpc2_name:
-                v.setdefault('peerings', []).append(peering_data)
-        save_state(state)
+        with update_state() as state:
+            for v in state['vpcs']:
+                if v['name'] == vpc1_name:
+                    v.setdefault('peerings', []).append(peering_data)
+                elif v['name'] == vpc2_name:
+                    v.setdefault('peerings', []).append(peering_data)
         
-        logger.info(f"Peering created between '{vpc1_name}' and '{vpc2_name}'")
+        logger.info(f"Peering ({mode}) created between '{vpc1_name}' and '{vpc2_name}'")
         return True
         
     except Exception as e:
         logger.error(f"Failed to create peering: {e}")
-        run_command(f"ip link del {veth1}", check=False)
+        if mode == "bridged":
+            with kernel.batch(check=False) as link:
+                link.del_link(veth1)
         return False
 
 def delete_peering(vpc1_name, vpc2_name):
+    with vpc_lock(vpc1_name, vpc2_name):
+        return _delete_peering(vpc1_name, vpc2_name)
+
+def _delete_peering(vpc1_name, vpc2_name):
     vpc1 = get_vpc(vpc1_name)
     vpc2 = get_vpc(vpc2_name)
     
@@ -87,38 +109,36 @@ def delete_peering(vpc1_name, vpc2_name):
         logger.error(f"One or both VPCs not found")
         return False
     
-    bridge1 = vpc1['bridge']
-    bridge2 = vpc2['bridge']
     cidr1 = vpc1['cidr']
     cidr2 = vpc2['cidr']
     
-    veth1 = f"vp-{vpc1_name[:4]}-{vpc2_name[:4]}"
+    peering = next((p for p in vpc1.get('peerings', []) if {p['vpc1'], p['vpc2']} == {vpc1_name, vpc2_name}), None)
+    veth1 = peering.get('veth1') if peering else peering_links(vpc1_name, vpc2_name)[0]
     
     try:
-        run_command(f"ip link del {veth1}", check=False)
-        logger.info(f"Deleted veth pair")
+        if veth1:
+            with kernel.batch(check=False) as link:
+                link.del_link(veth1)
+            logger.info(f"Deleted veth pair")
         
         for subnet1 in vpc1.get('subnets', []):
-            ns1 = subnet1['namespace']
-            run_command(f"ip netns exec {ns1} ip route del {cidr2}", check=False)
+            for ns1 in subnet_namespaces(subnet1):
+                with kernel.batch(ns1, check=False) as link:
+                    link.del_route(cidr2)
         
         for subnet2 in vpc2.get('subnets', []):
-            ns2 = subnet2['namespace']
-            run_command(f"ip netns exec {ns2} ip route del {cidr1}", check=False)
+            for ns2 in subnet_namespaces(subnet2):
+                with kernel.batch(ns2, check=False) as link:
+                    link.del_route(cidr1)
         
-        run_command(f"iptables -D FORWARD -i {bridge1} -o {bridge2} -j ACCEPT", check=False)
-        run_command(f"iptables -D FORWARD -i {bridge2} -o {bridge1} -j ACCEPT", check=False)
-        run_command(f"iptables -I FORWARD -i {bridge1} -o {bridge2} -j DROP", check=False)
-        run_command(f"iptables -I FORWARD -i {bridge2} -o {bridge1} -j DROP", check=False)
-        logger.info(f"Re-added isolation rules between {bridge1} and {bridge2}")
+        netfilter.backend().revoke_peering(vpc1, vpc2)
         
-        state = load_state()
-        for v in state['vpcs']:
-            if v['name'] in [vpc1_name, vpc2_name]:
-                v['peerings'] = [p for p in v.get('peerings', []) 
-                               if not (p['vpc1'] in [vpc1_name, vpc2_name] and 
-                                      p['vpc2'] in [vpc1_name, vpc2_name])]
-        save_state(state)
+        with update_state() as state:
+            for v in state['vpcs']:
+                if v['name'] in [vpc1_name, vpc2_name]:
+                    v['peerings'] = [p for p in v.get('peerings', []) 
+                                   if not (p['vpc1'] in [vpc1_name, vpc2_name] and 
+                                          p['vpc2'] in [vpc1_name, vpc2_name])]
         
         logger.info(f"Peering deleted between '{vpc1_name}' and '{vpc2_name}'")
         return True
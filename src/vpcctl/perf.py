@@ -0,0 +1,257 @@
+import ipaddress
+import json
+import os
+import platform
+import socket
+import struct
+import tempfile
+import threading
+import time
+from importlib import metadata
+from .utils import logger
+from .state import get_subnet
+from .netns import run_in_namespace
+
+DEFAULT_PORT = 5201
+DEFAULT_DURATION = 5.0
+BUFFER_SIZE = 4 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+MESSAGE_SIZE = 64
+MODE_THROUGHPUT = b"T"
+MODE_REQUEST_RESPONSE = b"R"
+COUNT_FORMAT = "!Q"
+PERCENTILES = (50, 90, 99, 99.9)
+
+def resolve_endpoint(spec):
+    parts = spec.split('/')
+    if len(parts) not in (2, 3):
+        return None
+    subnet = get_subnet(parts[0], parts[1])
+    if not subnet:
+        logger.error(f"Subnet '{parts[1]}' not found in VPC '{parts[0]}'")
+        return None
+    if len(parts) == 2:
+        return {"name": spec, "namespace": subnet['namespace'], "ip": subnet['ip']}
+
+    instance = next((i for i in subnet.get('instances', []) if i['name'] == parts[2]), None)
+    if not instance:
+        logger.error(f"Instance '{parts[2]}' not found in subnet '{parts[1]}'")
+        return None
+    return {"name": spec, "namespace": instance['namespace'], "ip": instance['ip']}
+
+def _tune(sock):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, BUFFER_SIZE)
+    if sock.type == socket.SOCK_STREAM:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+def _listen(address, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    _tune(sock)
+    sock.bind((address, port))
+    sock.listen(16)
+    return sock
+
+def _client():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    _tune(sock)
+    return sock
+
+def _open(namespace, func, *args):
+    if namespace is None:
+        return func(*args)
+    return run_in_namespace(namespace, func, *args)
+
+def _recv_exactly(conn, view):
+    received = 0
+    while received < len(view):
+        n = conn.recv_into(view[received:])
+        if not n:
+            return False
+        received += n
+    return True
+
+def _sink_throughput(conn):
+    view = memoryview(bytearray(CHUNK_SIZE))
+    total = 0
+    while True:
+        n = conn.recv_into(view)
+        if not n:
+            break
+        total += n
+    conn.sendall(struct.pack(COUNT_FORMAT, total))
+
+def _sink_request_response(conn):
+    view = memoryview(bytearray(MESSAGE_SIZE))
+    while _recv_exactly(conn, view):
+        conn.sendall(view)
+
+def _serve_connection(conn):
+    with conn:
+        mode = conn.recv(1)
+        if mode == MODE_THROUGHPUT:
+            _sink_throughput(conn)
+        elif mode == MODE_REQUEST_RESPONSE:
+            _sink_request_response(conn)
+
+def serve(listener, stop=None):
+    listener.settimeout(0.5)
+    while stop is None or not stop.is_set():
+        try:
+            conn, _ = listener.accept()
+        except socket.timeout:
+            continue
+        except OSError:
+            break
+        conn.settimeout(None)
+        threading.Thread(target=_serve_connection, args=(conn,), daemon=True).start()
+
+def run_throughput(namespace, address, port, duration):
+    sock = _open(namespace, _client)
+    with sock, tempfile.TemporaryFile() as source:
+        os.ftruncate(source.fileno(), CHUNK_SIZE)
+        sock.connect((address, port))
+        sock.sendall(MODE_THROUGHPUT)
+
+        sent = 0
+        start = time.perf_counter()
+        deadline = start + duration
+        while time.perf_counter() < deadline:
+            sent += sock.sendfile(source, offset=0, count=CHUNK_SIZE)
+        sock.shutdown(socket.SHUT_WR)
+
+        reply = memoryview(bytearray(struct.calcsize(COUNT_FORMAT)))
+        if not _recv_exactly(sock, reply):
+            raise ConnectionError("sink closed the connection before reporting received bytes")
+        elapsed = time.perf_counter() - start
+    received = struct.unpack(COUNT_FORMAT, reply)[0]
+    return {"bytes_sent": sent, "bytes_received": received, "seconds": round(elapsed, 6),
+            "gbit_per_second": round(received * 8 / elapsed / 1e9, 3)}
+
+def run_request_response(namespace, address, port, duration):
+    sock = _open(namespace, _client)
+    request = memoryview(bytearray(MESSAGE_SIZE))
+    response = memoryview(bytearray(MESSAGE_SIZE))
+    samples = []
+    with sock:
+        sock.connect((address, port))
+        sock.sendall(MODE_REQUEST_RESPONSE)
+
+        deadline = time.perf_counter() + duration
+        while True:
+            start = time.perf_counter()
+            if start >= deadline:
+                break
+            sock.sendall(request)
+            if not _recv_exactly(sock, response):
+                raise ConnectionError("sink closed the connection during the request/response test")
+            samples.append(time.perf_counter() - start)
+
+    samples.sort()
+    latency = {f"p{p:g}": round(samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1e6, 1)
+               for p in PERCENTILES}
+    latency['max'] = round(samples[-1] * 1e6, 1)
+    return {"round_trips": len(samples), "latency_us": latency}
+
+def cpu_times():
+    times = os.times()
+    return times.user + times.children_user, times.system + times.children_system
+
+def vpcctl_version():
+    try:
+        return metadata.version("vpcctl")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+def print_report(report):
+    tp = report['throughput']
+    rr = report['request_response']
+    cpu = report['cpu']
+    print(f"\n{'Path:':<13} {report['from']['name']} ({report['from']['ip']}) -> {report['to']['name']} "
+          f"({report['to']['ip']}:{report['port']})")
+    print(f"{'Throughput:':<13} {tp['gbit_per_second']:.2f} Gbit/s "
+          f"({tp['bytes_received'] / 1e9:.2f} GB in {tp['seconds']:.2f} s)")
+    print(f"{'Latency:':<13} " + "  ".join(f"{name} {value:.1f} us" for name, value in rr['latency_us'].items())
+          + f" ({rr['round_trips']} round trips)")
+    per_gb = "n/a" if cpu['seconds_per_gb'] is None else f"{cpu['seconds_per_gb']:.3f} s"
+    print(f"{'CPU:':<13} user {cpu['user_seconds']:.2f} s, sys {cpu['system_seconds']:.2f} s ({per_gb} per GB)")
+    print(f"{'Versions:':<13} vpcctl {report['vpcctl_version']}, kernel {report['kernel']}")
+    print()
+
+def measure(src, dst, port=DEFAULT_PORT, duration=DEFAULT_DURATION):
+    stop = threading.Event()
+    listener = server = None
+    if dst['namespace']:
+        listener = _open(dst['namespace'], _listen, dst['ip'], port)
+        server = threading.Thread(target=serve, args=(listener, stop), daemon=True)
+        server.start()
+
+    try:
+        user_before, system_before = cpu_times()
+        throughput = run_throughput(src['namespace'], dst['ip'], port, duration)
+        user_after, system_after = cpu_times()
+        request_response = run_request_response(src['namespace'], dst['ip'], port, min(duration, 2.0))
+    finally:
+        stop.set()
+        if listener:
+            listener.close()
+            server.join()
+
+    user = user_after - user_before
+    system = system_after - system_before
+    gigabytes = throughput['bytes_received'] / 1e9
+    return {
+        "timestamp": round(time.time(), 3),
+        "vpcctl_version": vpcctl_version(),
+        "kernel": platform.release(),
+        "from": {"name": src['name'], "ip": src['ip']},
+        "to": {"name": dst['name'], "ip": dst['ip']},
+        "port": port,
+        "throughput": throughput,
+        "request_response": request_response,
+        "cpu": {"user_seconds": round(user, 3), "system_seconds": round(system, 3),
+                "seconds_per_gb": round((user + system) / gigabytes, 4) if gigabytes else None}
+    }
+
+def listen(port=DEFAULT_PORT, bind="0.0.0.0"):
+    try:
+        listener = _listen(bind, port)
+    except OSError as e:
+        logger.error(f"Failed to listen on {bind}:{port}: {e}")
+        return False
+
+    logger.info(f"Serving perf sink on {bind}:{port}, press Ctrl-C to stop")
+    with listener:
+        try:
+            serve(listener)
+        except KeyboardInterrupt:
+            pass
+    return True
+
+def perf(source, target, port=DEFAULT_PORT, duration=DEFAULT_DURATION, as_json=False):
+    src = resolve_endpoint(source)
+    if not src:
+        logger.error(f"Invalid --from '{source}', expected VPC/SUBNET or VPC/SUBNET/INSTANCE")
+        return False
+
+    try:
+        ipaddress.IPv4Address(target)
+        dst = {"name": "external", "namespace": None, "ip": target}
+    except ValueError:
+        dst = resolve_endpoint(target)
+        if not dst:
+            logger.error(f"Invalid --to '{target}', expected VPC/SUBNET, VPC/SUBNET/INSTANCE or an IPv4 sink address")
+            return False
+
+    try:
+        report = measure(src, dst, port, duration)
+    except OSError as e:
+        logger.error(f"Perf test from {src['name']} to {dst['ip']}:{port} failed: {e}")
+        return False
+
+    if as_json:
+        print(json.dumps(report))
+    else:
+        print_report(report)
+    return True
@@ -0,0 +1,272 @@
+import difflib
+import hashlib
+import ipaddress
+from .utils import logger
+
+MULTIPORT_SLOTS = 15
+IPSET_THRESHOLD = 8
+PORT_PROTOCOLS = ('tcp', 'udp', 'sctp', 'udplite')
+ACTIONS = {'allow': 'ACCEPT', 'deny': 'DROP'}
+
+DIRECTIONS = {
+    'ingress': {"chain": "VPCCTL-IN", "base": "INPUT", "peers": "sources", "flag": "-s", "set_dir": "src",
+                "iface": "-i"},
+    'egress': {"chain": "VPCCTL-OUT", "base": "OUTPUT", "peers": "destinations", "flag": "-d", "set_dir": "dst",
+               "iface": "-o"}
+}
+BASE_CHAINS = {spec['chain']: spec['base'] for spec in DIRECTIONS.values()}
+
+def parse_port_spec(spec):
+    if isinstance(spec, bool):
+        raise ValueError(f"invalid port {spec!r}")
+    if isinstance(spec, int):
+        first = last = spec
+    else:
+        text = str(spec).replace(':', '-')
+        first, _, last = text.partition('-')
+        first = int(first)
+        last = int(last) if last else first
+
+    if not 1 <= first <= last <= 65535:
+        raise ValueError(f"invalid port or range {spec!r}")
+    return first, last
+
+def rule_ports(rule):
+    specs = list(rule.get('ports', []))
+    if 'port' in rule:
+        specs.insert(0, rule['port'])
+    return [parse_port_spec(spec) for spec in specs]
+
+def validate_rule(rule, direction):
+    peers_key = DIRECTIONS[direction]['peers']
+
+    if 'protocol' not in rule or 'action' not in rule:
+        logger.error(f"Each {direction} rule must have 'protocol' and 'action' fields")
+        return False
+
+    if rule['action'] not in ACTIONS:
+        logger.error(f"Invalid action '{rule['action']}'. Must be 'allow' or 'deny'")
+        return False
+
+    try:
+        ports = rule_ports(rule)
+    except (TypeError, ValueError) as e:
+        logger.error(f"Invalid {direction} rule: {e}")
+        return False
+
+    if rule['protocol'] in PORT_PROTOCOLS and not ports:
+        logger.error(f"Each {direction} {rule['protocol']} rule must have a 'port' or 'ports' field")
+        return False
+
+    if ports and rule['protocol'] not in PORT_PROTOCOLS:
+        logger.error(f"Ports are not supported for protocol '{rule['protocol']}'")
+        return False
+
+    for cidr in rule.get(peers_key, []):
+        try:
+            ipaddress.IPv4Network(cidr, strict=False)
+        except ValueError:
+            logger.error(f"Invalid CIDR '{cidr}' in {direction} '{peers_key}'")
+            return False
+
+    return True
+
+def validate_policy(policy):
+    if 'subnet' not in policy:
+        logger.error("Policy must contain 'subnet' field")
+        return False
+
+    if 'ingress' not in policy:
+        logger.error("Policy must contain 'ingress' field")
+        return False
+
+    for direction in DIRECTIONS:
+        for rule in policy.get(direction, []):
+            if not validate_rule(rule, direction):
+                return False
+
+    return True
+
+def merge_ranges(ranges):
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return [(first, last) for first, last in merged]
+
+def port_matches(ranges):
+    if ranges is None:
+        return [""]
+
+    ranges = merge_ranges(ranges)
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        return [f"--dport {first}" if first == last else f"--dport {first}:{last}"]
+
+    chunks = [[]]
+    slots = 0
+    for first, last in ranges:
+        cost = 1 if first == last else 2
+        if slots + cost > MULTIPORT_SLOTS:
+            chunks.append([])
+            slots = 0
+        chunks[-1].append(str(first) if first == last else f"{first}:{last}")
+        slots += cost
+    return [f"-m multiport --dports {','.join(chunk)}" for chunk in chunks]
+
+def collapse(cidrs):
+    networks = [ipaddress.IPv4Network(cidr, strict=False) for cidr in cidrs]
+    return tuple(str(network) for network in ipaddress.collapse_addresses(networks))
+
+def set_name(direction, peers):
+    digest = hashlib.sha1(",".join(peers).encode()).hexdigest()[:12]
+    return f"vpcctl-{direction[:2]}-{digest}"
+
+def group_rules(rules, peers_key):
+    segments = [{}]
+    for rule in rules:
+        protocol = rule['protocol']
+        ports = rule_ports(rule) or None
+        key = (ACTIONS[rule['action']], collapse(rule.get(peers_key, [])))
+
+        if protocol == 'all':
+            segments += [{protocol: [{"key": key, "ranges": None}]}, {}]
+            continue
+
+        runs = segments[-1].setdefault(protocol, [])
+        if runs and runs[-1]['key'] == key:
+            if runs[-1]['ranges'] is None or ports is None:
+                runs[-1]['ranges'] = None
+            else:
+                runs[-1]['ranges'] += ports
+        else:
+            runs.append({"key": key, "ranges": ports})
+
+    return [(protocol, run) for segment in segments for protocol, runs in segment.items() for run in runs]
+
+def naive_rule_count(rule, peers_key):
+    ports = rule_ports(rule)
+    return max(1, len(ports)) * max(1, len(rule.get(peers_key, [])))
+
+def compile_policy(policy):
+    compiled = {"rules": {}, "sets": {}, "before": 0, "after": 0}
+
+    for direction, spec in DIRECTIONS.items():
+        if direction not in policy:
+            continue
+
+        rules = policy[direction]
+        lines = [
+            "-m conntrack --ctstate ESTABLISHED,RELATED -j ACCEPT",
+            f"{spec['iface']} lo -j ACCEPT"
+        ]
+
+        for protocol, run in group_rules(rules, spec['peers']):
+            target, peers = run['key']
+
+            if len(peers) > IPSET_THRESHOLD:
+                name = set_name(direction, peers)
+                compiled['sets'][name] = peers
+                peer_matches = [f"-m set --match-set {name} {spec['set_dir']}"]
+            elif peers:
+                peer_matches = [f"{spec['flag']} {peer}" for peer in peers]
+            else:
+                peer_matches = [""]
+
+            for peer_match in peer_matches:
+                for port_match in port_matches(run['ranges']):
+                    match = " ".join(part for part in (f"-p {protocol}", peer_match, port_match) if part)
+                    lines.append(f"{match} -j {target}")
+
+        lines.append("-j DROP")
+        compiled['rules'][spec['chain']] = lines
+        compiled['before'] += sum(naive_rule_count(rule, spec['peers']) for rule in rules)
+        compiled['after'] += len(lines) - 3
+
+    return compiled
+
+def build_restore_payload(chains):
+    lines = ["*filter"]
+    lines += [f":{chain} - [0:0]" for chain in BASE_CHAINS]
+    lines += [f":{base} ACCEPT [0:0]" for base in BASE_CHAINS.values()]
+    lines += [f"-F {base}" for base in BASE_CHAINS.values()]
+
+    for chain, base in BASE_CHAINS.items():
+        if chain in chains:
+            lines += [f"-A {chain} {rule}" for rule in chains[chain]]
+            lines.append(f"-A {base} -j {chain}")
+        else:
+            lines.append(f"-X {chain}")
+
+    lines.append("COMMIT")
+    return "\n".join(lines) + "\n"
+
+def diff_chain(chain, old, new):
+    deletes = []
+    inserts = []
+    matcher = difflib.SequenceMatcher(a=old, b=new, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag in ('delete', 'replace'):
+            deletes += [f"-D {chain} {rule}" for rule in old[old_start:old_end]]
+        if tag in ('insert', 'replace'):
+            inserts += [f"-I {chain} {index + 1} {new[index]}" for index in range(new_start, new_end)]
+    return deletes + inserts
+
+def build_update_payload(old_chains, new_chains):
+    declarations = []
+    operations = []
+    for chain, base in BASE_CHAINS.items():
+        old = old_chains.get(chain)
+        new = new_chains.get(chain)
+        if old is None and new is not None:
+            declarations.append(f":{chain} - [0:0]")
+            operations += [f"-A {chain} {rule}" for rule in new]
+            operations.append(f"-A {base} -j {chain}")
+        elif old is not None and new is None:
+            operations += [f"-D {base} -j {chain}", f"-F {chain}", f"-X {chain}"]
+        elif old is not None:
+            operations += diff_chain(chain, old, new)
+
+    if not operations:
+        return None, 0
+    return "\n".join(["*filter"] + declarations + operations + ["COMMIT"]) + "\n", len(operations)
+
+def build_ipset_payload(sets):
+    lines = []
+    for name, peers in sets.items():
+        lines.append(f"create {name} hash:net family inet -exist")
+        lines += [f"add {name} {peer} -exist" for peer in peers]
+    return "\n".join(lines) + "\n"
+
+def _rule_matches(tokens, sets, protocol, port, peer):
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token == '-p' and tokens[index + 1] not in ('all', protocol):
+            return False
+        if token in ('-s', '-d') and peer not in ipaddress.IPv4Network(tokens[index + 1], strict=False):
+            return False
+        if token == '--match-set':
+            if not any(peer in ipaddress.IPv4Network(cidr) for cidr in sets.get(tokens[index + 1], [])):
+                return False
+        if token in ('--dport', '--dports'):
+            ranges = [parse_port_spec(spec) for spec in tokens[index + 1].split(',')]
+            if port is None or not any(first <= port <= last for first, last in ranges):
+                return False
+        index += 1
+    return True
+
+def chain_allows(rules, sets, protocol, port, peer):
+    if rules is None:
+        return True
+
+    peer = ipaddress.IPv4Address(peer)
+    for rule in rules:
+        tokens = rule.split()
+        if '--ctstate' in tokens or '--state' in tokens or tokens[:2] in (['-i', 'lo'], ['-o', 'lo']):
+            continue
+        if _rule_matches(tokens[:-2], sets, protocol, port, peer):
+            return tokens[-1] == 'ACCEPT'
+    return True
@@ -0,0 +1,95 @@
+import ipaddress
+
+KEYS = 2
+COUNT = 3
+BITS = 32
+
+def _new_node():
+    return [None, None, None, 0]
+
+def _parse(cidr):
+    network = ipaddress.IPv4Network(cidr, strict=False)
+    return int(network.network_address), network.prefixlen
+
+def _bit(address, depth):
+    return (address >> (BITS - 1 - depth)) & 1
+
+class PrefixTrie:
+    def __init__(self):
+        self.root = _new_node()
+        self.entries = {}
+        self.generation = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def insert(self, key, cidr):
+        address, length = _parse(cidr)
+        node = self.root
+        node[COUNT] += 1
+        for depth in range(length):
+            bit = _bit(address, depth)
+            if node[bit] is None:
+                node[bit] = _new_node()
+            node = node[bit]
+            node[COUNT] += 1
+        if node[KEYS] is None:
+            node[KEYS] = set()
+        node[KEYS].add(key)
+        self.entries[key] = cidr
+
+    def remove(self, key):
+        cidr = self.entries.pop(key, None)
+        if cidr is None:
+            return
+        address, length = _parse(cidr)
+        path = [self.root]
+        for depth in range(length):
+            path.append(path[-1][_bit(address, depth)])
+
+        path[-1][KEYS].discard(key)
+        if not path[-1][KEYS]:
+            path[-1][KEYS] = None
+        for node in path:
+            node[COUNT] -= 1
+        for depth in range(length, 0, -1):
+            if path[depth][COUNT]:
+                break
+            path[depth - 1][_bit(address, depth - 1)] = None
+
+    def sync(self, entries, generation):
+        if generation == self.generation:
+            return
+        for key, cidr in self.entries.items() - entries.items():
+            self.remove(key)
+        for key, cidr in entries.items() - self.entries.items():
+            self.insert(key, cidr)
+        self.generation = generation
+
+    def find_overlap(self, cidr):
+        address, length = _parse(cidr)
+        node = self.root
+        for depth in range(length):
+            if node[KEYS]:
+                return min(node[KEYS])
+            node = node[_bit(address, depth)]
+            if node is None:
+                return None
+
+        if not node[COUNT]:
+            return None
+        while node[KEYS] is None:
+            node = node[0] if node[0] is not None else node[1]
+        return min(node[KEYS])
+
+    def longest_match(self, address):
+        address = int(ipaddress.IPv4Address(address))
+        node = self.root
+        best = node[KEYS]
+        for depth in range(BITS):
+            node = node[_bit(address, depth)]
+            if node is None:
+                break
+            if node[KEYS]:
+                best = node[KEYS]
+        return min(best) if best else None
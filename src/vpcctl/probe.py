@@ -0,0 +1,299 @@
+import asyncio
+import contextvars
+import errno
+import random
+import resource
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .utils import logger
+from .state import load_state
+from .netns import enter_namespace
+from .policy import chain_allows
+
+DEFAULT_TIMEOUT = 1.0
+MAX_OPEN_SOCKETS = 4096
+RESERVED_FDS = 256
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+PROBE_PAYLOAD = b"vpcctl-probe"
+
+def parse_probe(spec):
+    protocol, _, port = spec.partition(':')
+    if protocol == 'icmp' and not port:
+        return ('icmp', None)
+    if protocol in ('tcp', 'udp') and port.isdigit() and 1 <= int(port) <= 65535:
+        return (protocol, int(port))
+    raise ValueError(f"invalid probe '{spec}', expected icmp, tcp:PORT or udp:PORT")
+
+def probe_label(protocol, port):
+    return protocol if port is None else f"{protocol}/{port}"
+
+def probe_targets(vpc_names=None):
+    targets = []
+    for vpc in load_state()['vpcs']:
+        if vpc_names and vpc['name'] not in vpc_names:
+            continue
+        for subnet in vpc.get('subnets', []):
+            targets.append({
+                "name": f"{vpc['name']}/{subnet['name']}",
+                "vpc": vpc['name'],
+                "hub": vpc.get('hub'),
+                "namespace": subnet['namespace'],
+                "ip": subnet['ip'],
+                "rules": subnet.get('policy_rules', {}),
+                "sets": subnet.get('policy_sets', {})
+            })
+    return targets
+
+def peered_vpcs():
+    peered = set()
+    for vpc in load_state()['vpcs']:
+        for p in vpc.get('peerings', []):
+            peered.add(frozenset((p['vpc1'], p['vpc2'])))
+    return peered
+
+def expected_reachable(src, dst, protocol, port, peered):
+    connected = (src['vpc'] == dst['vpc'] or frozenset((src['vpc'], dst['vpc'])) in peered or
+                 (src['hub'] is not None and src['hub'] == dst['hub']))
+    if not connected:
+        return False
+    return (chain_allows(src['rules'].get('VPCCTL-OUT'), src['sets'], protocol, port, dst['ip']) and
+            chain_allows(dst['rules'].get('VPCCTL-IN'), dst['sets'], protocol, port, src['ip']))
+
+def socket_budget():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = MAX_OPEN_SOCKETS + RESERVED_FDS
+    if soft < wanted:
+        limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+            soft = limit
+        except (ValueError, OSError) as e:
+            logger.debug(f"Could not raise the open file limit: {e}")
+    return max(16, min(MAX_OPEN_SOCKETS, soft - RESERVED_FDS))
+
+def checksum(data):
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+def echo_request(ident, sequence):
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, sequence)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum(header + PROBE_PAYLOAD), ident,
+                       sequence) + PROBE_PAYLOAD
+
+def _bind_udp(port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind(("0.0.0.0", port))
+    except OSError as e:
+        sock.close()
+        if e.errno != errno.EADDRINUSE:
+            raise
+        return None
+    return sock
+
+class EchoResponder(asyncio.DatagramProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.transport.sendto(data, addr)
+
+class Prober:
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.loop = asyncio.get_running_loop()
+        self.limit = asyncio.Semaphore(socket_budget())
+        self.workers = {}
+        self.responders = []
+
+    def in_namespace(self, namespace, func, *args):
+        executor = self.workers.get(namespace)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, initializer=enter_namespace, initargs=(namespace,),
+                                          thread_name_prefix=f"netns-{namespace}")
+            self.workers[namespace] = executor
+        return self.loop.run_in_executor(executor, contextvars.copy_context().run, func, *args)
+
+    async def open_socket(self, namespace, kind, proto=0):
+        sock = await self.in_namespace(namespace, socket.socket, socket.AF_INET, kind, proto)
+        sock.setblocking(False)
+        return sock
+
+    async def start_responder(self, namespace, port):
+        sock = await self.in_namespace(namespace, _bind_udp, port)
+        if sock is None:
+            logger.debug(f"udp/{port} is already bound in {namespace}, probing the existing service")
+            return
+        sock.setblocking(False)
+        transport, _ = await self.loop.create_datagram_endpoint(EchoResponder, sock=sock)
+        self.responders.append(transport)
+
+    async def probe_tcp(self, src, dst, port):
+        async with self.limit:
+            sock = await self.open_socket(src['namespace'], socket.SOCK_STREAM)
+            try:
+                await asyncio.wait_for(self.loop.sock_connect(sock, (dst['ip'], port)), self.timeout)
+                return True
+            except ConnectionRefusedError:
+                return True
+            except (asyncio.TimeoutError, OSError):
+                return False
+            finally:
+                sock.close()
+
+    async def probe_udp(self, src, dst, port):
+        async with self.limit:
+            sock = await self.open_socket(src['namespace'], socket.SOCK_DGRAM)
+            try:
+                sock.connect((dst['ip'], port))
+                await self.loop.sock_sendall(sock, PROBE_PAYLOAD)
+                await asyncio.wait_for(self.loop.sock_recv(sock, len(PROBE_PAYLOAD)), self.timeout)
+                return True
+            except ConnectionRefusedError:
+                return True
+            except (asyncio.TimeoutError, OSError):
+                return False
+            finally:
+                sock.close()
+
+    async def probe_icmp(self, src, dsts):
+        async with self.limit:
+            sock = await self.open_socket(src['namespace'], socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            ident = random.randrange(1, 0xffff)
+            waiting = {dst['ip']: sequence for sequence, dst in enumerate(dsts)}
+            replied = set()
+            try:
+                for address, sequence in waiting.items():
+                    try:
+                        await self.loop.sock_sendto(sock, echo_request(ident, sequence), (address, 0))
+                    except OSError:
+                        pass
+
+                deadline = self.loop.time() + self.timeout
+                while len(replied) < len(waiting):
+                    remaining = deadline - self.loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        data = await asyncio.wait_for(self.loop.sock_recv(sock, 1024), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    header = (data[0] & 0x0f) * 4
+                    kind, _, _, reply_ident, sequence = struct.unpack("!BBHHH", data[header:header + 8])
+                    address = socket.inet_ntoa(data[12:16])
+                    if kind == ICMP_ECHO_REPLY and reply_ident == ident and waiting.get(address) == sequence:
+                        replied.add(address)
+            finally:
+                sock.close()
+            return [dst['ip'] in replied for dst in dsts]
+
+    async def probe_pair(self, src, dst, protocol, port):
+        try:
+            if protocol == 'tcp':
+                return await self.probe_tcp(src, dst, port)
+            return await self.probe_udp(src, dst, port)
+        except Exception as e:
+            logger.debug(f"Probe {src['name']} -> {dst['name']} {probe_label(protocol, port)} failed: {e}")
+            return False
+
+    async def probe_source(self, src, dsts):
+        try:
+            return await self.probe_icmp(src, dsts)
+        except Exception as e:
+            logger.debug(f"ICMP probes from {src['name']} failed: {e}")
+            return [False] * len(dsts)
+
+    async def probe_matrix(self, targets, protocol, port):
+        pairs = [(src, dst) for src in targets for dst in targets if src is not dst]
+        if protocol == 'icmp':
+            rows = await asyncio.gather(*(self.probe_source(src, [dst for dst in targets if dst is not src])
+                                          for src in targets))
+            results = [reachable for row in rows for reachable in row]
+        else:
+            results = await asyncio.gather(*(self.probe_pair(src, dst, protocol, port) for src, dst in pairs))
+        return {(src['name'], dst['name']): reachable for (src, dst), reachable in zip(pairs, results)}
+
+    async def run(self, targets, probes):
+        await asyncio.gather(*(self.start_responder(dst['namespace'], port)
+                               for protocol, port in probes if protocol == 'udp' for dst in targets))
+        matrices = await asyncio.gather(*(self.probe_matrix(targets, protocol, port) for protocol, port in probes))
+        return dict(zip(probes, matrices))
+
+    def close(self):
+        for transport in self.responders:
+            transport.close()
+        for executor in self.workers.values():
+            executor.shutdown(wait=True)
+
+async def _probe_all(targets, probes, timeout):
+    prober = Prober(timeout)
+    try:
+        return await prober.run(targets, probes)
+    finally:
+        prober.close()
+
+def print_matrix(targets, observed, expected):
+    width = len(str(len(targets)))
+    print(f"\n{'#':>{width}}  {'Subnet':<30} " + " ".join(f"{index:>{width}}" for index in range(1, len(targets) + 1)))
+    print("-" * (width + 33 + (width + 1) * len(targets)))
+    for index, src in enumerate(targets, 1):
+        cells = []
+        for dst in targets:
+            key = (src['name'], dst['name'])
+            if src is dst:
+                cell = "-"
+            elif observed[key] != expected[key]:
+                cell = "!"
+            else:
+                cell = "+" if observed[key] else "."
+            cells.append(f"{cell:>{width}}")
+        print(f"{index:>{width}}  {src['name']:<30} " + " ".join(cells))
+
+def probe(vpc_names=None, probe_specs=None, timeout=DEFAULT_TIMEOUT):
+    try:
+        probes = list(dict.fromkeys(parse_probe(spec) for spec in probe_specs or ['icmp']))
+    except ValueError as e:
+        logger.error(str(e))
+        return False
+
+    targets = probe_targets(vpc_names)
+    if len(targets) < 2:
+        logger.error("At least two subnets are needed to build a reachability matrix")
+        return False
+
+    peered = peered_vpcs()
+    start = time.perf_counter()
+    matrices = asyncio.run(_probe_all(targets, probes, timeout))
+    elapsed = time.perf_counter() - start
+
+    by_name = {target['name']: target for target in targets}
+    mismatches = []
+    for (protocol, port), observed in matrices.items():
+        expected = {(src, dst): expected_reachable(by_name[src], by_name[dst], protocol, port, peered)
+                    for src, dst in observed}
+        label = probe_label(protocol, port)
+        print(f"\nReachability matrix for {label} (+ reachable, . blocked, ! differs from expected)")
+        print_matrix(targets, observed, expected)
+        for (src, dst), reachable in observed.items():
+            if reachable != expected[(src, dst)]:
+                mismatches.append(f"{src} -> {dst} ({by_name[dst]['ip']}) {label}: expected "
+                                  f"{'reachable' if expected[(src, dst)] else 'blocked'}, "
+                                  f"observed {'reachable' if reachable else 'blocked'}")
+    print()
+
+    pairs = sum(len(observed) for observed in matrices.values())
+    if mismatches:
+        for mismatch in mismatches:
+            logger.error(f"Mismatch: {mismatch}")
+        logger.error(f"{len(mismatches)} of {pairs} probe(s) differ from the expected matrix ({elapsed:.2f} s)")
+        return False
+
+    logger.info(f"All {pairs} probe(s) match the expected matrix ({elapsed:.2f} s)")
+    return True
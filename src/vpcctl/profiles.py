@@ -0,0 +1,174 @@
+import os
+import shutil
+from pathlib import Path
+from . import kernel
+from .utils import logger, run_command
+from .state import (
+    update_state,
+    get_vpc,
+    load_state,
+    vpc_lock
+)
+
+SYS_CLASS_NET = Path("/sys/class/net")
+DEFAULT_PROFILE = "default"
+MAX_QUEUES = 64
+
+KERNEL_DEFAULTS = {
+    "mtu": 1500,
+    "txqueuelen": 1000,
+    "queues": 1,
+    "offloads": {"gro": "off", "tso": "on", "gso": "on"},
+    "bridge": {"multicast_snooping": 1, "stp_state": 0}
+}
+
+PROFILES = {
+    "default": {},
+    "throughput": {
+        "mtu": 9000,
+        "txqueuelen": 10000,
+        "queues": "cpus",
+        "offloads": {"gro": "on", "tso": "on", "gso": "on"},
+        "bridge": {"multicast_snooping": 0, "stp_state": 0}
+    },
+    "low-latency": {
+        "mtu": 1500,
+        "txqueuelen": 256,
+        "queues": "cpus",
+        "offloads": {"gro": "off", "tso": "off", "gso": "off"},
+        "bridge": {"multicast_snooping": 0, "stp_state": 0}
+    }
+}
+
+def queue_count():
+    return min(os.cpu_count() or 1, MAX_QUEUES)
+
+def settings(name, in_place=False):
+    resolved = {**(KERNEL_DEFAULTS if in_place else {}), **PROFILES[name]}
+    if resolved.get('queues') == "cpus":
+        resolved['queues'] = queue_count()
+    return resolved
+
+def profile_of(item):
+    return item.get('perf_profile', DEFAULT_PROFILE)
+
+def veth_options(vpc, profile, in_place=False):
+    tuning = settings(profile, in_place)
+    return {
+        "mtu": settings(profile_of(vpc), in_place).get('mtu'),
+        "txqueuelen": tuning.get('txqueuelen'),
+        "queues": tuning.get('queues')
+    }
+
+def peering_mtu(vpc1, vpc2, in_place=False):
+    if not in_place and not any(settings(profile_of(v)).get('mtu') for v in (vpc1, vpc2)):
+        return None
+    return min(settings(profile_of(v), in_place=True)['mtu'] for v in (vpc1, vpc2))
+
+def validate_profile(name):
+    if name not in PROFILES:
+        logger.error(f"Unknown perf profile '{name}'. Must be one of: {', '.join(PROFILES)}")
+        return False
+    return True
+
+def tune_bridge(bridge, profile, in_place=False):
+    tuning = settings(profile, in_place)
+    with kernel.batch() as link:
+        link.set_options(bridge, mtu=tuning.get('mtu'))
+    for option, value in tuning.get('bridge', {}).items():
+        path = SYS_CLASS_NET / bridge / "bridge" / option
+        logger.debug(f"Writing {value} to {path}")
+        path.write_text(f"{value}\n")
+
+def tune_offloads(dev, profile, namespace=None, in_place=False):
+    tuning = settings(profile, in_place)
+    prefix = f"ip netns exec {namespace} " if namespace else ""
+    commands = []
+    if tuning.get('offloads'):
+        commands.append(f"ethtool -K {dev} " + " ".join(f"{k} {v}" for k, v in tuning['offloads'].items()))
+    if in_place and tuning.get('queues'):
+        commands.append(f"ethtool -L {dev} rx {tuning['queues']} tx {tuning['queues']}")
+
+    if commands and not shutil.which("ethtool"):
+        logger.debug(f"ethtool is not installed, skipping offload and channel tuning on {dev}")
+        return
+
+    for command in commands:
+        result = run_command(prefix + command, check=False)
+        if result.returncode != 0:
+            logger.debug(f"'{command}' failed on {dev}: {result.stderr.strip()}")
+
+def tune_veth(vpc, profile, veth_br, veth_ns, namespace, in_place=False):
+    if in_place:
+        options = veth_options(vpc, profile, in_place)
+        with kernel.batch() as link:
+            link.set_options(veth_br, mtu=options['mtu'], txqueuelen=options['txqueuelen'])
+        with kernel.batch(namespace) as link:
+            link.set_options(veth_ns, mtu=options['mtu'], txqueuelen=options['txqueuelen'])
+    tune_offloads(veth_br, profile, in_place=in_place)
+    tune_offloads(veth_ns, profile, namespace, in_place)
+
+def _retune_subnet(vpc, subnet, profile):
+    tune_veth(vpc, profile, subnet['veth_br'], subnet['veth_ns'], subnet['namespace'], in_place=True)
+    for instance in subnet.get('instances', []):
+        tune_veth(vpc, profile, instance['veth_br'], instance['veth_ns'], instance['namespace'], in_place=True)
+
+def set_perf_profile(vpc_name, profile, subnet_name=None):
+    if not validate_profile(profile):
+        return False
+
+    with vpc_lock(vpc_name):
+        return _set_perf_profile(vpc_name, profile, subnet_name)
+
+def _set_perf_profile(vpc_name, profile, subnet_name):
+    vpc = get_vpc(vpc_name)
+    if not vpc:
+        logger.error(f"VPC '{vpc_name}' not found")
+        return False
+
+    if subnet_name:
+        subnet = next((s for s in vpc.get('subnets', []) if s['name'] == subnet_name), None)
+        if not subnet:
+            logger.error(f"Subnet '{subnet_name}' not found in VPC '{vpc_name}'")
+            return False
+        subnets = [subnet]
+    else:
+        subnets = vpc.get('subnets', [])
+        vpc = {**vpc, "perf_profile": profile}
+
+    try:
+        if not subnet_name:
+            tune_bridge(vpc['bridge'], profile, in_place=True)
+            logger.info(f"Applied perf profile '{profile}' to bridge {vpc['bridge']}")
+            vpcs = {v['name']: v for v in load_state()['vpcs']}
+            for p in vpc.get('peerings', []):
+                other = vpcs.get(p['vpc2'] if p['vpc1'] == vpc_name else p['vpc1'])
+                if other and 'veth1' in p:
+                    with kernel.batch(check=False) as link:
+                        mtu = peering_mtu(vpc, other, in_place=True)
+                        link.set_options(p['veth1'], mtu=mtu)
+                        link.set_options(p['veth2'], mtu=mtu)
+
+        for subnet in subnets:
+            _retune_subnet(vpc, subnet, profile)
+            logger.info(f"Applied perf profile '{profile}' to subnet '{subnet['name']}'")
+
+        retuned = {subnet['name'] for subnet in subnets}
+        with update_state() as state:
+            for v in state['vpcs']:
+                if v['name'] != vpc_name:
+                    continue
+                targets = [s for s in v['subnets'] if s['name'] in retuned]
+                for item in targets if subnet_name else [v] + targets:
+                    if profile == DEFAULT_PROFILE:
+                        item.pop('perf_profile', None)
+                    else:
+                        item['perf_profile'] = profile
+
+        target = f"subnet '{subnet_name}' in VPC '{vpc_name}'" if subnet_name else f"VPC '{vpc_name}'"
+        logger.info(f"Perf profile '{profile}' applied to {target}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to apply perf profile: {e}")
+        return False
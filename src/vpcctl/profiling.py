@@ -0,0 +1,193 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+active = False
+_recording = False
+_events = []
+_hooks = []
+_lock = threading.Lock()
+
+class Span:
+    __slots__ = ('name', 'category', 'args', 'start')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        event = {
+            "name": self.name,
+            "cat": self.category,
+            "ts": self.start,
+            "dur": end - self.start,
+            "tid": threading.get_native_id(),
+            "args": self.args
+        }
+        if exc_type is not None:
+            event["args"] = {**self.args, "error": exc_type.__name__}
+        _record(event)
+        return False
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_SPAN = NullSpan()
+
+def span(name, category, **args):
+    if not active:
+        return NULL_SPAN
+    return Span(name, category, args)
+
+def command_span(cmd):
+    if not active:
+        return NULL_SPAN
+    return Span(command_type(cmd), "command", {"cmd": cmd})
+
+def _record(event):
+    if _recording:
+        with _lock:
+            _events.append(event)
+    for hook in _hooks:
+        hook(event)
+
+def _update_active():
+    global active
+    active = _recording or bool(_hooks)
+
+def enable():
+    global _recording
+    _recording = True
+    _update_active()
+
+def disable():
+    global _recording
+    _recording = False
+    _update_active()
+
+def reset():
+    with _lock:
+        _events.clear()
+
+def add_hook(hook):
+    _hooks.append(hook)
+    _update_active()
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+    _update_active()
+
+def command_type(cmd):
+    words = cmd.split()
+    prefix = ""
+    if words[:3] == ['ip', 'netns', 'exec'] and len(words) > 4:
+        prefix = "netns "
+        words = words[4:]
+    elif words[:1] == ['ip'] and '-n' in words[:2]:
+        prefix = "netns "
+        words = words[:1] + words[3:]
+
+    program = os.path.basename(words[0]) if words else "?"
+    if program == 'ip':
+        subcommand = next((w for w in words[1:] if not w.startswith('-')), None)
+        if subcommand is None and '-batch' in words:
+            subcommand = 'batch'
+        return f"{prefix}ip {subcommand or ''}".rstrip()
+
+    action = next((w for w in words[1:] if w in ('-A', '-I', '-D', '-C', '-F', '-X', '-N', '-L', '-S')), None)
+    return f"{prefix}{program} {action or ''}".rstrip()
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def summarize(durations):
+    values = sorted(durations)
+    return {
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p90_ms": percentile(values, 0.90) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000
+    }
+
+class Aggregator:
+    def __init__(self, window=2048):
+        self.window = window
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def __call__(self, event):
+        key = (event["cat"], event["name"])
+        with self.lock:
+            entry = self.metrics.get(key)
+            if entry is None:
+                entry = self.metrics[key] = {"count": 0, "total": 0.0, "recent": deque(maxlen=self.window)}
+            entry["count"] += 1
+            entry["total"] += event["dur"]
+            entry["recent"].append(event["dur"])
+
+    def snapshot(self):
+        with self.lock:
+            items = [(key, entry["count"], entry["total"], list(entry["recent"]))
+                     for key, entry in self.metrics.items()]
+        result = []
+        for (category, name), count, total, recent in sorted(items):
+            result.append({"category": category, "name": name, "count": count,
+                           "total_ms": total * 1000, **summarize(recent)})
+        return result
+
+def summary():
+    aggregator = Aggregator(window=None)
+    with _lock:
+        events = list(_events)
+    for event in events:
+        aggregator(event)
+    return aggregator.snapshot()
+
+def print_summary(rows, file):
+    print(f"\n{'Category':<10} {'Span':<34} {'Count':>6} {'Total':>10} {'p50':>9} {'p90':>9} {'p99':>9} {'Max':>9}",
+          file=file)
+    print("-" * 102, file=file)
+    for row in sorted(rows, key=lambda r: r["total_ms"], reverse=True):
+        print(f"{row['category']:<10} {row['name'][:34]:<34} {row['count']:>6} {row['total_ms']:>8.1f}ms "
+              f"{row['p50_ms']:>7.2f}ms {row['p90_ms']:>7.2f}ms {row['p99_ms']:>7.2f}ms {row['max_ms']:>7.2f}ms",
+              file=file)
+
+def write_trace(path):
+    with _lock:
+        events = list(_events)
+
+    origin = min((event["ts"] for event in events), default=0.0)
+    pid = os.getpid()
+    trace = [{
+        "name": event["name"],
+        "cat": event["cat"],
+        "ph": "X",
+        "ts": round((event["ts"] - origin) * 1e6, 3),
+        "dur": round(event["dur"] * 1e6, 3),
+        "pid": pid,
+        "tid": event["tid"],
+        "args": event["args"]
+    } for event in events]
+
+    with open(path, 'w') as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+    return len(trace)
@@ -1,77 +1,66 @@
+from . import kernel
+from . import netfilter
 from .utils import (
     logger,
-    run_command,
-    load_state,
+    read_sysctl,
+    write_sysctl
+)
+from .state import (
     get_vpc,
-    get_subnet
+    get_subnet,
+    get_hub
 )
 
-def setup_nat(vpc_name, subnet_cidr, internet_interface):
+def setup_nat(vpc_name, uplink):
     try:
-        result = run_command("cat /proc/sys/net/ipv4/ip_forward", check=True)
-        if result.stdout.strip() != "1":
-            run_command("echo 1 > /proc/sys/net/ipv4/ip_forward")
+        if read_sysctl("net/ipv4/ip_forward") != "1":
+            write_sysctl("net/ipv4/ip_forward", 1)
             logger.info("IP forwarding enabled")
         
         vpc = get_vpc(vpc_name)
-        bridge = vpc['bridge']
-        
-        run_command(f"iptables -t nat -A POSTROUTING -s {subnet_cidr} -o {internet_interface} -j MASQUERADE")
-        logger.info(f"Added MASQUERADE rule for {subnet_cidr} on {internet_interface}")
-        
-        run_command(f"iptables -A FORWARD -i {bridge} -o {internet_interface} -j ACCEPT")
-        logger.info(f"Added FORWARD rule for bridge to {internet_interface}")
-        
-        run_command(f"iptables -A FORWARD -i {internet_interface} -o {bridge} -m state --state RELATED,ESTABLISHED -j ACCEPT")
-        logger.info(f"Added FORWARD rule for {internet_interface} to bridge")
-        
-        state = load_state()
-        all_vpcs = state.get('vpcs', [])
-        for other_vpc in all_vpcs:
-            if other_vpc['name'] != vpc_name:
-                other_bridge = other_vpc['bridge']
-                run_command(f"iptables -I FORWARD -i {bridge} -o {other_bridge} -j DROP", check=False)
-                run_command(f"iptables -I FORWARD -i {other_bridge} -o {bridge} -j DROP", check=False)
-                logger.info(f"Added isolation rules between {bridge} and {other_bridge}")
+        netfilter.backend().setup_nat(vpc, uplink)
         
-        logger.info(f"NAT setup completed for {subnet_cidr}")
+        logger.info(f"NAT setup completed for {vpc['cidr']} via {uplink['interface']}")
         return True
         
     except Exception as e:
         logger.error(f"Failed to setup NAT: {e}")
         return False
 
-def add_inter_subnet_routes(vpc_name):
+def ensure_intra_vpc_forwarding(vpc):
+    netfilter.backend().allow_intra_vpc(vpc)
+
+def subnet_routes(vpc):
+    routes = [vpc['cidr']]
+    for p in vpc.get('peerings', []):
+        peer_name = p['vpc2'] if p['vpc1'] == vpc['name'] else p['vpc1']
+        peer = get_vpc(peer_name)
+        if peer:
+            routes.append(peer['cidr'])
+    hub = get_hub(vpc['hub']) if vpc.get('hub') else None
+    if hub:
+        routes.append(hub['cidr'])
+    return routes
+
+def add_inter_subnet_routes(vpc_name, subnet_name):
     vpc = get_vpc(vpc_name)
-    if not vpc:
-        logger.error(f"VPC '{vpc_name}' not found")
+    subnet = get_subnet(vpc_name, subnet_name)
+    if not vpc or not subnet:
+        logger.error(f"Subnet '{subnet_name}' not found in VPC '{vpc_name}'")
         return False
     
-    subnets = vpc.get('subnets', [])
-    bridge = vpc['bridge']
-    
-    if len(subnets) < 2:
-        logger.info(f"VPC '{vpc_name}' has less than 2 subnets, no inter-subnet routes needed")
-        return True
+    namespace = subnet['namespace']
+    gateway = subnet['gateway']
     
     try:
-        run_command(f"iptables -A FORWARD -i {bridge} -o {bridge} -j ACCEPT", check=False)
-        logger.info(f"Added iptables rule for inter-bridge forwarding on {bridge}")
+        ensure_intra_vpc_forwarding(vpc)
         
-        for subnet1 in subnets:
-            ns1 = subnet1['namespace']
-            gateway1 = subnet1['gateway']
-            
-            for subnet2 in subnets:
-                if subnet1['name'] == subnet2['name']:
-                    continue
-                
-                cidr2 = subnet2['cidr']
-                
-                run_command(f"ip netns exec {ns1} ip route add {cidr2} via {gateway1}", check=False)
-                logger.info(f"Added route in {ns1}: {cidr2} via {gateway1}")
+        with kernel.batch(namespace, check=False) as link:
+            for cidr in subnet_routes(vpc):
+                link.add_route(cidr, via=gateway, replace=True)
+                logger.info(f"Added route in {namespace}: {cidr} via {gateway}")
         
-        logger.info(f"Inter-subnet routes configured for VPC '{vpc_name}'")
+        logger.info(f"Inter-subnet routes configured for subnet '{subnet_name}' in VPC '{vpc_name}'")
         return True
         
     except Exception as e:
@@ -79,8 +68,9 @@ def add_inter_subnet_routes(vpc_name):
         return False
 
 def setup_private_subnet_routing(vpc_name, subnet_name):
+    vpc = get_vpc(vpc_name)
     subnet = get_subnet(vpc_name, subnet_name)
-    if not subnet:
+    if not vpc or not subnet:
         logger.error(f"Subnet '{subnet_name}' not found in VPC '{vpc_name}'")
         return False
     
@@ -88,17 +78,15 @@ def setup_private_subnet_routing(vpc_name, subnet_name):
     gateway = subnet['gateway']
     
     try:
-        vpc = get_vpc(vpc_name)
-        all_subnets = vpc.get('subnets', [])
+        ensure_intra_vpc_forwarding(vpc)
         
-        run_command(f"ip netns exec {namespace} ip route del default", check=False)
-        logger.info(f"Removed default route from private subnet {namespace}")
-        
-        for other_subnet in all_subnets:
-            if other_subnet['name'] != subnet_name:
-                other_cidr = other_subnet['cidr']
-                run_command(f"ip netns exec {namespace} ip route add {other_cidr} via {gateway}", check=False)
-                logger.info(f"Re-added route to {other_cidr} via {gateway} in private subnet {namespace}")
+        with kernel.batch(namespace, check=False) as link:
+            link.del_route("default")
+            logger.info(f"Removed default route from private subnet {namespace}")
+            
+            for cidr in subnet_routes(vpc):
+                link.add_route(cidr, via=gateway, replace=True)
+                logger.info(f"Added route to {cidr} via {gateway} in private subnet {namespace}")
         
         logger.info(f"Private subnet routing configured for {subnet_name}")
         return True
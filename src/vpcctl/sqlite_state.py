@@ -0,0 +1,179 @@
+import json
+import sqlite3
+from . import profiling
+from .utils import logger
+from .state import StateStore, io_stats
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vpcs (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subnets (
+    vpc TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (vpc, name)
+);
+CREATE TABLE IF NOT EXISTS peerings (
+    vpc1 TEXT NOT NULL,
+    vpc2 TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (vpc1, vpc2)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+MAX_SNAPSHOTS = 8
+
+def _dump(value):
+    return json.dumps(value, separators=(',', ':'), sort_keys=True)
+
+def document_rows(data):
+    rows = {}
+
+    for key, value in data.items():
+        if key != 'vpcs':
+            rows[('meta', key)] = _dump(value)
+
+    for vpc in data['vpcs']:
+        fields = {k: v for k, v in vpc.items() if k not in ('subnets', 'peerings')}
+        rows[('vpcs', vpc['name'])] = _dump(fields)
+
+        for subnet in vpc.get('subnets', []):
+            rows[('subnets', vpc['name'], subnet['name'])] = _dump(subnet)
+
+        for peering in vpc.get('peerings', []):
+            rows[('peerings', peering['vpc1'], peering['vpc2'])] = _dump(peering)
+
+    return rows
+
+class SqliteStateStore(StateStore):
+    def __init__(self, path):
+        super().__init__(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.snapshots = {}
+
+    def _signature(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _read_document(self):
+        vpcs = []
+        by_name = {}
+        size = 0
+
+        for name, data in self.conn.execute("SELECT name, data FROM vpcs ORDER BY rowid"):
+            size += len(data)
+            vpc = json.loads(data)
+            vpc['subnets'] = []
+            vpc['peerings'] = []
+            vpcs.append(vpc)
+            by_name[name] = vpc
+
+        for vpc_name, data in self.conn.execute("SELECT vpc, data FROM subnets ORDER BY rowid"):
+            size += len(data)
+            if vpc_name in by_name:
+                by_name[vpc_name]['subnets'].append(json.loads(data))
+
+        for vpc1, vpc2, data in self.conn.execute("SELECT vpc1, vpc2, data FROM peerings ORDER BY rowid"):
+            size += len(data)
+            for name in (vpc1, vpc2):
+                if name in by_name:
+                    by_name[name]['peerings'].append(json.loads(data))
+
+        document = {"vpcs": vpcs}
+        for key, data in self.conn.execute("SELECT key, data FROM meta ORDER BY rowid"):
+            size += len(data)
+            document[key] = json.loads(data)
+
+        io_stats['reads'] += 1
+        io_stats['bytes_read'] += size
+
+        return document
+
+    def _remember(self, data, rows):
+        self.snapshots.pop(id(data), None)
+        self.snapshots[id(data)] = (data, rows)
+        while len(self.snapshots) > MAX_SNAPSHOTS:
+            self.snapshots.pop(next(iter(self.snapshots)))
+
+    def load(self):
+        with self.lock:
+            if self.dirty:
+                return self.data
+
+            signature = self._signature()
+            if self.data is None or signature != self.signature:
+                with profiling.span("state.load", "state", path=str(self.path)):
+                    data = self._read_document()
+                self._remember(data, document_rows(data))
+                self.signature = signature
+                self._index(data)
+                logger.debug(f"Loaded state from {self.path}")
+
+            return self.data
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+
+            rows = document_rows(self.data)
+            _, baseline = self.snapshots.get(id(self.data), (None, {}))
+
+            upserts = [(key, value) for key, value in rows.items() if baseline.get(key) != value]
+            deletes = [key for key in baseline if key not in rows]
+
+            with profiling.span("state.flush", "state", path=str(self.path), rows=len(upserts) + len(deletes)):
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    signature = self._signature()
+                    for key in deletes:
+                        self._delete_row(key)
+                    for key, value in upserts:
+                        self._upsert_row(key, value)
+                    self.conn.execute("COMMIT")
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    raise
+
+            io_stats['writes'] += 1
+            io_stats['bytes_written'] += sum(len(value) for _, value in upserts)
+            logger.debug(f"Wrote {len(upserts)} and deleted {len(deletes)} state rows")
+            self._remember(self.data, rows)
+            if signature != self.signature:
+                self.signature = None
+            self.dirty = False
+
+    def _upsert_row(self, key, value):
+        table = key[0]
+        if table == 'vpcs':
+            self.conn.execute("INSERT INTO vpcs (name, data) VALUES (?, ?) "
+                              "ON CONFLICT (name) DO UPDATE SET data = excluded.data", (key[1], value))
+        elif table == 'subnets':
+            self.conn.execute("INSERT INTO subnets (vpc, name, data) VALUES (?, ?, ?) "
+                              "ON CONFLICT (vpc, name) DO UPDATE SET data = excluded.data", (key[1], key[2], value))
+        elif table == 'peerings':
+            self.conn.execute("INSERT INTO peerings (vpc1, vpc2, data) VALUES (?, ?, ?) "
+                              "ON CONFLICT (vpc1, vpc2) DO UPDATE SET data = excluded.data", (key[1], key[2], value))
+        else:
+            self.conn.execute("INSERT INTO meta (key, data) VALUES (?, ?) "
+                              "ON CONFLICT (key) DO UPDATE SET data = excluded.data", (key[1], value))
+
+    def _delete_row(self, key):
+        table = key[0]
+        if table == 'vpcs':
+            self.conn.execute("DELETE FROM vpcs WHERE name = ?", (key[1],))
+        elif table == 'subnets':
+            self.conn.execute("DELETE FROM subnets WHERE vpc = ? AND name = ?", (key[1], key[2]))
+        elif table == 'peerings':
+            self.conn.execute("DELETE FROM peerings WHERE vpc1 = ? AND vpc2 = ?", (key[1], key[2]))
+        else:
+            self.conn.execute("DELETE FROM meta WHERE key = ?", (key[1],))
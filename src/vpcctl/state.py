@@ -0,0 +1,280 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from . import utils
+from . import profiling
+from .prefixes import PrefixTrie
+from .utils import logger
+
+io_stats = {"reads": 0, "writes": 0, "bytes_read": 0, "bytes_written": 0}
+
+class StateStore:
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.signature = None
+        self.dirty = False
+        self.deferred = 0
+        self.pretty = os.environ.get("VPCCTL_STATE_PRETTY") == "1"
+        self.lock = threading.RLock()
+        self.vpcs = {}
+        self.subnets = {}
+        self.namespaces = {}
+        self.bridges = {}
+        self.vpc_cidrs = {}
+        self.subnet_cidrs = {}
+        self.generation = 0
+        self.vpc_prefixes = PrefixTrie()
+        self.subnet_prefixes = PrefixTrie()
+
+    def _signature(self):
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _index(self, data):
+        self.data = data
+        self.vpcs = {}
+        self.subnets = {}
+        self.namespaces = {}
+        self.bridges = {}
+        self.vpc_cidrs = {}
+        self.subnet_cidrs = {}
+        self.generation += 1
+
+        for vpc in data['vpcs']:
+            self.vpcs[vpc['name']] = vpc
+            self.bridges[vpc['bridge']] = vpc
+            self.vpc_cidrs[vpc['name']] = vpc['cidr']
+            for subnet in vpc.get('subnets', []):
+                self.subnets[(vpc['name'], subnet['name'])] = subnet
+                self.subnet_cidrs[(vpc['name'], subnet['name'])] = subnet['cidr']
+                self.namespaces[subnet['namespace']] = (vpc, subnet)
+                for instance in subnet.get('instances', []):
+                    self.namespaces[instance['namespace']] = (vpc, subnet)
+
+    def prefix_index(self):
+        self.vpc_prefixes.sync(self.vpc_cidrs, self.generation)
+        self.subnet_prefixes.sync(self.subnet_cidrs, self.generation)
+        return self.vpc_prefixes, self.subnet_prefixes
+
+    def load(self):
+        with self.lock:
+            if self.dirty:
+                return self.data
+
+            signature = self._signature()
+            if self.data is None or signature != self.signature:
+                if signature is None:
+                    data = {"vpcs": []}
+                else:
+                    with profiling.span("state.load", "state", path=str(self.path)), open(self.path, 'r') as f:
+                        data = json.load(f)
+                    io_stats['reads'] += 1
+                    io_stats['bytes_read'] += signature[2]
+                    logger.debug(f"Loaded state from {self.path}")
+                self.signature = signature
+                self._index(data)
+
+            return self.data
+
+    def save(self, data):
+        with self.lock:
+            self._index(data)
+            self.dirty = True
+            if not self.deferred:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+
+            with profiling.span("state.flush", "state", path=str(self.path)):
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                temp_file = self.path.with_suffix('.tmp')
+                with open(temp_file, 'w') as f:
+                    if self.pretty:
+                        json.dump(self.data, f, indent=2)
+                    else:
+                        json.dump(self.data, f, separators=(',', ':'))
+                    io_stats['writes'] += 1
+                    io_stats['bytes_written'] += f.tell()
+                temp_file.replace(self.path)
+
+            self.signature = self._signature()
+            self.dirty = False
+
+    @contextmanager
+    def deferred_writes(self):
+        with self.lock:
+            self.deferred += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.deferred -= 1
+                if not self.deferred:
+                    self.flush()
+
+_store = None
+_file_locks = {}
+_thread_locks = {}
+_locks_guard = threading.Lock()
+
+class SharedFileLock:
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.count = 0
+        self.mutex = threading.Lock()
+
+    def acquire(self):
+        with self.mutex:
+            if not self.count:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self.fd = fd
+            self.count += 1
+
+    def release(self):
+        with self.mutex:
+            self.count -= 1
+            if not self.count:
+                get_store().flush()
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+                os.close(self.fd)
+                self.fd = None
+
+def use_sqlite():
+    if utils.STATE_BACKEND == "sqlite":
+        return True
+    return utils.STATE_BACKEND == "auto" and utils.STATE_DB.exists()
+
+def get_store():
+    global _store
+    path = utils.STATE_DB if use_sqlite() else utils.STATE_FILE
+    if _store is None or _store.path != path:
+        if path == utils.STATE_DB:
+            from .sqlite_state import SqliteStateStore
+            _store = SqliteStateStore(path)
+        else:
+            _store = StateStore(path)
+    return _store
+
+def load_state():
+    return get_store().load()
+
+def save_state(data):
+    get_store().save(data)
+
+def deferred_writes():
+    return get_store().deferred_writes()
+
+@contextmanager
+def update_state():
+    store = get_store()
+    with store.lock:
+        data = store.load()
+        yield data
+        store.save(data)
+
+def get_vpc(name):
+    store = get_store()
+    store.load()
+    return store.vpcs.get(name)
+
+def get_subnet(vpc_name, subnet_name):
+    store = get_store()
+    store.load()
+    return store.subnets.get((vpc_name, subnet_name))
+
+def get_hub(name):
+    return next((h for h in load_state().get('hubs', []) if h['name'] == name), None)
+
+def get_vpc_by_bridge(bridge):
+    store = get_store()
+    store.load()
+    return store.bridges.get(bridge)
+
+def find_overlapping_vpc(cidr):
+    store = get_store()
+    with store.lock:
+        store.load()
+        vpc_prefixes, _ = store.prefix_index()
+        return vpc_prefixes.find_overlap(cidr)
+
+def find_overlapping_subnet(cidr):
+    store = get_store()
+    with store.lock:
+        store.load()
+        _, subnet_prefixes = store.prefix_index()
+        return subnet_prefixes.find_overlap(cidr)
+
+def lookup_address(address):
+    store = get_store()
+    with store.lock:
+        store.load()
+        vpc_prefixes, subnet_prefixes = store.prefix_index()
+        subnet_key = subnet_prefixes.longest_match(address)
+        if subnet_key:
+            return store.vpcs[subnet_key[0]], store.subnets[subnet_key]
+        vpc_name = vpc_prefixes.longest_match(address)
+        return store.vpcs.get(vpc_name), None
+
+def find_namespace(namespace):
+    store = get_store()
+    store.load()
+    return store.namespaces.get(namespace, (None, None))
+
+@contextmanager
+def vpc_lock(*vpc_names):
+    names = sorted(set(vpc_names))
+    file_lock_names = names if use_sqlite() else [".state"]
+
+    with _locks_guard:
+        thread_locks = [_thread_locks.setdefault(name, threading.RLock()) for name in names]
+        file_locks = [_file_locks.setdefault(name, SharedFileLock(utils.LOCK_DIR / f"{name}.lock"))
+                      for name in file_lock_names]
+
+    acquired = []
+    try:
+        for lock in thread_locks + file_locks:
+            lock.acquire()
+            acquired.append(lock)
+        yield
+    finally:
+        for lock in reversed(acquired):
+            lock.release()
+
+def migrate_to_sqlite():
+    if not utils.STATE_FILE.exists():
+        logger.error(f"No JSON state found at {utils.STATE_FILE}")
+        return False
+
+    if utils.STATE_DB.exists():
+        logger.error(f"SQLite state already exists at {utils.STATE_DB}")
+        return False
+
+    with open(utils.STATE_FILE, 'r') as f:
+        data = json.load(f)
+
+    from .sqlite_state import SqliteStateStore
+    store = SqliteStateStore(utils.STATE_DB)
+    store.save(data)
+
+    migrated = utils.STATE_FILE.with_suffix('.json.migrated')
+    utils.STATE_FILE.replace(migrated)
+
+    global _store
+    _store = store
+
+    subnet_count = sum(len(vpc.get('subnets', [])) for vpc in data['vpcs'])
+    logger.info(f"Migrated {len(data['vpcs'])} VPCs and {subnet_count} subnets to {utils.STATE_DB}")
+    logger.info(f"Previous state file kept as {migrated}")
+    return True
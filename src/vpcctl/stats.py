@@ -0,0 +1,194 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from .utils import (
+    DEFAULT_WORKERS,
+    logger,
+    map_in_context,
+    run_command
+)
+from .state import load_state
+
+SYS_CLASS_NET = Path("/sys/class/net")
+INTERFACE_COUNTERS = (
+    "rx_bytes", "tx_bytes", "rx_packets", "tx_packets",
+    "rx_dropped", "tx_dropped", "rx_errors", "tx_errors"
+)
+
+METRICS = {
+    **{f"vpcctl_interface_{counter}_total": f"Interface {counter.replace('_', ' ')} from sysfs"
+       for counter in INTERFACE_COUNTERS},
+    "vpcctl_rule_packets_total": "Packets matched by an iptables rule inside a subnet namespace",
+    "vpcctl_rule_bytes_total": "Bytes matched by an iptables rule inside a subnet namespace",
+    "vpcctl_stats_collection_seconds": "Time taken to collect this snapshot",
+    "vpcctl_stats_namespace_errors": "Namespaces whose rule counters could not be read"
+}
+
+def owned_interfaces(vpcs):
+    interfaces = {}
+    for vpc in vpcs:
+        interfaces[vpc['bridge']] = {"vpc": vpc['name'], "role": "bridge"}
+        for subnet in vpc.get('subnets', []):
+            interfaces[subnet['veth_br']] = {"vpc": vpc['name'], "subnet": subnet['name'], "role": "subnet"}
+            for instance in subnet.get('instances', []):
+                interfaces[instance['veth_br']] = {"vpc": vpc['name'], "subnet": subnet['name'],
+                                                   "instance": instance['name'], "role": "instance"}
+        for p in vpc.get('peerings', []):
+            if 'veth1' not in p:
+                continue
+            interfaces.setdefault(p['veth1'], {"vpc": p['vpc1'], "peer": p['vpc2'], "role": "peering"})
+            interfaces.setdefault(p['veth2'], {"vpc": p['vpc2'], "peer": p['vpc1'], "role": "peering"})
+    return interfaces
+
+def owned_namespaces(vpcs):
+    namespaces = {}
+    for vpc in vpcs:
+        for subnet in vpc.get('subnets', []):
+            namespaces[subnet['namespace']] = {"vpc": vpc['name'], "subnet": subnet['name']}
+            for instance in subnet.get('instances', []):
+                namespaces[instance['namespace']] = {"vpc": vpc['name'], "subnet": subnet['name'],
+                                                     "instance": instance['name']}
+    return namespaces
+
+def read_interface_counters(name):
+    statistics = SYS_CLASS_NET / name / "statistics"
+    counters = {}
+    for counter in INTERFACE_COUNTERS:
+        try:
+            with open(statistics / counter) as f:
+                counters[counter] = int(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+    return counters
+
+def parse_rule_counters(output):
+    rules = []
+    positions = {}
+    for line in output.splitlines():
+        if not line.startswith('['):
+            continue
+        counters, _, rule = line.partition('] ')
+        packets, _, size = counters[1:].partition(':')
+        _, chain, spec = rule.split(' ', 2)
+        positions[chain] = positions.get(chain, 0) + 1
+        rules.append((chain, positions[chain], spec, int(packets), int(size)))
+    return rules
+
+def read_rule_counters(namespace):
+    result = run_command(f"ip netns exec {namespace} iptables-save -c -t filter", check=False)
+    if result.returncode != 0:
+        logger.debug(f"Could not read rule counters in {namespace}: {result.stderr.strip()}")
+        return None
+    return parse_rule_counters(result.stdout)
+
+def collect(workers=DEFAULT_WORKERS):
+    start = time.perf_counter()
+    vpcs = load_state()['vpcs']
+    interfaces = owned_interfaces(vpcs)
+    namespaces = owned_namespaces(vpcs)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rule_results = map_in_context(pool, read_rule_counters, namespaces)
+
+        samples = []
+        for name, labels in interfaces.items():
+            counters = read_interface_counters(name)
+            if counters is None:
+                continue
+            for counter, value in counters.items():
+                samples.append((f"vpcctl_interface_{counter}_total", {"interface": name, **labels}, value))
+
+        errors = 0
+        for (namespace, labels), rules in zip(namespaces.items(), rule_results):
+            if rules is None:
+                errors += 1
+                continue
+            for chain, position, spec, packets, size in rules:
+                rule_labels = {"namespace": namespace, **labels, "chain": chain,
+                               "position": str(position), "rule": spec}
+                samples.append(("vpcctl_rule_packets_total", rule_labels, packets))
+                samples.append(("vpcctl_rule_bytes_total", rule_labels, size))
+
+    samples.append(("vpcctl_stats_namespace_errors", {}, errors))
+    samples.append(("vpcctl_stats_collection_seconds", {}, round(time.perf_counter() - start, 6)))
+    return samples
+
+def sample_key(metric, labels):
+    return (metric, tuple(sorted(labels.items())))
+
+def compute_rates(previous, samples, elapsed):
+    rates = []
+    for metric, labels, value in samples:
+        if not metric.endswith("_total"):
+            continue
+        before = previous.get(sample_key(metric, labels))
+        if before is None or value < before:
+            continue
+        rates.append((metric[:-len("_total")] + "_per_second", labels, round((value - before) / elapsed, 3)))
+    return rates
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus(samples):
+    lines = []
+    seen = set()
+    for metric, labels, value in sorted(samples, key=lambda s: s[0]):
+        if metric not in seen:
+            seen.add(metric)
+            kind = "counter" if metric.endswith("_total") else "gauge"
+            base = metric[:-len("_per_second")] + "_total" if metric.endswith("_per_second") else metric
+            description = METRICS.get(base, metric)
+            if metric.endswith("_per_second"):
+                description = f"{description} (rate per second)"
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+        label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+def render_ndjson(samples, timestamp):
+    return "".join(json.dumps({"timestamp": timestamp, "metric": metric, "labels": labels, "value": value},
+                              separators=(',', ':')) + "\n"
+                   for metric, labels, value in samples)
+
+def render(samples, output_format):
+    if output_format == "ndjson":
+        return render_ndjson(samples, round(time.time(), 3))
+    return render_prometheus(samples)
+
+def write_output(text, output):
+    if output is None:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        return
+
+    path = Path(output)
+    temp_file = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(temp_file, 'w') as f:
+        f.write(text)
+    temp_file.replace(path)
+
+def show_stats(output_format="prometheus", output=None, watch=None, workers=DEFAULT_WORKERS):
+    samples = collect(workers)
+    if watch is None:
+        write_output(render(samples, output_format), output)
+        logger.debug(f"Collected {len(samples)} samples")
+        return True
+
+    previous = {sample_key(metric, labels): value for metric, labels, value in samples}
+    last = time.monotonic()
+    try:
+        while True:
+            time.sleep(watch)
+            samples = collect(workers)
+            now = time.monotonic()
+            rates = compute_rates(previous, samples, now - last)
+            write_output(render(samples + rates, output_format), output)
+            previous = {sample_key(metric, labels): value for metric, labels, value in samples}
+            last = now
+    except KeyboardInterrupt:
+        return True
@@ -1,15 +1,34 @@
 import ipaddress
+from . import ipam
+from . import kernel
+from . import netfilter
+from . import profiles
+from .netns import NETNS_RUN_DIR
 from .utils import (
     logger,
-    run_command,
-    validate_cidr,
-    load_state,
-    save_state,
+    hashed_link,
+    write_sysctl,
+    validate_cidr
+)
+from .state import (
+    update_state,
     get_vpc,
-    get_subnet
+    get_subnet,
+    find_overlapping_subnet,
+    find_namespace,
+    lookup_address,
+    vpc_lock
 )
 
-def create_subnet(vpc_name, subnet_name, cidr, subnet_type):
+def namespace_in_use(namespace):
+    vpc, _ = find_namespace(namespace)
+    return vpc is not None or (NETNS_RUN_DIR / namespace).exists()
+
+def create_subnet(vpc_name, subnet_name, cidr, subnet_type, perf_profile=None):
+    with vpc_lock(vpc_name):
+        return _create_subnet(vpc_name, subnet_name, cidr, subnet_type, perf_profile)
+
+def _create_subnet(vpc_name, subnet_name, cidr, subnet_type, perf_profile=None):
     if not validate_cidr(cidr):
         logger.error(f"Invalid CIDR format: {cidr}")
         return False
@@ -19,6 +38,10 @@ def create_subnet(vpc_name, subnet_name, cidr, subnet_type):
         logger.error(f"VPC '{vpc_name}' not found")
         return False
     
+    perf_profile = perf_profile or profiles.profile_of(vpc)
+    if not profiles.validate_profile(perf_profile):
+        return False
+    
     vpc_network = ipaddress.ip_network(vpc['cidr'], strict=False)
     subnet_network = ipaddress.ip_network(cidr, strict=False)
     
@@ -30,49 +53,54 @@ def create_subnet(vpc_name, subnet_name, cidr, subnet_type):
         logger.error(f"Subnet '{subnet_name}' already exists in VPC '{vpc_name}'")
         return False
     
+    overlapping = find_overlapping_subnet(cidr)
+    if overlapping:
+        other_vpc, other_subnet = overlapping
+        logger.error(f"Subnet CIDR {cidr} overlaps subnet '{other_subnet}' "
+                     f"({get_subnet(other_vpc, other_subnet)['cidr']}) in VPC '{other_vpc}'")
+        return False
+    
     namespace = f"{vpc_name}-{subnet_name}"
-    veth_br = f"vb-{vpc_name[:4]}-{subnet_name[:4]}"
-    veth_ns = f"vn-{vpc_name[:4]}-{subnet_name[:4]}"
+    if namespace_in_use(namespace):
+        logger.error(f"Namespace {namespace} is already in use")
+        return False
+    
+    veth_br = hashed_link("vb-", f"{vpc_name}/{subnet_name}")
+    veth_ns = hashed_link("vn-", f"{vpc_name}/{subnet_name}")
     bridge = vpc['bridge']
     
-    subnet_hosts = list(subnet_network.hosts())
-    gateway_ip = str(subnet_hosts[0])
-    subnet_ip = str(subnet_hosts[1])
+    pool = ipam.new_pool(cidr)
+    try:
+        gateway_ip = ipam.allocate(pool, cidr)
+        subnet_ip = ipam.allocate(pool, cidr)
+    except ValueError:
+        logger.error(f"Subnet CIDR {cidr} is too small for a gateway and a host")
+        return False
     prefix = cidr.split('/')[1]
     
     try:
-        run_command(f"ip netns add {namespace}")
-        logger.info(f"Created namespace {namespace}")
+        with kernel.batch() as link:
+            link.add_netns(namespace)
+            link.add_veth(veth_br, veth_ns, peer_namespace=namespace, **profiles.veth_options(vpc, perf_profile))
+            link.set_master(veth_br, bridge)
+            link.add_addr(f"{gateway_ip}/{prefix}", bridge)
+            link.set_up(veth_br)
+        profiles.tune_veth(vpc, perf_profile, veth_br, veth_ns, namespace)
+        logger.info(f"Created namespace {namespace} and veth pair {veth_br} <-> {veth_ns}")
+        logger.info(f"Attached {veth_br} to bridge {bridge} with gateway {gateway_ip}/{prefix}")
         
-        run_command(f"ip link add {veth_br} type veth peer name {veth_ns}")
-        logger.info(f"Created veth pair {veth_br} <-> {veth_ns}")
-        
-        run_command(f"ip link set {veth_br} master {bridge}")
-        logger.info(f"Attached {veth_br} to bridge {bridge}")
-        
-        run_command(f"ip addr add {gateway_ip}/{prefix} dev {bridge}")
-        logger.info(f"Added IP {gateway_ip}/{prefix} to bridge {bridge}")
-        
-        run_command(f"echo 0 > /proc/sys/net/ipv4/conf/{veth_br}/rp_filter")
+        write_sysctl(f"net/ipv4/conf/{veth_br}/rp_filter", 0)
         logger.info(f"Disabled rp_filter on {veth_br}")
         
-        run_command(f"ip link set {veth_br} up")
-        logger.info(f"Brought up {veth_br}")
-        
-        run_command(f"ip link set {veth_ns} netns {namespace}")
-        logger.info(f"Moved {veth_ns} to namespace {namespace}")
-        
-        run_command(f"ip netns exec {namespace} ip addr add {subnet_ip}/{prefix} dev {veth_ns}")
-        logger.info(f"Assigned IP {subnet_ip}/{prefix} to {veth_ns}")
-        
-        run_command(f"ip netns exec {namespace} ip link set {veth_ns} up")
-        logger.info(f"Brought up {veth_ns} in namespace")
-        
-        run_command(f"ip netns exec {namespace} ip link set lo up")
-        logger.info(f"Brought up loopback in namespace")
-        
-        run_command(f"ip netns exec {namespace} ip route add default via {gateway_ip}")
-        logger.info(f"Added default route via {gateway_ip}")
+        with kernel.batch(namespace) as link:
+            link.add_addr(f"{subnet_ip}/{prefix}", veth_ns)
+            link.set_up(veth_ns)
+            link.set_up("lo")
+            if subnet_type == "public":
+                link.add_route("default", via=gateway_ip)
+        logger.info(f"Assigned IP {subnet_ip}/{prefix} to {veth_ns} in namespace {namespace}")
+        if subnet_type == "public":
+            logger.info(f"Added default route via {gateway_ip}")
         
         subnet_data = {
             "name": subnet_name,
@@ -82,38 +110,44 @@ def create_subnet(vpc_name, subnet_name, cidr, subnet_type):
             "ip": subnet_ip,
             "gateway": gateway_ip,
             "veth_br": veth_br,
-            "veth_ns": veth_ns
+            "veth_ns": veth_ns,
+            "ipam": pool,
+            "instances": []
         }
+        if perf_profile != profiles.DEFAULT_PROFILE:
+            subnet_data['perf_profile'] = perf_profile
         
-        state = load_state()
-        for v in state['vpcs']:
-            if v['name'] == vpc_name:
-                v['subnets'].append(subnet_data)
-                break
-        save_state(state)
+        with update_state() as state:
+            for v in state['vpcs']:
+                if v['name'] == vpc_name:
+                    v['subnets'].append(subnet_data)
+                    break
         
+        from . import routing as routing_module
         if subnet_type == "public":
-            from . import routing as routing_module
-            from .utils import get_default_interface
-            internet_interface = get_default_interface()
-            if internet_interface:
-                routing_module.setup_nat(vpc_name, cidr, internet_interface)
-                routing_module.add_inter_subnet_routes(vpc_name)
+            from .egress import cached_uplink
+            uplink = cached_uplink()
+            if uplink:
+                routing_module.setup_nat(vpc_name, uplink)
+            routing_module.add_inter_subnet_routes(vpc_name, subnet_name)
         elif subnet_type == "private":
-            from . import routing as routing_module
             routing_module.setup_private_subnet_routing(vpc_name, subnet_name)
-            routing_module.add_inter_subnet_routes(vpc_name)
         
         logger.info(f"Subnet '{subnet_name}' created successfully in VPC '{vpc_name}'")
         return True
         
     except Exception as e:
         logger.error(f"Failed to create subnet: {e}")
-        run_command(f"ip netns del {namespace}", check=False)
-        run_command(f"ip link del {veth_br}", check=False)
+        with kernel.batch(check=False) as link:
+            link.del_netns(namespace)
+            link.del_link(veth_br)
         return False
 
 def delete_subnet(vpc_name, subnet_name):
+    with vpc_lock(vpc_name):
+        return _delete_subnet(vpc_name, subnet_name)
+
+def _delete_subnet(vpc_name, subnet_name):
     subnet = get_subnet(vpc_name, subnet_name)
     if not subnet:
         logger.error(f"Subnet '{subnet_name}' not found in VPC '{vpc_name}'")
@@ -128,28 +162,29 @@ def delete_subnet(vpc_name, subnet_name):
     prefix = cidr.split('/')[1]
     
     try:
-        run_command(f"ip netns del {namespace}", check=False)
-        logger.info(f"Deleted namespace {namespace}")
-        
-        run_command(f"ip link del {veth_br}", check=False)
-        logger.info(f"Deleted veth {veth_br}")
-        
+        with kernel.batch(check=False) as link:
+            link.del_netns(namespace)
+            link.del_link(veth_br)
+            for instance in subnet.get('instances', []):
+                link.del_netns(instance['namespace'])
+                link.del_link(instance['veth_br'])
+            if gateway:
+                link.del_addr(f"{gateway}/{prefix}", bridge)
+        logger.info(f"Deleted namespace {namespace} and veth {veth_br}")
+        if subnet.get('instances'):
+            logger.info(f"Deleted {len(subnet['instances'])} instance(s) of subnet '{subnet_name}'")
         if gateway:
-            run_command(f"ip addr del {gateway}/{prefix} dev {bridge}", check=False)
             logger.info(f"Removed IP {gateway}/{prefix} from bridge {bridge}")
         
-        from .utils import get_default_interface
-        internet_interface = get_default_interface()
-        if internet_interface:
-            run_command(f"iptables -t nat -D POSTROUTING -s {cidr} -o {internet_interface} -j MASQUERADE", check=False)
-            run_command(f"iptables -D FORWARD -s {cidr} -j ACCEPT", check=False)
+        from .egress import has_public_subnet
+        if subnet.get('type') == 'public' and not has_public_subnet(vpc, exclude=subnet_name):
+            netfilter.backend().remove_nat(vpc)
         
-        state = load_state()
-        for v in state['vpcs']:
-            if v['name'] == vpc_name:
-                v['subnets'] = [s for s in v['subnets'] if s['name'] != subnet_name]
-                break
-        save_state(state)
+        with update_state() as state:
+            for v in state['vpcs']:
+                if v['name'] == vpc_name:
+                    v['subnets'] = [s for s in v['subnets'] if s['name'] != subnet_name]
+                    break
         
         logger.info(f"Subnet '{subnet_name}' deleted successfully")
         return True
@@ -158,6 +193,132 @@ def delete_subnet(vpc_name, subnet_name):
         logger.error(f"Failed to delete subnet: {e}")
         return False
 
+def subnet_namespaces(subnet):
+    return [subnet['namespace']] + [i['namespace'] for i in subnet.get('instances', [])]
+
+def instance_links(vpc_name, subnet_name, instance_name):
+    key = f"{vpc_name}/{subnet_name}/{instance_name}"
+    return hashed_link("vb-", key), hashed_link("vn-", key)
+
+def instance_namespace(vpc_name, subnet_name, instance_name):
+    return hashed_link("vpcctl-i-", f"{vpc_name}/{subnet_name}/{instance_name}")
+
+def add_instance(vpc_name, subnet_name, instance_name):
+    with vpc_lock(vpc_name):
+        return _add_instance(vpc_name, subnet_name, instance_name)
+
+def _add_instance(vpc_name, subnet_name, instance_name):
+    vpc = get_vpc(vpc_name)
+    subnet = get_subnet(vpc_name, subnet_name)
+    if not vpc or not subnet:
+        logger.error(f"Subnet '{subnet_name}' not found in VPC '{vpc_name}'")
+        return False
+    
+    if any(i['name'] == instance_name for i in subnet.get('instances', [])):
+        logger.error(f"Instance '{instance_name}' already exists in subnet '{subnet_name}'")
+        return False
+    
+    cidr = subnet['cidr']
+    gateway = subnet['gateway']
+    prefix = cidr.split('/')[1]
+    namespace = instance_namespace(vpc_name, subnet_name, instance_name)
+    if namespace_in_use(namespace):
+        logger.error(f"Namespace {namespace} is already in use")
+        return False
+    
+    veth_br, veth_ns = instance_links(vpc_name, subnet_name, instance_name)
+    
+    with update_state():
+        try:
+            ip = ipam.allocate(ipam.subnet_pool(get_subnet(vpc_name, subnet_name)), cidr)
+        except ValueError as e:
+            logger.error(str(e))
+            return False
+    
+    try:
+        from .routing import subnet_routes
+        
+        perf_profile = profiles.profile_of(subnet)
+        with kernel.batch() as link:
+            link.add_netns(namespace)
+            link.add_veth(veth_br, veth_ns, peer_namespace=namespace, **profiles.veth_options(vpc, perf_profile))
+            link.set_master(veth_br, vpc['bridge'])
+            link.set_up(veth_br)
+        profiles.tune_veth(vpc, perf_profile, veth_br, veth_ns, namespace)
+        logger.info(f"Created namespace {namespace} and veth pair {veth_br} <-> {veth_ns}")
+        
+        write_sysctl(f"net/ipv4/conf/{veth_br}/rp_filter", 0)
+        
+        with kernel.batch(namespace) as link:
+            link.add_addr(f"{ip}/{prefix}", veth_ns)
+            link.set_up(veth_ns)
+            link.set_up("lo")
+            if subnet['type'] == "public":
+                link.add_route("default", via=gateway)
+            for route in subnet_routes(vpc):
+                link.add_route(route, via=gateway, replace=True)
+        logger.info(f"Assigned IP {ip}/{prefix} to {veth_ns} in namespace {namespace}")
+        
+        if subnet.get('policy_rules'):
+            from .firewall import install_policy
+            install_policy(namespace, subnet)
+        
+        instance_data = {
+            "name": instance_name,
+            "namespace": namespace,
+            "ip": ip,
+            "veth_br": veth_br,
+            "veth_ns": veth_ns
+        }
+        
+        with update_state():
+            get_subnet(vpc_name, subnet_name).setdefault('instances', []).append(instance_data)
+        
+        logger.info(f"Instance '{instance_name}' added to subnet '{subnet_name}' with IP {ip}")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Failed to add instance: {e}")
+        with kernel.batch(check=False) as link:
+            link.del_netns(namespace)
+            link.del_link(veth_br)
+        with update_state():
+            ipam.release(ipam.subnet_pool(get_subnet(vpc_name, subnet_name)), cidr, ip)
+        return False
+
+def remove_instance(vpc_name, subnet_name, instance_name):
+    with vpc_lock(vpc_name):
+        return _remove_instance(vpc_name, subnet_name, instance_name)
+
+def _remove_instance(vpc_name, subnet_name, instance_name):
+    subnet = get_subnet(vpc_name, subnet_name)
+    if not subnet:
+        logger.error(f"Subnet '{subnet_name}' not found in VPC '{vpc_name}'")
+        return False
+    
+    instance = next((i for i in subnet.get('instances', []) if i['name'] == instance_name), None)
+    if not instance:
+        logger.error(f"Instance '{instance_name}' not found in subnet '{subnet_name}'")
+        return False
+    
+    try:
+        with kernel.batch(check=False) as link:
+            link.del_netns(instance['namespace'])
+            link.del_link(instance['veth_br'])
+        logger.info(f"Deleted namespace {instance['namespace']} and veth {instance['veth_br']}")
+        
+        with update_state():
+            current = get_subnet(vpc_name, subnet_name)
+            current['instances'] = [i for i in current['instances'] if i['name'] != instance_name]
+            ipam.release(ipam.subnet_pool(current), current['cidr'], instance['ip'])
+        
+        logger.info(f"Instance '{instance_name}' removed from subnet '{subnet_name}', released {instance['ip']}")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Failed to remove instance: {e}")
+        return False
+
 def list_subnets(vpc_name):
     vpc = get_vpc(vpc_name)
     if not vpc:
@@ -181,5 +342,44 @@ def list_subnets(vpc_name):
         ip = subnet['ip']
         
         print(f"{name:<20} {cidr:<18} {subnet_type:<10} {namespace:<30} {ip:<15}")
+        for instance in subnet.get('instances', []):
+            print(f"{'  ' + instance['name']:<20} {'':<18} {'instance':<10} {instance['namespace']:<30} {instance['ip']:<15}")
+    
+    print()
+
+def whois(address):
+    try:
+        ipaddress.IPv4Address(address)
+    except ValueError:
+        logger.error(f"Invalid IPv4 address: {address}")
+        return False
+    
+    vpc, subnet = lookup_address(address)
+    if not vpc:
+        logger.error(f"No VPC owns {address}")
+        return False
+    
+    print(f"\n{'Address:':<12} {address}")
+    print(f"{'VPC:':<12} {vpc['name']} ({vpc['cidr']}) on {vpc['bridge']}")
+    
+    if not subnet:
+        print(f"{'Subnet:':<12} none (unallocated VPC space)\n")
+        return True
+    
+    print(f"{'Subnet:':<12} {subnet['name']} ({subnet['cidr']}, {subnet['type']})")
+    
+    instance = next((i for i in subnet.get('instances', []) if i['ip'] == address), None)
+    if address == subnet['gateway']:
+        print(f"{'Owner:':<12} gateway on {vpc['bridge']}")
+    elif instance:
+        print(f"{'Owner:':<12} instance {instance['name']}")
+        print(f"{'Namespace:':<12} {instance['namespace']}")
+        print(f"{'Veth:':<12} {instance['veth_br']} <-> {instance['veth_ns']}")
+    else:
+        owner = f"subnet {subnet['name']}" if address == subnet['ip'] else "unassigned"
+        print(f"{'Owner:':<12} {owner}")
+        print(f"{'Namespace:':<12} {subnet['namespace']}")
+        print(f"{'Veth:':<12} {subnet['veth_br']} <-> {subnet['veth_ns']}")
     
-    print()
\ No newline at end of file
+    print()
+    return True
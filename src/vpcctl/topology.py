@@ -0,0 +1,273 @@
+import contextvars
+import ipaddress
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from . import firewall
+from . import profiling
+from . import peering
+from . import subnet
+from . import vpc
+from .netns import NETNS_RUN_DIR
+from .utils import (
+    DEFAULT_WORKERS,
+    logger,
+    validate_cidr
+)
+from .state import (
+    load_state,
+    deferred_writes
+)
+
+SYS_CLASS_NET = Path("/sys/class/net")
+
+class Action:
+    def __init__(self, kind, target, func, args, deps=(), detail=""):
+        self.kind = kind
+        self.target = target
+        self.func = func
+        self.args = args
+        self.deps = set(deps)
+        self.detail = detail
+
+    @property
+    def id(self):
+        return f"{self.kind}:{self.target}"
+
+    @property
+    def symbol(self):
+        if self.kind.startswith('create'):
+            return '+'
+        if self.kind.startswith('delete'):
+            return '-'
+        return '~'
+
+    def describe(self):
+        detail = f" ({self.detail})" if self.detail else ""
+        return f"{self.symbol} {self.kind} {self.target}{detail}"
+
+    def run(self):
+        logger.info(f"Applying: {self.kind} {self.target}")
+        with profiling.span(f"{self.kind} {self.target}", "action"):
+            return self.func(*self.args)
+
+def _resolve_policy(policy, base_dir, subnet_cidr):
+    if policy is None:
+        return None
+
+    if isinstance(policy, str):
+        policy = firewall.parse_policy(base_dir / policy)
+        if policy is None:
+            raise ValueError("invalid policy file")
+        return policy
+
+    policy = dict(policy)
+    policy.setdefault('subnet', subnet_cidr)
+    if not firewall.validate_policy(policy):
+        raise ValueError("invalid inline policy")
+    return policy
+
+def load_topology(topology_file):
+    path = Path(topology_file)
+
+    try:
+        with open(path, 'r') as f:
+            topology = json.load(f)
+    except FileNotFoundError:
+        logger.error(f"Topology file not found: {topology_file}")
+        return None
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in topology file: {e}")
+        return None
+
+    try:
+        for vpc_spec in topology.get('vpcs', []):
+            if 'name' not in vpc_spec or 'cidr' not in vpc_spec:
+                raise ValueError("each VPC needs 'name' and 'cidr'")
+            if not validate_cidr(vpc_spec['cidr']):
+                raise ValueError(f"invalid CIDR {vpc_spec['cidr']} for VPC '{vpc_spec['name']}'")
+
+            vpc_network = ipaddress.ip_network(vpc_spec['cidr'], strict=False)
+            for subnet_spec in vpc_spec.setdefault('subnets', []):
+                if not {'name', 'cidr', 'type'} <= subnet_spec.keys():
+                    raise ValueError(f"each subnet in VPC '{vpc_spec['name']}' needs 'name', 'cidr' and 'type'")
+                if subnet_spec['type'] not in ['public', 'private']:
+                    raise ValueError(f"invalid subnet type '{subnet_spec['type']}'")
+                if not validate_cidr(subnet_spec['cidr']):
+                    raise ValueError(f"invalid CIDR {subnet_spec['cidr']} for subnet '{subnet_spec['name']}'")
+                if not ipaddress.ip_network(subnet_spec['cidr'], strict=False).subnet_of(vpc_network):
+                    raise ValueError(f"subnet {subnet_spec['cidr']} is not within VPC CIDR {vpc_spec['cidr']}")
+
+                subnet_spec['policy'] = _resolve_policy(subnet_spec.get('policy'), path.parent, subnet_spec['cidr'])
+
+        names = {vpc_spec['name'] for vpc_spec in topology.get('vpcs', [])}
+        for peering_spec in topology.setdefault('peerings', []):
+            if peering_spec.get('vpc1') not in names or peering_spec.get('vpc2') not in names:
+                raise ValueError(f"peering {peering_spec} references a VPC that is not in the topology")
+
+    except (ValueError, AttributeError, TypeError) as e:
+        logger.error(f"Invalid topology: {e}")
+        return None
+
+    return topology
+
+def _bridge_exists(bridge):
+    return (SYS_CLASS_NET / bridge).exists()
+
+def _namespace_exists(namespace):
+    return (NETNS_RUN_DIR / namespace).exists()
+
+def _pair(vpc1_name, vpc2_name):
+    return tuple(sorted([vpc1_name, vpc2_name]))
+
+def plan(topology, prune=False):
+    state = load_state()
+    current = {v['name']: v for v in state['vpcs']}
+    desired = {v['name']: v for v in topology.get('vpcs', [])}
+
+    current_peerings = {}
+    for v in state['vpcs']:
+        for p in v.get('peerings', []):
+            current_peerings[_pair(p['vpc1'], p['vpc2'])] = p
+    desired_peerings = {_pair(p['vpc1'], p['vpc2']) for p in topology.get('peerings', [])}
+
+    replaced = set()
+    for name, vpc_spec in desired.items():
+        cur = current.get(name)
+        if cur and (cur['cidr'] != vpc_spec['cidr'] or not _bridge_exists(cur['bridge'])):
+            replaced.add(name)
+    removed = set(current) - set(desired) if prune else set()
+
+    deletes = []
+    creates = []
+
+    for pair, p in current_peerings.items():
+        if pair[0] in replaced | removed or pair[1] in replaced | removed or (prune and pair not in desired_peerings):
+            deletes.append(Action('delete-peering', f"{pair[0]}<->{pair[1]}",
+                                  peering.delete_peering, (p['vpc1'], p['vpc2'])))
+
+    for name, cur in current.items():
+        deleting_vpc = name in replaced or name in removed
+        desired_subnets = {s['name']: s for s in desired[name]['subnets']} if name in desired else {}
+        peering_deps = [a.id for a in deletes if name in a.target.split('<->')]
+
+        for cur_subnet in cur.get('subnets', []):
+            spec = desired_subnets.get(cur_subnet['name'])
+            drifted = spec is not None and (
+                spec['cidr'] != cur_subnet['cidr'] or spec['type'] != cur_subnet['type']
+                or not _namespace_exists(cur_subnet['namespace']))
+
+            if deleting_vpc or drifted or (prune and spec is None):
+                deletes.append(Action('delete-subnet', f"{name}/{cur_subnet['name']}",
+                                      subnet.delete_subnet, (name, cur_subnet['name']), peering_deps))
+
+        if deleting_vpc:
+            subnet_deps = [a.id for a in deletes if a.kind == 'delete-subnet' and a.target.startswith(f"{name}/")]
+            deletes.append(Action('delete-vpc', name, vpc.delete_vpc, (name,), subnet_deps + peering_deps))
+
+    deleted_subnets = {a.target for a in deletes if a.kind == 'delete-subnet'}
+    subnet_creates = {}
+
+    for name, vpc_spec in desired.items():
+        cur = current.get(name)
+        if cur is None or name in replaced:
+            creates.append(Action('create-vpc', name, vpc.create_vpc, (name, vpc_spec['cidr']),
+                                  [f"delete-vpc:{name}"], vpc_spec['cidr']))
+        cur_subnets = {s['name']: s for s in cur.get('subnets', [])} if cur else {}
+
+        for spec in vpc_spec['subnets']:
+            target = f"{name}/{spec['name']}"
+            cur_subnet = cur_subnets.get(spec['name'])
+            recreated = cur_subnet is None or target in deleted_subnets
+
+            if recreated:
+                action = Action('create-subnet', target, subnet.create_subnet,
+                                (name, spec['name'], spec['cidr'], spec['type']),
+                                [f"create-vpc:{name}", f"delete-subnet:{target}"],
+                                f"{spec['cidr']}, {spec['type']}")
+                creates.append(action)
+                subnet_creates.setdefault(name, []).append(action.id)
+
+            installed_hash = None if recreated else cur_subnet.get('policy_hash')
+            if spec['policy'] is not None:
+                if firewall.policy_hash(spec['policy']) != installed_hash:
+                    creates.append(Action('apply-policy', target, firewall.apply_policy_document,
+                                          (name, spec['name'], spec['policy']), [f"create-subnet:{target}"],
+                                          f"{len(spec['policy']['ingress'])} ingress rules"))
+            elif installed_hash:
+                creates.append(Action('clear-policy', target, firewall.clear_policy, (name, spec['name'])))
+
+    for pair in sorted(desired_peerings):
+        if pair in current_peerings and not (set(pair) & (replaced | removed)):
+            continue
+        deps = [f"create-vpc:{pair[0]}", f"create-vpc:{pair[1]}", f"delete-peering:{pair[0]}<->{pair[1]}"]
+        deps += subnet_creates.get(pair[0], []) + subnet_creates.get(pair[1], [])
+        creates.append(Action('create-peering', f"{pair[0]}<->{pair[1]}", peering.create_peering, pair, deps))
+
+    return deletes + creates
+
+def execute(actions, workers=DEFAULT_WORKERS):
+    by_id = {action.id: action for action in actions}
+    remaining = {action.id: {dep for dep in action.deps if dep in by_id} for action in actions}
+    done = set()
+    failed = set()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+
+        while remaining or running:
+            for action_id, deps in list(remaining.items()):
+                if deps & failed:
+                    logger.error(f"Skipping {action_id}: a dependency failed")
+                    failed.add(action_id)
+                    del remaining[action_id]
+                elif deps <= done:
+                    running[pool.submit(contextvars.copy_context().run, by_id[action_id].run)] = action_id
+                    del remaining[action_id]
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                action_id = running.pop(future)
+                try:
+                    success = future.result()
+                except Exception as e:
+                    logger.error(f"{action_id} raised: {e}")
+                    success = False
+                (done if success else failed).add(action_id)
+
+    return not failed and not remaining
+
+def apply(topology_file, plan_only=False, prune=False, workers=DEFAULT_WORKERS):
+    start = time.perf_counter()
+
+    topology = load_topology(topology_file)
+    if topology is None:
+        return False
+
+    actions = plan(topology, prune)
+
+    if not actions:
+        logger.info(f"No changes. Topology is up to date ({(time.perf_counter() - start) * 1000:.1f} ms)")
+        return True
+
+    print(f"\nPlan: {len(actions)} change(s)")
+    for action in actions:
+        print(f"  {action.describe()}")
+    print()
+
+    if plan_only:
+        return True
+
+    with deferred_writes():
+        success = execute(actions, workers)
+
+    elapsed = time.perf_counter() - start
+    if success:
+        logger.info(f"Topology applied: {len(actions)} change(s) in {elapsed:.2f}s")
+    else:
+        logger.error(f"Topology apply finished with errors after {elapsed:.2f}s")
+    return success
@@ -1,13 +1,24 @@
+import contextvars
+import hashlib
 import os
 import sys
 import subprocess
-import json
 import re
 import logging
 from pathlib import Path
+from . import profiling
 
 STATE_DIR = Path.home() / ".vpcctl"
 STATE_FILE = STATE_DIR / "vpcs.json"
+STATE_DB = STATE_DIR / "vpcs.db"
+STATE_BACKEND = os.environ.get("VPCCTL_STATE_BACKEND", "auto")
+LOCK_DIR = STATE_DIR / "locks"
+NETWORK_BACKEND = os.environ.get("VPCCTL_BACKEND", "netlink")
+FIREWALL_BACKEND = os.environ.get("VPCCTL_FIREWALL", "iptables")
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+MAX_LINK_NAME = 15
+SOCKET_PATH = Path(os.environ.get("VPCCTL_SOCKET", "/run/vpcctl/vpcctld.sock"))
+REQUEST_TIMEOUT = float(os.environ.get("VPCCTL_REQUEST_TIMEOUT", "600"))
 
 logging.basicConfig(
     level=logging.INFO,
@@ -40,14 +51,20 @@ def check_root():
         logger.error("This script must be run as root (use sudo)")
         sys.exit(1)
 
-def run_command(cmd, check=True):
+command_count = 0
+
+def run_command(cmd, check=True, input=None):
+    global command_count
     logger.debug(f"Executing: {cmd}")
-    result = subprocess.run(
-        cmd,
-        shell=True,
-        capture_output=True,
-        text=True
-    )
+    command_count += 1
+    with profiling.command_span(cmd):
+        result = subprocess.run(
+            cmd,
+            shell=True,
+            capture_output=True,
+            text=True,
+            input=input
+        )
     
     if check and result.returncode != 0:
         logger.error(f"Command failed: {cmd}")
@@ -56,6 +73,25 @@ def run_command(cmd, check=True):
     
     return result
 
+def run_ip_batch(commands, namespace=None):
+    netns_option = f"-n {namespace} " if namespace else ""
+    return run_command(f"ip {netns_option}-batch -", input="\n".join(commands) + "\n")
+
+def write_sysctl(key, value):
+    path = Path("/proc/sys") / key
+    logger.debug(f"Writing {value} to {path}")
+    path.write_text(f"{value}\n")
+
+def read_sysctl(key):
+    return (Path("/proc/sys") / key).read_text().strip()
+
+def hashed_link(prefix, key):
+    return f"{prefix}{hashlib.sha1(key.encode()).hexdigest()[:10]}"
+
+def map_in_context(pool, func, *iterables):
+    futures = [pool.submit(contextvars.copy_context().run, func, *args) for args in zip(*iterables)]
+    return (future.result() for future in futures)
+
 def validate_cidr(cidr):
     pattern = r'^(\d{1,3}\.){3}\d{1,3}/\d{1,2}$'
     if not re.match(pattern, cidr):
@@ -74,51 +110,11 @@ def validate_cidr(cidr):
     return True
 
 def get_default_interface():
-    result = run_command("ip route show default", check=True)
-    output = result.stdout.strip()
+    from .kernel import default_route
+    dev, _ = default_route()
     
-    if not output:
+    if not dev:
         logger.error("No default route found")
         return None
     
-    parts = output.split()
-    if 'dev' in parts:
-        dev_index = parts.index('dev')
-        if dev_index + 1 < len(parts):
-            return parts[dev_index + 1]
-    
-    return None
-
-def load_state():
-    if not STATE_FILE.exists():
-        return {"vpcs": []}
-    
-    with open(STATE_FILE, 'r') as f:
-        return json.load(f)
-
-def save_state(data):
-    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    
-    temp_file = STATE_FILE.with_suffix('.tmp')
-    with open(temp_file, 'w') as f:
-        json.dump(data, f, indent=2)
-    
-    temp_file.replace(STATE_FILE)
-
-def get_vpc(name):
-    state = load_state()
-    for vpc in state['vpcs']:
-        if vpc['name'] == name:
-            return vpc
-    return None
-
-def get_subnet(vpc_name, subnet_name):
-    vpc = get_vpc(vpc_name)
-    if not vpc:
-        return None
-    
-    for subnet in vpc.get('subnets', []):
-        if subnet['name'] == subnet_name:
-            return subnet
-    
-    return None
\ No newline at end of file
+    return dev
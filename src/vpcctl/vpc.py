@@ -1,43 +1,80 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import conntrack
+from . import hub
+from . import kernel
+from . import netfilter
+from . import profiles
 from .utils import (
+    DEFAULT_WORKERS,
+    MAX_LINK_NAME,
     logger,
-    run_command,
+    hashed_link,
+    write_sysctl,
     validate_cidr,
+    map_in_context
+)
+from .state import (
+    update_state,
     load_state,
-    save_state,
-    get_vpc
+    get_vpc,
+    find_overlapping_vpc,
+    vpc_lock,
+    deferred_writes
 )
 
-def create_vpc(name, cidr):
+CIDR_LOCK = "global:vpc-cidrs"
+
+def bridge_name(name):
+    bridge = f"br-{name}"
+    return bridge if len(bridge) <= MAX_LINK_NAME else hashed_link("br-", name)
+
+def create_vpc(name, cidr, perf_profile=profiles.DEFAULT_PROFILE):
+    with vpc_lock(name, CIDR_LOCK):
+        return _create_vpc(name, cidr, perf_profile)
+
+def _create_vpc(name, cidr, perf_profile=profiles.DEFAULT_PROFILE):
     if not validate_cidr(cidr):
         logger.error(f"Invalid CIDR format: {cidr}")
         return False
     
+    if not profiles.validate_profile(perf_profile):
+        return False
+    
     if get_vpc(name):
         logger.error(f"VPC '{name}' already exists")
         return False
     
-    bridge = f"br-{name}"
+    overlapping = find_overlapping_vpc(cidr)
+    if overlapping:
+        logger.error(f"VPC CIDR {cidr} overlaps VPC '{overlapping}' ({get_vpc(overlapping)['cidr']})")
+        return False
+    
+    bridge = bridge_name(name)
     
     try:
-        run_command(f"ip link add {bridge} type bridge")
-        logger.info(f"Created bridge {bridge}")
+        with kernel.batch() as link:
+            link.add_bridge(bridge)
+            link.set_up(bridge)
+        logger.info(f"Created bridge {bridge} and brought it up")
         
-        run_command(f"ip link set {bridge} up")
-        logger.info(f"Bridge {bridge} is up")
+        if perf_profile != profiles.DEFAULT_PROFILE:
+            profiles.tune_bridge(bridge, perf_profile)
+            logger.info(f"Applied perf profile '{perf_profile}' to {bridge}")
         
-        run_command("echo 1 > /proc/sys/net/ipv4/ip_forward")
+        write_sysctl("net/ipv4/ip_forward", 1)
         logger.info("IP forwarding enabled")
         
-        run_command(f"echo 0 > /proc/sys/net/ipv4/conf/{bridge}/send_redirects")
+        write_sysctl(f"net/ipv4/conf/{bridge}/send_redirects", 0)
         logger.info(f"Disabled ICMP redirects on {bridge}")
         
-        run_command(f"echo 0 > /proc/sys/net/ipv4/conf/{bridge}/rp_filter")
+        write_sysctl(f"net/ipv4/conf/{bridge}/rp_filter", 0)
         logger.info(f"Disabled reverse path filtering on {bridge}")
         
-        run_command(f"echo 1 > /proc/sys/net/ipv4/conf/{bridge}/forwarding")
+        write_sysctl(f"net/ipv4/conf/{bridge}/forwarding", 1)
         logger.info(f"Enabled forwarding on {bridge}")
         
-        run_command(f"echo 1 > /proc/sys/net/ipv4/conf/{bridge}/proxy_arp")
+        write_sysctl(f"net/ipv4/conf/{bridge}/proxy_arp", 1)
         logger.info(f"Enabled proxy ARP on {bridge}")
         
         vpc_data = {
@@ -48,19 +85,46 @@ def create_vpc(name, cidr):
             "peerings": []
         }
         
-        state = load_state()
-        state['vpcs'].append(vpc_data)
-        save_state(state)
+        if perf_profile != profiles.DEFAULT_PROFILE:
+            vpc_data['perf_profile'] = perf_profile
+        
+        with update_state() as state:
+            state['vpcs'].append(vpc_data)
+        
+        netfilter.backend().register_vpc(vpc_data)
+        
+        if conntrack.zones_enabled():
+            conntrack.assign_zone(name)
         
         logger.info(f"VPC '{name}' created successfully with CIDR {cidr}")
         return True
         
     except Exception as e:
         logger.error(f"Failed to create VPC: {e}")
-        run_command(f"ip link del {bridge}", check=False)
+        with kernel.batch(check=False) as link:
+            link.del_link(bridge)
+        with update_state() as state:
+            state['vpcs'] = [v for v in state['vpcs'] if v['name'] != name]
         return False
 
-def delete_vpc(name):
+def delete_vpc(name, cascade=False):
+    if not cascade:
+        with vpc_lock(name):
+            return _delete_vpc(name)
+    
+    peers = _peer_names(name)
+    while True:
+        with vpc_lock(name, *peers), deferred_writes():
+            current = _peer_names(name)
+            if set(current) == set(peers):
+                return _delete_vpc_cascade(name)
+        peers = current
+
+def _peer_names(name):
+    vpc = get_vpc(name)
+    return [p['vpc2'] if p['vpc1'] == name else p['vpc1'] for p in vpc.get('peerings', [])] if vpc else []
+
+def _delete_vpc(name):
     vpc = get_vpc(name)
     if not vpc:
         logger.error(f"VPC '{name}' not found")
@@ -73,12 +137,15 @@ def delete_vpc(name):
     bridge = vpc['bridge']
     
     try:
-        run_command(f"ip link del {bridge}", check=False)
+        with kernel.batch(check=False) as link:
+            link.del_link(bridge)
         logger.info(f"Deleted bridge {bridge}")
         
-        state = load_state()
-        state['vpcs'] = [v for v in state['vpcs'] if v['name'] != name]
-        save_state(state)
+        hub.release_vpc(vpc)
+        netfilter.backend().unregister_vpc(vpc)
+        
+        with update_state() as state:
+            state['vpcs'] = [v for v in state['vpcs'] if v['name'] != name]
         
         logger.info(f"VPC '{name}' deleted successfully")
         return True
@@ -87,6 +154,52 @@ def delete_vpc(name):
         logger.error(f"Failed to delete VPC: {e}")
         return False
 
+def _teardown_subnet(subnet):
+    with kernel.batch(check=False) as link:
+        link.del_netns(subnet['namespace'])
+        link.del_link(subnet['veth_br'])
+        for instance in subnet.get('instances', []):
+            link.del_netns(instance['namespace'])
+            link.del_link(instance['veth_br'])
+    logger.info(f"Deleted namespace {subnet['namespace']} and veth {subnet['veth_br']}")
+
+def _delete_vpc_cascade(name):
+    from . import peering
+    
+    vpc = get_vpc(name)
+    if not vpc:
+        logger.error(f"VPC '{name}' not found")
+        return False
+    
+    bridge = vpc['bridge']
+    peerings = list(vpc.get('peerings', []))
+    subnets = list(vpc.get('subnets', []))
+    start = time.perf_counter()
+    
+    try:
+        with ThreadPoolExecutor(max_workers=DEFAULT_WORKERS) as pool:
+            list(map_in_context(pool, lambda p: peering._delete_peering(p['vpc1'], p['vpc2']), peerings))
+            list(map_in_context(pool, _teardown_subnet, subnets))
+        
+        with kernel.batch(check=False) as link:
+            link.del_link(bridge)
+        logger.info(f"Deleted bridge {bridge}")
+        
+        hub.release_vpc(vpc)
+        netfilter.backend().unregister_vpc(vpc)
+        
+        with update_state() as state:
+            state['vpcs'] = [v for v in state['vpcs'] if v['name'] != name]
+        
+        elapsed = time.perf_counter() - start
+        logger.info(f"VPC '{name}' deleted with {len(subnets)} subnet(s) and {len(peerings)} peering(s) "
+                    f"in {elapsed:.2f}s")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Failed to delete VPC: {e}")
+        return False
+
 def list_vpcs():
     state = load_state()
     vpcs = state.get('vpcs', [])
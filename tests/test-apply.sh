@@ -0,0 +1,46 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+TOPOLOGY=topologies/example-topology.json
+
+echo "========================================="
+echo "Declarative Apply Test"
+echo "========================================="
+
+echo -e "\n[1/5] Planning topology from $TOPOLOGY..."
+sudo uv run vpcctl apply -f $TOPOLOGY --plan
+
+echo -e "\n[2/5] Applying topology..."
+sudo uv run vpcctl apply -f $TOPOLOGY
+
+echo -e "\n[3/5] Re-applying unchanged topology (should be a no-op)..."
+if sudo uv run vpcctl apply -f $TOPOLOGY 2>&1 | grep -q "No changes"; then
+    echo -e "${GREEN}✓${NC} Re-apply made no changes"
+else
+    echo -e "${RED}✗${NC} Re-apply tried to change an unchanged topology"
+fi
+
+echo -e "\n[4/5] Testing peered connectivity: vpc1/private1 should reach vpc2/private1..."
+if sudo uv run vpcctl exec --vpc vpc1 --subnet private1 ping -c 2 -W 2 10.1.1.2 > /dev/null 2>&1; then
+    echo -e "${GREEN}✓${NC} vpc1 can reach vpc2 through the declared peering"
+else
+    echo -e "${RED}✗${NC} vpc1 cannot reach vpc2"
+fi
+
+echo -e "\n[5/5] Repairing drift: deleting a namespace behind vpcctl's back..."
+sudo ip netns del vpc2-private1
+sudo uv run vpcctl apply -f $TOPOLOGY
+if sudo ip netns list | grep -q "vpc2-private1"; then
+    echo -e "${GREEN}✓${NC} Missing namespace was recreated"
+else
+    echo -e "${RED}✗${NC} Missing namespace was not recreated"
+fi
+
+echo -e "\n========================================="
+echo "Apply test completed!"
+echo "========================================="
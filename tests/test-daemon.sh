@@ -0,0 +1,60 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+SOCKET=/run/vpcctl/vpcctld.sock
+
+echo "========================================="
+echo "vpcctld Daemon Test"
+echo "========================================="
+
+echo -e "\n[1/5] Starting vpcctld..."
+sudo uv run vpcctld &
+DAEMON_PID=$!
+for i in $(seq 1 50); do
+    [ -S $SOCKET ] && break
+    sleep 0.1
+done
+if [ -S $SOCKET ]; then
+    echo -e "${GREEN}✓${NC} vpcctld is listening on $SOCKET"
+else
+    echo -e "${RED}✗${NC} vpcctld did not create its socket"
+    exit 1
+fi
+
+echo -e "\n[2/5] Creating a VPC and subnet through the daemon..."
+sudo uv run vpcctl create-vpc --name vpc1 --cidr 10.0.0.0/16
+sudo uv run vpcctl create-subnet --vpc vpc1 --name public1 --cidr 10.0.1.0/24 --type public
+
+echo -e "\n[3/5] Checking that output is relayed back to the client..."
+if sudo uv run vpcctl list-subnets --vpc vpc1 | grep -q "public1"; then
+    echo -e "${GREEN}✓${NC} list-subnets output came back from the daemon"
+else
+    echo -e "${RED}✗${NC} list-subnets output is missing"
+fi
+
+echo -e "\n[4/5] Running exec while the daemon is up..."
+if sudo uv run vpcctl exec --vpc vpc1 --subnet public1 ip -br addr | grep -q "10.0.1.2"; then
+    echo -e "${GREEN}✓${NC} exec ran inside the subnet namespace"
+else
+    echo -e "${RED}✗${NC} exec did not run inside the subnet namespace"
+fi
+
+echo -e "\n[5/5] Stopping vpcctld and falling back to in-process execution..."
+sudo kill $DAEMON_PID
+wait $DAEMON_PID 2>/dev/null || true
+sudo uv run vpcctl delete-subnet --vpc vpc1 --name public1
+sudo uv run vpcctl delete-vpc --name vpc1
+if ! sudo uv run vpcctl list-vpcs 2>&1 | grep -q "vpc1"; then
+    echo -e "${GREEN}✓${NC} CLI works without the daemon"
+else
+    echo -e "${RED}✗${NC} Cleanup without the daemon failed"
+fi
+
+echo -e "\n========================================="
+echo "Daemon test completed!"
+echo "========================================="
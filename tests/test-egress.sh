@@ -0,0 +1,51 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+echo "========================================="
+echo "Egress NAT Test"
+echo "========================================="
+
+echo -e "\n[1/5] Creating a VPC with a public and a private subnet..."
+sudo uv run vpcctl create-vpc --name egress-vpc --cidr 10.70.0.0/16
+sudo uv run vpcctl create-subnet --vpc egress-vpc --name web --cidr 10.70.1.0/24 --type public
+sudo uv run vpcctl create-subnet --vpc egress-vpc --name db --cidr 10.70.2.0/24 --type private
+
+echo -e "\n[2/5] Checking the VPC has a single SNAT rule..."
+RULES=$(sudo iptables -t nat -S VPCCTL-egress-vpc | grep -c -- "-j SNAT --to-source" || true)
+if [ "$RULES" -eq 1 ]; then
+    echo -e "${GREEN}✓${NC} One SNAT rule covers every subnet in the VPC"
+else
+    echo -e "${RED}✗${NC} Expected 1 SNAT rule, found $RULES"
+fi
+
+echo -e "\n[3/5] Checking public egress..."
+if sudo ip netns exec egress-vpc-web ping -c 2 -W 2 8.8.8.8 > /dev/null 2>&1; then
+    echo -e "${GREEN}✓${NC} Public subnet reaches the internet through SNAT"
+else
+    echo -e "${RED}✗${NC} Public subnet has no internet access"
+fi
+
+echo -e "\n[4/5] Re-reading the uplink..."
+sudo uv run vpcctl watch-uplink --once
+echo -e "${GREEN}✓${NC} Uplink check completed"
+
+echo -e "\n[5/5] Enabling per-VPC conntrack zones..."
+sudo uv run vpcctl tune-conntrack --zones on
+if sudo iptables -t raw -S PREROUTING | grep -q -- "-i br-egress-vpc -j CT --zone-orig"; then
+    echo -e "${GREEN}✓${NC} Bridge traffic is tracked in its own zone"
+else
+    echo -e "${RED}✗${NC} No conntrack zone rule for br-egress-vpc"
+fi
+sudo uv run vpcctl tune-conntrack
+sudo uv run vpcctl tune-conntrack --zones off
+
+sudo uv run vpcctl delete-vpc --name egress-vpc --cascade
+
+echo -e "\n========================================="
+echo "Egress NAT test completed!"
+echo "========================================="
@@ -10,28 +10,28 @@ echo "========================================="
 echo "Firewall Policy Test"
 echo "========================================="
 
-echo -e "\n[1/7] Creating VPC 'vpc1' with CIDR 10.0.0.0/16..."
+echo -e "\n[1/8] Creating VPC 'vpc1' with CIDR 10.0.0.0/16..."
 sudo uv run vpcctl create-vpc --name vpc1 --cidr 10.0.0.0/16
 
-echo -e "\n[2/7] Creating public subnet..."
+echo -e "\n[2/8] Creating public subnet..."
 sudo uv run vpcctl create-subnet --vpc vpc1 --name public1 --cidr 10.0.1.0/24 --type public
 
-echo -e "\n[3/7] Creating private subnet..."
+echo -e "\n[3/8] Creating private subnet..."
 sudo uv run vpcctl create-subnet --vpc vpc1 --name private1 --cidr 10.0.2.0/24 --type private
 
-echo -e "\n[4/7] Starting simple HTTP server in private subnet..."
+echo -e "\n[4/8] Starting simple HTTP server in private subnet..."
 sudo uv run vpcctl exec --vpc vpc1 --subnet private1 python3 -m http.server 8080 > /dev/null 2>&1 &
 HTTP_PID=$!
 sleep 2
 
-echo -e "\n[5/7] Testing HTTP access before firewall (should work)..."
+echo -e "\n[5/8] Testing HTTP access before firewall (should work)..."
 if sudo uv run vpcctl exec --vpc vpc1 --subnet public1 curl -s -m 2 http://10.0.2.2:8080 > /dev/null 2>&1; then
     echo -e "${GREEN}✓${NC} HTTP accessible before firewall"
 else
     echo -e "${RED}✗${NC} HTTP not accessible before firewall"
 fi
 
-echo -e "\n[6/7] Applying restrictive firewall policy..."
+echo -e "\n[6/8] Applying restrictive firewall policy..."
 cat > /tmp/test-policy.json << EOF
 {
   "subnet": "10.0.2.0/24",
@@ -47,13 +47,28 @@ EOF
 
 sudo uv run vpcctl apply-policy --vpc vpc1 --subnet private1 --file /tmp/test-policy.json
 
-echo -e "\n[7/7] Testing HTTP access after firewall (should fail)..."
+echo -e "\n[7/8] Testing HTTP access after firewall (should fail)..."
 if sudo uv run vpcctl exec --vpc vpc1 --subnet public1 curl -s -m 2 http://10.0.2.2:8080 > /dev/null 2>&1; then
     echo -e "${RED}✗${NC} HTTP still accessible after firewall (firewall not working)"
 else
     echo -e "${GREEN}✓${NC} HTTP blocked by firewall"
 fi
 
+echo -e "\n[8/8] Re-applying an updated policy that allows HTTP..."
+sed -i 's/"deny"/"allow"/' /tmp/test-policy.json
+sudo uv run vpcctl apply-policy --vpc vpc1 --subnet private1 --file /tmp/test-policy.json
+if sudo uv run vpcctl exec --vpc vpc1 --subnet public1 curl -s -m 2 http://10.0.2.2:8080 > /dev/null 2>&1; then
+    echo -e "${GREEN}✓${NC} Updated policy replaced the previous one"
+else
+    echo -e "${RED}✗${NC} HTTP still blocked by the previous policy"
+fi
+JUMPS=$(sudo ip netns exec vpc1-private1 iptables -S INPUT | grep -c -- "^-A INPUT" || true)
+if [ "$JUMPS" -eq 1 ]; then
+    echo -e "${GREEN}✓${NC} INPUT holds a single jump to the policy chain"
+else
+    echo -e "${RED}✗${NC} INPUT holds $JUMPS rules after re-applying"
+fi
+
 sudo kill $HTTP_PID 2>/dev/null || true
 rm -f /tmp/test-policy.json
 
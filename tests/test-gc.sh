@@ -0,0 +1,70 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+echo "========================================="
+echo "Cascading Delete and GC Test"
+echo "========================================="
+
+echo -e "\n[1/4] Creating two peered VPCs with subnets..."
+sudo uv run vpcctl create-vpc --name vpc1 --cidr 10.0.0.0/16
+sudo uv run vpcctl create-vpc --name vpc2 --cidr 10.1.0.1/16
+sudo uv run vpcctl create-subnet --vpc vpc1 --name public1 --cidr 10.0.1.0/24 --type public
+sudo uv run vpcctl create-subnet --vpc vpc1 --name private1 --cidr 10.0.2.0/24 --type private
+sudo uv run vpcctl create-subnet --vpc vpc2 --name public2 --cidr 10.1.1.0/24 --type public
+sudo uv run vpcctl create-peering --vpc1 vpc1 --vpc2 vpc2
+
+echo -e "\n[2/4] Deleting vpc1 with --cascade..."
+sudo uv run vpcctl delete-vpc --name vpc1 --cascade
+if ! ip netns list | grep -q "vpc1-" && ! ip link show br-vpc1 &>/dev/null; then
+    echo -e "${GREEN}✓${NC} Subnets, peering and bridge of vpc1 are gone"
+else
+    echo -e "${RED}✗${NC} vpc1 left resources behind"
+fi
+
+echo -e "\n[3/4] Leaking kernel objects behind vpcctl's back..."
+sudo ip link add br-leaked type bridge
+sudo ip link set br-leaked alias vpcctl
+sudo ip link add br-0123456789ab type bridge
+sudo ip netns del vpc2-public2
+sudo iptables -w -F VPCCTL-vpc2
+sudo uv run vpcctl gc --dry-run
+if ip link show br-leaked &>/dev/null; then
+    echo -e "${GREEN}✓${NC} --dry-run did not remove anything"
+else
+    echo -e "${RED}✗${NC} --dry-run removed br-leaked"
+fi
+
+echo -e "\n[4/4] Collecting orphans..."
+sudo uv run vpcctl gc
+if ! ip link show br-leaked &>/dev/null && ! sudo uv run vpcctl list-subnets --vpc vpc2 | grep -q "public2"; then
+    echo -e "${GREEN}✓${NC} Orphaned bridge removed and stale subnet dropped from state"
+else
+    echo -e "${RED}✗${NC} gc left orphans or stale state behind"
+fi
+if ip link show br-0123456789ab &>/dev/null; then
+    echo -e "${GREEN}✓${NC} Bridge created by another tool was left alone"
+else
+    echo -e "${RED}✗${NC} gc removed a bridge vpcctl does not own"
+fi
+sudo ip link del br-0123456789ab
+if sudo iptables -w -S VPCCTL-vpc2 | grep -q -- "--match-set vpcctl-vpcs dst -j DROP"; then
+    echo -e "${GREEN}✓${NC} Flushed VPC chain was rebuilt from its ledger"
+else
+    echo -e "${RED}✗${NC} VPCCTL-vpc2 is still empty"
+fi
+if ! sudo uv run vpcctl gc --dry-run | grep -q "drifted"; then
+    echo -e "${GREEN}✓${NC} Rebuilt chain matches its ledger"
+else
+    echo -e "${RED}✗${NC} gc still reports drift after the rebuild"
+fi
+
+sudo uv run vpcctl delete-vpc --name vpc2 --cascade
+
+echo -e "\n========================================="
+echo "GC test completed!"
+echo "========================================="
@@ -0,0 +1,70 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+echo "========================================="
+echo "Subnet Instances Test"
+echo "========================================="
+
+echo -e "\n[1/6] Creating VPC 'vpc1' with a /9 public subnet..."
+sudo uv run vpcctl create-vpc --name vpc1 --cidr 10.0.0.0/8
+sudo uv run vpcctl create-subnet --vpc vpc1 --name public1 --cidr 10.0.0.0/9 --type public
+
+echo -e "\n[2/6] Adding two instances to 'public1'..."
+sudo uv run vpcctl add-instance --vpc vpc1 --subnet public1 --name web1
+sudo uv run vpcctl add-instance --vpc vpc1 --subnet public1 --name web2
+sudo uv run vpcctl list-subnets --vpc vpc1
+
+echo -e "\n[3/6] Testing instance-to-instance communication..."
+if sudo uv run vpcctl exec --vpc vpc1 --subnet public1 --instance web1 ping -c 2 -W 2 10.0.0.4 > /dev/null 2>&1; then
+    echo -e "${GREEN}✓${NC} web1 can reach web2"
+else
+    echo -e "${RED}✗${NC} web1 cannot reach web2"
+fi
+
+echo -e "\n[4/6] Removing web1 and checking its address is reused..."
+sudo uv run vpcctl remove-instance --vpc vpc1 --subnet public1 --name web1
+sudo uv run vpcctl add-instance --vpc vpc1 --subnet public1 --name web3
+if sudo uv run vpcctl list-subnets --vpc vpc1 | grep "web3" | grep -q "10.0.0.3"; then
+    echo -e "${GREEN}✓${NC} web3 reused the address released by web1"
+else
+    echo -e "${RED}✗${NC} web3 did not reuse 10.0.0.3"
+fi
+
+echo -e "\n[5/6] Releasing the same address twice and the network address..."
+if uv run python3 -c '
+from vpcctl import ipam
+cidr = "10.9.0.0/24"
+pool = ipam.new_pool(cidr)
+ips = [ipam.allocate(pool, cidr) for _ in range(3)]
+ipam.release(pool, cidr, ips[0])
+try:
+    ipam.release(pool, cidr, ips[0])
+except ValueError:
+    pass
+try:
+    ipam.release(pool, cidr, "10.9.0.0")
+except ValueError:
+    pass
+assert len({ipam.allocate(pool, cidr) for _ in range(2)} | {"10.9.0.0"}) == 3
+'; then
+    echo -e "${GREEN}✓${NC} Double and out-of-range releases are rejected and addresses stay unique"
+else
+    echo -e "${RED}✗${NC} A bad release handed out a duplicate or reserved address"
+fi
+
+echo -e "\n[6/6] Deleting the VPC with its instances..."
+sudo uv run vpcctl delete-vpc --name vpc1 --cascade
+if ! ip netns list | grep -q "vpc1-public1"; then
+    echo -e "${GREEN}✓${NC} Subnet and instance namespaces are gone"
+else
+    echo -e "${RED}✗${NC} Instance namespaces were left behind"
+fi
+
+echo -e "\n========================================="
+echo "Instances test completed!"
+echo "========================================="
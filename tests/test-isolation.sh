@@ -22,18 +22,18 @@ sudo uv run vpcctl create-vpc --name vpc2 --cidr 10.2.0.0/16
 echo -e "\n[4/6] Creating subnet 'subnet2' in vpc2 with CIDR 10.2.1.0/24..."
 sudo uv run vpcctl create-subnet --vpc vpc2 --name subnet2 --cidr 10.2.1.0/24 --type public
 
-echo -e "\n[5/6] Testing isolation: vpc1 should NOT reach vpc2..."
-if sudo uv run vpcctl exec --vpc vpc1 --subnet subnet1 ping -c 2 -W 2 10.2.1.2 > /dev/null 2>&1; then
-    echo -e "${RED}✗${NC} VPCs are NOT isolated (vpc1 can reach vpc2)"
-else
+echo -e "\n[5/6] Testing isolation: vpc1 and vpc2 should NOT reach each other..."
+if sudo uv run vpcctl probe --vpc vpc1 --vpc vpc2; then
     echo -e "${GREEN}✓${NC} VPCs are properly isolated"
+else
+    echo -e "${RED}✗${NC} VPCs are NOT isolated (see mismatches above)"
 fi
 
-echo -e "\n[6/6] Testing isolation: vpc2 should NOT reach vpc1..."
-if sudo uv run vpcctl exec --vpc vpc2 --subnet subnet2 ping -c 2 -W 2 10.1.1.2 > /dev/null 2>&1; then
-    echo -e "${RED}✗${NC} VPCs are NOT isolated (vpc2 can reach vpc1)"
+echo -e "\n[6/6] Testing isolation on application ports..."
+if sudo uv run vpcctl probe --vpc vpc1 --vpc vpc2 --probe tcp:80 --probe udp:53; then
+    echo -e "${GREEN}✓${NC} VPCs are isolated on tcp/80 and udp/53"
 else
-    echo -e "${GREEN}✓${NC} VPCs are properly isolated"
+    echo -e "${RED}✗${NC} VPCs are NOT isolated on tcp/80 or udp/53"
 fi
 
 echo -e "\n========================================="
@@ -0,0 +1,45 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+echo "========================================="
+echo "Perf Profile Test"
+echo "========================================="
+
+echo -e "\n[1/4] Creating VPC 'vpc1' with the throughput profile..."
+sudo uv run vpcctl create-vpc --name vpc1 --cidr 10.0.0.0/16 --perf-profile throughput
+sudo uv run vpcctl create-subnet --vpc vpc1 --name public1 --cidr 10.0.1.0/24 --type public
+
+echo -e "\n[2/4] Checking jumbo frames along the bridge/veth/namespace path..."
+if [ "$(cat /sys/class/net/br-vpc1/mtu)" = "9000" ] && \
+   sudo ip netns exec vpc1-public1 ip -o link show | grep -q "mtu 9000"; then
+    echo -e "${GREEN}✓${NC} Bridge and subnet veths use MTU 9000"
+else
+    echo -e "${RED}✗${NC} MTU 9000 was not applied consistently"
+fi
+
+echo -e "\n[3/4] Switching the subnet to low-latency in place..."
+sudo uv run vpcctl set-perf-profile --vpc vpc1 --subnet public1 --perf-profile low-latency
+if sudo ip netns exec vpc1-public1 ip -o link show | grep -q "qlen 256"; then
+    echo -e "${GREEN}✓${NC} Subnet veth was retuned without being recreated"
+else
+    echo -e "${RED}✗${NC} Subnet veth queue length was not changed"
+fi
+
+echo -e "\n[4/4] Resetting the VPC to the default profile..."
+sudo uv run vpcctl set-perf-profile --vpc vpc1 --perf-profile default
+if [ "$(cat /sys/class/net/br-vpc1/mtu)" = "1500" ]; then
+    echo -e "${GREEN}✓${NC} Bridge is back to MTU 1500"
+else
+    echo -e "${RED}✗${NC} Bridge MTU was not reset"
+fi
+
+sudo uv run vpcctl delete-vpc --name vpc1 --cascade
+
+echo -e "\n========================================="
+echo "Perf profile test completed!"
+echo "========================================="
@@ -0,0 +1,45 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+echo "========================================="
+echo "Data-Plane Performance Test"
+echo "========================================="
+
+echo -e "\n[1/4] Creating two peered VPCs..."
+sudo uv run vpcctl create-vpc --name vpc1 --cidr 10.1.0.0/16
+sudo uv run vpcctl create-subnet --vpc vpc1 --name public1 --cidr 10.1.1.0/24 --type public
+sudo uv run vpcctl create-subnet --vpc vpc1 --name private1 --cidr 10.1.2.0/24 --type private
+sudo uv run vpcctl create-vpc --name vpc2 --cidr 10.2.0.0/16
+sudo uv run vpcctl create-subnet --vpc vpc2 --name public2 --cidr 10.2.1.0/24 --type public
+sudo uv run vpcctl create-peering --vpc1 vpc1 --vpc2 vpc2
+
+echo -e "\n[2/4] Measuring the intra-VPC path..."
+sudo uv run vpcctl perf --from vpc1/public1 --to vpc1/private1 --duration 2
+
+echo -e "\n[3/4] Measuring the peered path as JSON..."
+if sudo uv run vpcctl perf --from vpc1/public1 --to vpc2/public2 --duration 2 --json | \
+   python3 -c 'import json, sys; r = json.load(sys.stdin); assert r["throughput"]["bytes_received"] > 0'; then
+    echo -e "${GREEN}✓${NC} Peered path carried traffic and produced a JSON report"
+else
+    echo -e "${RED}✗${NC} Peered path perf test failed"
+fi
+
+echo -e "\n[4/4] Rejecting an unknown endpoint..."
+if ! sudo uv run vpcctl perf --from vpc1/public1 --to vpc1/missing 2>/dev/null; then
+    echo -e "${GREEN}✓${NC} Unknown subnet was rejected"
+else
+    echo -e "${RED}✗${NC} Unknown subnet was accepted"
+fi
+
+sudo uv run vpcctl delete-peering --vpc1 vpc1 --vpc2 vpc2
+sudo uv run vpcctl delete-vpc --name vpc1 --cascade
+sudo uv run vpcctl delete-vpc --name vpc2 --cascade
+
+echo -e "\n========================================="
+echo "Perf test completed!"
+echo "========================================="
@@ -0,0 +1,58 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+echo "========================================="
+echo "Policy Compiler Test"
+echo "========================================="
+
+echo -e "\n[1/6] Creating VPC 'vpc1' with a public and a private subnet..."
+sudo uv run vpcctl create-vpc --name vpc1 --cidr 10.0.0.0/16
+sudo uv run vpcctl create-subnet --vpc vpc1 --name public1 --cidr 10.0.1.0/24 --type public
+sudo uv run vpcctl create-subnet --vpc vpc1 --name private1 --cidr 10.0.2.0/24 --type private
+
+echo -e "\n[2/6] Starting HTTP server on port 8080 in private subnet..."
+sudo uv run vpcctl exec --vpc vpc1 --subnet private1 python3 -m http.server 8080 > /dev/null 2>&1 &
+HTTP_PID=$!
+sleep 2
+
+echo -e "\n[3/6] Applying policies/advanced-policy.json..."
+sudo uv run vpcctl apply-policy --vpc vpc1 --subnet private1 --file policies/advanced-policy.json 2>&1 | tee /tmp/compile.log
+if grep -q "Compiled 16 policy rule(s) into 5 using 1 ipset(s)" /tmp/compile.log; then
+    echo -e "${GREEN}✓${NC} Ports were coalesced and the SSH sources moved into an ipset"
+else
+    echo -e "${RED}✗${NC} Unexpected compiler output"
+fi
+
+echo -e "\n[4/6] Testing HTTP from the allowed source subnet..."
+if sudo uv run vpcctl exec --vpc vpc1 --subnet public1 curl -s -m 2 http://10.0.2.2:8080 > /dev/null 2>&1; then
+    echo -e "${GREEN}✓${NC} Port 8080 is reachable from 10.0.1.0/24"
+else
+    echo -e "${RED}✗${NC} Port 8080 is blocked for an allowed source"
+fi
+
+echo -e "\n[5/6] Checking the rule set inside the namespace..."
+if sudo ip netns exec vpc1-private1 iptables -S VPCCTL-IN | grep -q "multiport"; then
+    echo -e "${GREEN}✓${NC} VPCCTL-IN uses multiport matches"
+else
+    echo -e "${RED}✗${NC} VPCCTL-IN has no multiport rule"
+fi
+
+echo -e "\n[6/6] Re-applying the same policy..."
+if sudo uv run vpcctl apply-policy --vpc vpc1 --subnet private1 --file policies/advanced-policy.json 2>&1 | grep -q "nothing to do"; then
+    echo -e "${GREEN}✓${NC} Re-applying an installed policy is a no-op"
+else
+    echo -e "${RED}✗${NC} Re-applying the policy rebuilt the rules"
+fi
+
+sudo kill $HTTP_PID 2>/dev/null || true
+rm -f /tmp/compile.log
+sudo uv run vpcctl delete-vpc --name vpc1 --cascade
+
+echo -e "\n========================================="
+echo "Policy compiler test completed!"
+echo "========================================="
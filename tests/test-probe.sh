@@ -0,0 +1,50 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+echo "========================================="
+echo "Reachability Matrix Test"
+echo "========================================="
+
+echo -e "\n[1/4] Creating two VPCs with two subnets each..."
+sudo uv run vpcctl create-vpc --name vpc1 --cidr 10.1.0.0/16
+sudo uv run vpcctl create-subnet --vpc vpc1 --name public1 --cidr 10.1.1.0/24 --type public
+sudo uv run vpcctl create-subnet --vpc vpc1 --name private1 --cidr 10.1.2.0/24 --type private
+sudo uv run vpcctl create-vpc --name vpc2 --cidr 10.2.0.0/16
+sudo uv run vpcctl create-subnet --vpc vpc2 --name public2 --cidr 10.2.1.0/24 --type public
+sudo uv run vpcctl create-subnet --vpc vpc2 --name private2 --cidr 10.2.2.0/24 --type private
+
+echo -e "\n[2/4] Probing the unpeered matrix..."
+if sudo uv run vpcctl probe; then
+    echo -e "${GREEN}✓${NC} Subnets reach their own VPC only"
+else
+    echo -e "${RED}✗${NC} Reachability differs from the expected matrix"
+fi
+
+echo -e "\n[3/4] Peering the VPCs and probing again..."
+sudo uv run vpcctl create-peering --vpc1 vpc1 --vpc2 vpc2
+if sudo uv run vpcctl probe --probe icmp --probe tcp:80; then
+    echo -e "${GREEN}✓${NC} Peered subnets reach each other"
+else
+    echo -e "${RED}✗${NC} Reachability differs from the expected matrix"
+fi
+
+echo -e "\n[4/4] Applying a policy and probing its ports..."
+sudo uv run vpcctl apply-policy --vpc vpc1 --subnet public1 --file policies/example-policy.json
+if sudo uv run vpcctl probe --probe tcp:80 --probe tcp:22 --probe udp:53; then
+    echo -e "${GREEN}✓${NC} Policy allows tcp/80 and blocks tcp/22 and udp/53 into public1"
+else
+    echo -e "${RED}✗${NC} Policy enforcement differs from the expected matrix"
+fi
+
+sudo uv run vpcctl delete-peering --vpc1 vpc1 --vpc2 vpc2
+sudo uv run vpcctl delete-vpc --name vpc1 --cascade
+sudo uv run vpcctl delete-vpc --name vpc2 --cascade
+
+echo -e "\n========================================="
+echo "Probe test completed!"
+echo "========================================="
@@ -0,0 +1,47 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+echo "========================================="
+echo "Counter Collection Test"
+echo "========================================="
+
+echo -e "\n[1/4] Creating VPC 'vpc1' with a firewalled subnet and an instance..."
+sudo uv run vpcctl create-vpc --name vpc1 --cidr 10.0.0.0/16
+sudo uv run vpcctl create-subnet --vpc vpc1 --name public1 --cidr 10.0.1.0/24 --type public
+sudo uv run vpcctl add-instance --vpc vpc1 --subnet public1 --name web1
+sudo uv run vpcctl apply-policy --vpc vpc1 --subnet public1 --file policies/example-policy.json
+
+echo -e "\n[2/4] Collecting a Prometheus snapshot..."
+sudo uv run vpcctl stats --output /tmp/vpcctl-stats.prom
+if grep -q 'vpcctl_interface_rx_bytes_total{interface="br-vpc1"' /tmp/vpcctl-stats.prom && \
+   grep -q 'vpcctl_rule_packets_total{namespace="vpc1-public1"' /tmp/vpcctl-stats.prom; then
+    echo -e "${GREEN}✓${NC} Interface and rule counters were exported"
+else
+    echo -e "${RED}✗${NC} Snapshot is missing interface or rule counters"
+fi
+
+echo -e "\n[3/4] Collecting an NDJSON snapshot..."
+if sudo uv run vpcctl stats --format ndjson | python3 -c 'import json, sys; [json.loads(line) for line in sys.stdin]'; then
+    echo -e "${GREEN}✓${NC} Every NDJSON line is valid JSON"
+else
+    echo -e "${RED}✗${NC} NDJSON output could not be parsed"
+fi
+
+echo -e "\n[4/4] Watching counter rates..."
+if timeout 3 sudo uv run vpcctl stats --watch 1 | grep -q "_per_second"; then
+    echo -e "${GREEN}✓${NC} Watch mode reported per-second rates"
+else
+    echo -e "${RED}✗${NC} Watch mode did not report rates"
+fi
+
+sudo uv run vpcctl delete-vpc --name vpc1 --cascade
+rm -f /tmp/vpcctl-stats.prom
+
+echo -e "\n========================================="
+echo "Stats test completed!"
+echo "========================================="
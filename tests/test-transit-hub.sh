@@ -0,0 +1,55 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+echo "========================================="
+echo "Transit Hub Test"
+echo "========================================="
+
+echo -e "\n[1/5] Creating three VPCs with long, shared-prefix names..."
+for i in 1 2 3; do
+    sudo uv run vpcctl create-vpc --name production-east-$i --cidr 10.$i.0.0/16
+    sudo uv run vpcctl create-subnet --vpc production-east-$i --name application-tier --cidr 10.$i.1.0/24 --type private
+done
+
+echo -e "\n[2/5] Creating a hub and attaching every VPC..."
+sudo uv run vpcctl create-transit-hub --name core --cidr 10.0.0.0/8
+for i in 1 2 3; do
+    sudo uv run vpcctl attach-to-hub --hub core --vpc production-east-$i
+done
+sudo uv run vpcctl list-hubs
+
+echo -e "\n[3/5] Probing the hub matrix..."
+if sudo uv run vpcctl probe; then
+    echo -e "${GREEN}✓${NC} Every attached VPC reaches the others through the hub"
+else
+    echo -e "${RED}✗${NC} Reachability differs from the expected matrix"
+fi
+
+echo -e "\n[4/5] Detaching one VPC..."
+sudo uv run vpcctl detach-from-hub --hub core --vpc production-east-3
+if sudo uv run vpcctl probe; then
+    echo -e "${GREEN}✓${NC} Detached VPC is isolated again"
+else
+    echo -e "${RED}✗${NC} Reachability differs from the expected matrix"
+fi
+
+echo -e "\n[5/5] Deleting the hub..."
+if sudo uv run vpcctl delete-transit-hub --name core 2>/dev/null; then
+    echo -e "${RED}✗${NC} Hub with attached VPCs was deleted"
+else
+    echo -e "${GREEN}✓${NC} Hub with attached VPCs is refused without --force"
+fi
+sudo uv run vpcctl delete-transit-hub --name core --force
+
+for i in 1 2 3; do
+    sudo uv run vpcctl delete-vpc --name production-east-$i --cascade
+done
+
+echo -e "\n========================================="
+echo "Transit hub test completed!"
+echo "========================================="
@@ -0,0 +1,44 @@
+#!/bin/bash
+
+set -e
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+echo "========================================="
+echo "CIDR Overlap and Whois Test"
+echo "========================================="
+
+echo -e "\n[1/4] Creating VPC 'vpc1' with a public subnet..."
+sudo uv run vpcctl create-vpc --name vpc1 --cidr 10.0.0.0/16
+sudo uv run vpcctl create-subnet --vpc vpc1 --name public1 --cidr 10.0.1.0/24 --type public
+
+echo -e "\n[2/4] Rejecting an overlapping VPC..."
+if ! sudo uv run vpcctl create-vpc --name vpc2 --cidr 10.0.128.0/17 2>/dev/null; then
+    echo -e "${GREEN}✓${NC} Overlapping VPC CIDR was rejected"
+else
+    echo -e "${RED}✗${NC} Overlapping VPC CIDR was accepted"
+    sudo uv run vpcctl delete-vpc --name vpc2
+fi
+
+echo -e "\n[3/4] Rejecting an overlapping subnet..."
+if ! sudo uv run vpcctl create-subnet --vpc vpc1 --name public2 --cidr 10.0.1.128/25 --type public 2>/dev/null; then
+    echo -e "${GREEN}✓${NC} Overlapping subnet CIDR was rejected"
+else
+    echo -e "${RED}✗${NC} Overlapping subnet CIDR was accepted"
+    sudo uv run vpcctl delete-subnet --vpc vpc1 --name public2
+fi
+
+echo -e "\n[4/4] Looking up the subnet's address..."
+if sudo uv run vpcctl whois 10.0.1.2 | grep -q "vpc1-public1"; then
+    echo -e "${GREEN}✓${NC} whois mapped 10.0.1.2 to namespace vpc1-public1"
+else
+    echo -e "${RED}✗${NC} whois did not find the owner of 10.0.1.2"
+fi
+
+sudo uv run vpcctl delete-vpc --name vpc1 --cascade
+
+echo -e "\n========================================="
+echo "Whois test completed!"
+echo "========================================="